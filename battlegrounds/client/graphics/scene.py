@@ -16,7 +16,7 @@ class Scene(object):
 
     def draw(self):
         aabb = Circle(self._world.main_actor.position, 150).bbox()
-        for prop in self._world.props.query_shape(aabb):
+        for prop in self._world.props.query(aabb):
             self.draw_shape(prop.shape, prop.position)
         for actor in self._world.actors:
             self.draw_shape(actor.shape, actor.position)
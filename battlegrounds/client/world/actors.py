@@ -80,26 +80,32 @@ class Character(Actor):
         """ Perform movement by described vector, but check for collision with
             other objects.
         """
+        if move.length() > self.shape.radius:
+            # Fast movement can skip over thin props. Stop at the first hit
+            t = self._world.query_props_time_of_impact(
+                self._position, self.shape, move)
+            if t is not None:
+                move = move * t
         new_position = self._position + move
         # Check if move is legal
         manifolds = self._world.query_props_intersection(
-            new_position, self.shape)
-        # Invalid move
-        li = len(manifolds)
-        if li == 1:
-            # We can resolve contact for 1 object
-            new_move = self._resolve_movement(
-                manifolds[0], move)
+            new_position, self.shape, actor=self)
+        if manifolds:
+            new_move = self._resolve_movement(manifolds, move)
             new_position = self._position + new_move
-        elif li > 1:
-            # For 2 and more collisions we can't perform movement
-            new_position = self._position
         self._position = new_position
 
-        # Moving circle problem. Tunneling?
         # BVH/BSP interface for queries. Implement 2 at least
-        # Movement should be locked and only after resolved
 
-    def _resolve_movement(self, manifold, move):
-        correction = manifold.normal * manifold.depth
+    def _resolve_movement(self, manifolds, move):
+        """ Push the character out of all contacts. Each manifold only gets
+            the part of its correction, that previous ones did not cover yet,
+            so 2 props sharing a wall don't push twice as far.
+        """
+        correction = Vector(0, 0)
+        # Deepest first, shallow contacts are often resolved by it too
+        for manifold in sorted(manifolds, key=lambda m: -m.depth):
+            remaining = manifold.depth - correction.dot(manifold.normal)
+            if remaining > 0:
+                correction += manifold.normal * remaining
         return move + correction
@@ -1,3 +1,6 @@
 CHARACTER_RADIUS = 10
 CHARACTER_SPEED = 50
 CHARACTER_ROTATION = 1
+# Actor bounds in the broad phase are this much bigger than the shape, so
+# they are not updated on every step
+ACTOR_AABB_MARGIN = 5
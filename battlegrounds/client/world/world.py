@@ -1,20 +1,48 @@
+from engine.contact import ContactCache
 from engine.geometry import Vector
+from engine.geometry.shapes.sweeps import time_of_impact
 from engine.broad import DynamicAABB
+from engine.broad.composite import CompositeBroadPhase
 
 from .abc import ABCWorld
 from .actors import Character
+from .constants import ACTOR_AABB_MARGIN
 from .loader import load_props
 
 
+def build_prop_tree(world_map, prop_broad_phase=DynamicAABB):
+    """ Static broad phase with all props of the map. Props don't refer to
+        the world, so the result can be passed to any number of `World`'s
+        using this map.
+    """
+    return prop_broad_phase.from_items(
+        (prop, prop.shape.bbox().translate(prop.position))
+        for prop in load_props(None, world_map))
+
+
 class World(ABCWorld):
 
-    def __init__(self, world_map):
-        self._props = DynamicAABB()
-        for prop in load_props(self, world_map):
-            aabb = prop.shape.bbox().translate(prop.position)
-            self._props.add(prop, aabb)
-        self._actors = [
-            Character(self, position=Vector(0, 0))]
+    def __init__(self, world_map, prop_broad_phase=DynamicAABB,
+                 prop_tree=None):
+        """ `prop_broad_phase` is the class used to index props, any with a
+            `from_items` constructor and `shape_cast`, like `DynamicAABB` or
+            `SpatialHashGrid`. Actors always go to a `DynamicAABB`, as they
+            move every tick. Pass `prop_tree` from `build_prop_tree` to
+            reuse props between matches on the same map.
+        """
+        if prop_tree is None:
+            prop_tree = build_prop_tree(world_map, prop_broad_phase)
+        self._broad_phase = CompositeBroadPhase(
+            static=prop_tree,
+            dynamic=DynamicAABB(margin=ACTOR_AABB_MARGIN))
+        self._actors = []
+        # Broad phase node of each actor
+        self._actor_nodes = {}
+        self.add_actor(Character(self, position=Vector(0, 0)))
+        # Actor vs prop contacts, that persist between ticks
+        self._contacts = ContactCache()
+        # Reused for broad phase results to not allocate a list per query
+        self._found_props = []
         self._tick_period = 0.03125  # ~30 fps simulation
         self._timer = 0
         self._reminder = 0
@@ -25,24 +53,95 @@ class World(ABCWorld):
         self._reminder = dt % period
         for _ in range(int(dt // period)):
             for actor in self._actors:
+                old_position = actor.position
                 actor.tick(period)
+                self._broad_phase.move(
+                    self._actor_nodes[actor], self._actor_aabb(actor),
+                    actor.position - old_position)
+            self._contacts.step()
             self._timer += period
 
-    def query_props_intersection(self, position, shape):
+    def _actor_aabb(self, actor):
+        return actor.shape.bbox().translate(actor.position)
+
+    def add_actor(self, actor):
+        self._actors.append(actor)
+        self._actor_nodes[actor] = self._broad_phase.add(
+            actor, self._actor_aabb(actor))
+
+    def remove_actor(self, actor):
+        self._actors.remove(actor)
+        self._broad_phase.remove(self._actor_nodes.pop(actor))
+
+    def query_actors(self, shape):
+        """ Actors, which bounds overlap the bbox of `shape` """
+        return self._broad_phase.query(shape, static=False)
+
+    def query_props_intersection(self, position, shape, actor=None):
+        """ Manifolds of `shape` placed at `position` against all props it
+            overlaps, in world coordinates. If `actor` is passed, contacts
+            are cached per (prop, actor) pair between ticks.
+        """
         intersections = []
         # Translate shape to world coordinates
         tshape = shape.translate(position)
-        for prop in self._props.query_shape(tshape.bbox()):
+        found = self._found_props
+        del found[:]
+        self._broad_phase.query(tshape.bbox(), out=found, dynamic=False)
+        for prop in found:
             # Translate query shape to prop coordinates
-            tshape = shape.translate(position - prop.position)
-            intersection = tshape.intersects(prop.shape)
+            local = position - prop.position
+            if actor is None:
+                intersection = shape.translate(local).intersects(prop.shape)
+            else:
+                intersection = self._contacts.collide(
+                    (prop, actor), shape, local, prop.shape)
             if intersection is not None:
-                intersections.append(intersection)
+                intersections.append(intersection.translate(prop.position))
         return intersections
 
+    def query_props_time_of_impact(self, position, shape, move):
+        """ Earliest fraction of `move` at which `shape` placed at `position`
+            hits a prop, or None. Use it for movements long enough to tunnel
+            through thin props.
+        """
+        res = {"t": None}
+
+        def cast_callback(prop, tshape, move, max_fraction):
+            # Translate cast shape to prop coordinates
+            local = shape.translate(position - prop.position)
+            t = time_of_impact(local, move, prop.shape)
+            if t is None or t >= max_fraction:
+                return None
+            res["t"] = t
+            return t
+
+        self._broad_phase.shape_cast(
+            shape.translate(position), move, callback=cast_callback,
+            dynamic=False)
+        return res["t"]
+
+    def closest_props(self, position, k=None, max_distance=None):
+        """ Iterator of props nearest to `position` first, by the distance
+            to their shapes.
+        """
+        def prop_distance(prop, point):
+            return prop.shape.distance(point - prop.position)
+        return self._broad_phase.closest(
+            position, k=k, max_distance=max_distance, distance=prop_distance,
+            dynamic=False)
+
+    @property
+    def contacts(self):
+        return self._contacts
+
     @property
     def props(self):
-        return self._props
+        return self._broad_phase.static
+
+    @property
+    def broad_phase(self):
+        return self._broad_phase
 
     @property
     def actors(self):
@@ -1,9 +1,11 @@
 import math
+import random
 import sys
 import unittest
 
-from engine.geometry import Vector
+from engine.geometry import AABB, Circle, Vector
 from engine.geometry.shapes.shape import BaseShape
+from engine.geometry.shapes.sweeps import time_of_impact
 from engine.geometry.line import Segment
 
 # We just don't want to import pyglet if it's not needed. It will do dumb stuff
@@ -149,20 +151,23 @@ def create_drawer():
             return [bg1, bg2], [fg1, fg2, line]
 
         def draw_dynamicaabb(self, dynamic_aabb):
-            nodes = [dynamic_aabb._root]
+            nodes = [dynamic_aabb._root] if len(dynamic_aabb) else []
             foreground, background = [], []
             while nodes:
                 siblings = []
                 for node in nodes:
-                    bg, fg = self.draw_shape_aabb(node.aabb)
+                    bg, fg = self.draw_shape_aabb(
+                        dynamic_aabb._get_aabb(node))
                     foreground.append(fg)
-                    if node.leaf:
-                        bg, fg = self.draw_shape(node.obj.shape)
+                    left = dynamic_aabb._left[node]
+                    if left == -1:
+                        obj = dynamic_aabb.get_object(node)
+                        bg, fg = self.draw_shape(obj.shape)
                         foreground.append(fg)
                         background.append(bg)
                     else:
-                        siblings.append(node.left)
-                        siblings.append(node.right)
+                        siblings.append(left)
+                        siblings.append(dynamic_aabb._right[node])
                 nodes = siblings
             return background, foreground
 
@@ -246,3 +251,45 @@ def debug_draw(*p, width=20):
 class ShapeTestCase(unittest.TestCase):
 
     debug_draw = debug_draw
+
+
+class StabObj:
+
+    def __init__(self, shape, position=Vector(0, 0)):
+        self.shape = shape
+        self.position = position
+
+    def __str__(self):
+        return "StabObj({!r})".format(self.shape)
+
+
+def toi_callback(obj, shape, translation, max_fraction):
+    # Callback to get the first hit of the shape cast
+    t = time_of_impact(shape, translation, obj.shape)
+    if t is not None and t < max_fraction:
+        return t
+    return None
+
+
+def check_shape_cast(test, broad_phase, objects, seed=0):
+    """ Compare first hits of `shape_cast` with a brute force search over
+        `objects`, that are spread in (-60, 60) square.
+    """
+    rnd = random.Random(seed)
+    for i in range(40):
+        center = Vector(rnd.uniform(-60, 60), rnd.uniform(-60, 60))
+        if i % 2:
+            shape = Circle(center, rnd.uniform(0.5, 3))
+        else:
+            shape = AABB(center - Vector(1, 2), center + Vector(2, 1))
+        translation = Vector(rnd.uniform(-30, 30), rnd.uniform(-30, 30))
+        hits = [time_of_impact(shape, translation, obj.shape)
+                for obj in objects]
+        hits = [t for t in hits if t is not None]
+        res = broad_phase.shape_cast(
+            shape, translation, callback=toi_callback)
+        if not hits:
+            test.assertIsNone(res)
+        else:
+            test.assertAlmostEqual(
+                time_of_impact(shape, translation, res.shape), min(hits))
@@ -1,5 +1,9 @@
-from .dynamic_aabb import DynamicAABB
+from .dynamic_aabb import DynamicAABB, DynamicAABBSnapshot
+from .loose_quadtree import LooseQuadtree
+from .spatial_hash import SpatialHashGrid
+from .sweep_and_prune import SweepAndPrune
 
 __all__ = [
-    "DynamicAABB"
+    "DynamicAABB", "DynamicAABBSnapshot", "LooseQuadtree", "SpatialHashGrid",
+    "SweepAndPrune",
 ]
@@ -1,5 +1,12 @@
 from abc import ABCMeta, abstractmethod
 
+from .stats import BroadPhaseStats, instrument, uninstrument
+
+# Events of `update_pairs`
+PAIR_BEGIN = "begin"
+PAIR_PERSIST = "persist"
+PAIR_END = "end"
+
 
 class ABCBroadPhase(object):
     __metaclass__ = ABCMeta
@@ -13,6 +20,34 @@ class ABCBroadPhase(object):
     - ray casts
     '''
 
+    # Opt-in stats, see `stats.py`. Traversals add the number of nodes and
+    # leaves they check to the counters below
+    _stats = None
+    _instrumented = ()
+    _nodes_visited = 0
+    _leaves_tested = 0
+
+    @property
+    def stats(self):
+        """ `BroadPhaseStats` or None if disabled """
+        return self._stats
+
+    def enable_stats(self):
+        if self._stats is None:
+            self._stats = BroadPhaseStats(self)
+            self._instrumented = instrument(self, self._stats)
+        return self._stats
+
+    def disable_stats(self):
+        if self._stats is not None:
+            uninstrument(self, self._instrumented)
+            self._stats = None
+            self._instrumented = ()
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats.reset()
+
     @abstractmethod
     def get_height(self):
         """ Returns tree height. Useful for debugging issues
@@ -33,6 +68,14 @@ class ABCBroadPhase(object):
         """
         raise NotImplementedError()
 
+    @abstractmethod
+    def move(self, node_id, aabb, displacement=None):
+        """ Update the bounds of a previously added object. Returns True if
+            the structure was changed, False if the old bounds still cover
+            the new ones.
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def query(self, shape):
         """ Return objects, that MAY intersect this shape.
@@ -44,14 +87,22 @@ class ABCBroadPhase(object):
         """ Return an object, that was first hit by this ray """
         raise NotImplementedError()
 
+    @abstractmethod
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0):
+        """ Return an object, that was first hit by `shape` moving by
+            `translation`
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def query_point(self, point):
-        """ Return objects, that contain this point
+        """ Return objects, that MAY contain this point
         """
         raise NotImplementedError()
 
     @abstractmethod
-    def closest(self, point):
-        """ Return an iterator of objects closest to this point
+    def closest(self, point, k=None, max_distance=None):
+        """ Return an iterator of objects closest to this point, nearest
+            first. Stops after `k` objects or at `max_distance`.
         """
         raise NotImplementedError()
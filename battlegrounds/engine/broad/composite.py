@@ -0,0 +1,229 @@
+"""
+    Broad phase made of 2 parts with different update policies:
+
+        * static - objects, that never move, like props of a map. Built once
+          (best with `DynamicAABB.from_items`) and never refit, so it keeps
+          the quality of the bulk build. It does not depend on anything
+          else, so a single static tree can be shared by worlds, that use
+          the same map.
+        * dynamic - actors and other moving objects. Leaves have fat AABB's,
+          so small movements don't touch the tree.
+
+    Queries span both parts, unless asked for one of them only, so queries
+    for props never pay for the churn of actors. With stats enabled each
+    part counts its own `BroadPhaseStats`.
+"""
+import heapq
+
+from .abc import ABCBroadPhase
+from .dynamic_aabb import DynamicAABB
+
+DEFAULT_DYNAMIC_MARGIN = 1.0
+
+
+class CompositeBroadPhase(ABCBroadPhase):
+    """ `add`, `remove` and `move` work on the dynamic part. Static objects
+        are passed in with the static part or added with `add_static`.
+        `closest` over both parts merges their `closest_items`.
+    """
+
+    def __init__(self, static=None, dynamic=None):
+        if static is None:
+            static = DynamicAABB()
+        if dynamic is None:
+            dynamic = DynamicAABB(margin=DEFAULT_DYNAMIC_MARGIN)
+        self._static = static
+        self._dynamic = dynamic
+
+    @property
+    def static(self):
+        return self._static
+
+    @property
+    def dynamic(self):
+        return self._dynamic
+
+    # Stats are collected by the parts
+
+    @property
+    def stats(self):
+        """ Dict with `BroadPhaseStats` of both parts or None if disabled """
+        if self._static.stats is None and self._dynamic.stats is None:
+            return None
+        return {"static": self._static.stats,
+                "dynamic": self._dynamic.stats}
+
+    def enable_stats(self):
+        self._static.enable_stats()
+        self._dynamic.enable_stats()
+        return self.stats
+
+    def disable_stats(self):
+        self._static.disable_stats()
+        self._dynamic.disable_stats()
+
+    def reset_stats(self):
+        self._static.reset_stats()
+        self._dynamic.reset_stats()
+
+    def stats_snapshot(self):
+        """ `BroadPhaseStats.snapshot` of both parts """
+        stats = self.stats
+        if stats is None:
+            return None
+        return {name: part_stats.snapshot() if part_stats else None
+                for name, part_stats in stats.items()}
+
+    def snapshot(self):
+        """ Composite of snapshots of both parts (see
+            `DynamicAABB.snapshot`) for readers in other threads. Only
+            queries can be used on it. Both parts need `snapshot`: other
+            broad phases can be changed with `add_static` and count their
+            traversals on queries, so they can't be shared with readers.
+        """
+        parts = []
+        for part in (self._static, self._dynamic):
+            if not hasattr(part, "snapshot"):
+                raise NotImplementedError(
+                    "{} does not support snapshots".format(
+                        type(part).__name__))
+            parts.append(part.snapshot())
+        static, dynamic = parts
+        return CompositeBroadPhase(static=static, dynamic=dynamic)
+
+    def __len__(self):
+        return len(self._static) + len(self._dynamic)
+
+    def get_height(self):
+        return max(self._static.get_height(), self._dynamic.get_height())
+
+    def _parts(self, static, dynamic):
+        parts = []
+        if static:
+            parts.append(self._static)
+        if dynamic:
+            parts.append(self._dynamic)
+        return parts
+
+    # Static part
+
+    def add_static(self, obj, aabb):
+        return self._static.add(obj, aabb)
+
+    def remove_static(self, node_id):
+        self._static.remove(node_id)
+
+    # Dynamic part
+
+    def add(self, obj, aabb):
+        return self._dynamic.add(obj, aabb)
+
+    def remove(self, node_id):
+        self._dynamic.remove(node_id)
+
+    def move(self, node_id, aabb, displacement=None):
+        return self._dynamic.move(node_id, aabb, displacement)
+
+    # Queries
+
+    def query(self, shape, callback=None, out=None, *, static=True,
+              dynamic=True):
+        """ Objects from both parts (or only the chosen one), whose AABB
+            overlaps the bbox of `shape`. Same `callback` and `out`
+            semantics as `DynamicAABB.query`.
+        """
+        if callback is None and out is None:
+            out = []
+        for part in self._parts(static, dynamic):
+            if callback is None:
+                part.query(shape, out=out)
+            elif part.query(shape, callback=callback) is False:
+                return False
+        return True if callback is not None else out
+
+    def query_point(self, point, callback=None, out=None, *, static=True,
+                    dynamic=True):
+        if callback is None and out is None:
+            out = []
+        for part in self._parts(static, dynamic):
+            if callback is None:
+                part.query_point(point, out=out)
+            elif part.query_point(point, callback=callback) is False:
+                return False
+        return True if callback is not None else out
+
+    def raycast(self, point, direction, *, callback, max_distance=None,
+                static=True, dynamic=True):
+        """ Same callback protocol as `DynamicAABB.raycast`. Parts are cast
+            one after another, with the ray clipped by hits in the previous
+            one.
+        """
+        state = {"max_distance": max_distance, "stopped": False}
+
+        def clipping_callback(obj, point, direction, max_distance):
+            value = callback(obj, point, direction, max_distance)
+            if value == 0:
+                state["stopped"] = True
+            elif value is not None and value > 0:
+                state["max_distance"] = value
+            return value
+
+        result = None
+        for part in self._parts(static, dynamic):
+            found = part.raycast(
+                point, direction, callback=clipping_callback,
+                max_distance=state["max_distance"])
+            if found is not None:
+                result = found
+            if state["stopped"]:
+                break
+        return result
+
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0,
+                   static=True, dynamic=True):
+        """ Same callback protocol as `DynamicAABB.shape_cast`. Parts are
+            swept one after another, like in `raycast`.
+        """
+        state = {"max_fraction": max_fraction, "stopped": False}
+
+        def clipping_callback(obj, shape, translation, max_fraction):
+            value = callback(obj, shape, translation, max_fraction)
+            if value == 0:
+                state["stopped"] = True
+            elif value is not None and value > 0:
+                state["max_fraction"] = value
+            return value
+
+        result = None
+        for part in self._parts(static, dynamic):
+            found = part.shape_cast(
+                shape, translation, callback=clipping_callback,
+                max_fraction=state["max_fraction"])
+            if found is not None:
+                result = found
+            if state["stopped"]:
+                break
+        return result
+
+    def closest(self, point, k=None, max_distance=None, distance=None, *,
+                static=True, dynamic=True):
+        """ Objects of both parts nearest first, see
+            `DynamicAABB.closest_items`.
+        """
+        parts = self._parts(static, dynamic)
+        if len(parts) == 1:
+            # Any broad phase can be used on its own
+            part = parts[0]
+            yield from part.closest(
+                point, k=k, max_distance=max_distance, distance=distance)
+            return
+        iterators = [
+            part.closest_items(
+                point, k=k, max_distance=max_distance, distance=distance)
+            for part in parts]
+        found = 0
+        for _, obj in heapq.merge(*iterators, key=lambda item: item[0]):
+            yield obj
+            found += 1
+            if found == k:
+                return
@@ -27,179 +27,245 @@
         }
 
 """
+import functools
+import heapq
 import math
+from array import array
 
-from engine.geometry.shapes.shape import BaseShape
+import numpy as np
+
+from engine.geometry.shapes.shape import BaseShape, as_rays
 from engine.geometry.vector import EPSILON
-from engine.geometry.utils import min_vector, max_vector
-from engine.geometry import AABB, Vector
+from engine.geometry import AABB, AABBArray, Vector
 
-from .abc import ABCBroadPhase
+from .abc import ABCBroadPhase, PAIR_BEGIN, PAIR_PERSIST, PAIR_END
+from .stats import uninstrument
+from .utils import segment_bounds
 
+# Index of a missing node: parent of the root, children of a leaf and the
+# root of an empty tree
+NULL = -1
+# Number of buckets for SAH evaluation in `from_items`
+SAH_BINS = 16
+# Packets of `raycast_many` with less rays are cast one ray at a time
+MIN_PACKET_SIZE = 8
+# Node pool arrays, that queries read. Snapshots share them with the tree
+NODE_ARRAYS = ("_min_x", "_min_y", "_max_x", "_max_y", "_left", "_right",
+               "_parent", "_height", "_objects")
 
-class Node(object):
 
-    leaf = False
+class DynamicAABBReader(object):
+    """ Read-only part of `DynamicAABB`: queries over the node arrays.
+        Shared by the tree and its snapshots (see `DynamicAABB.snapshot`).
+    """
 
-    def __init__(self, *, left, right, parent, aabb):
-        self.left = left
-        self.right = right
-        self.parent = parent
-        self.aabb = aabb
+    # Node and leaf counters of traversals, see `stats`. Traversals add to
+    # them once per call, unless `_counted` is off
+    _counted = True
+    _nodes_visited = 0
+    _leaves_tested = 0
 
-    def __repr__(self):
-        return "Node({})".format(self.aabb)
+    @property
+    def margin(self):
+        return self._margin
 
+    def __len__(self):
+        return self._leaf_count
 
-class LeafNode(object):
+    # Nodes
 
-    leaf = True
-    parent = None
+    def _check_leaf(self, node_id):
+        if not 0 <= node_id < len(self._height) or \
+                self._height[node_id] != 0:
+            raise KeyError(node_id)
 
-    def __init__(self, *, node_id, obj, aabb):
-        self.obj = obj
-        self.aabb = aabb
-        self.node_id = node_id
+    def _get_aabb(self, index):
+        return AABB(Vector(self._min_x[index], self._min_y[index]),
+                    Vector(self._max_x[index], self._max_y[index]))
 
-    def __repr__(self):
-        return "LeafNode({}, {})".format(self.obj, self.aabb)
+    def _area(self, index):
+        return (self._max_x[index] - self._min_x[index]) * \
+            (self._max_y[index] - self._min_y[index])
 
+    def get_fat_aabb(self, node_id):
+        self._check_leaf(node_id)
+        return self._get_aabb(node_id)
 
-class DynamicAABB(ABCBroadPhase):
+    def get_object(self, node_id):
+        self._check_leaf(node_id)
+        return self._objects[node_id]
 
-    def __init__(self):
-        self._root = None
-        self._leaves = {}  # Leaves only
-        self._next_id = 0  # Next leaf ID
+    # Queries
 
-    def add(self, obj, shape_aabb):
-        leaf_node = LeafNode(
-            node_id=self._next_id, obj=obj, aabb=shape_aabb)
-        self._next_id += 1
-        self._leaves[leaf_node.node_id] = leaf_node
-        node = self._root
-        # First insertion case
-        if node is None:
-            self._root = leaf_node
-            return leaf_node.node_id
+    def query(self, shape, callback=None, out=None):
+        """ Objects, whose fat AABB overlaps the bbox of `shape`.
+            Without arguments returns a new list. With `out` appends the
+            objects to it and returns it, so a caller can reuse one list
+            across queries. With `callback` calls `callback(obj)` for each
+            object instead and stops as soon as it returns False; returns
+            False if the query was stopped that way and True otherwise.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
 
-        # Find which node to append to
-        while not node.leaf:
-            insert_to = self._insert_strategy(node, shape_aabb)
-            if insert_to is None:  # Node found
-                break
-            node = insert_to
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        return self._query_bounds(lo.x, lo.y, hi.x, hi.y, callback, out)
 
-        old_parent = node.parent
-        new_parent = Node(
-            left=node, right=leaf_node, parent=old_parent,
-            aabb=node.aabb.union(shape_aabb))
+    # Compatibility alias
+    query_shape = query
 
-        # Link nodes togather
-        node.parent = new_parent
-        leaf_node.parent = new_parent
-        if old_parent is None:
-            self._root = new_parent
-        else:
-            if old_parent.left is node:
-                old_parent.left = new_parent
-            else:
-                old_parent.right = new_parent
+    def query_point(self, point, callback=None, out=None):
+        """ Objects, whose fat AABB contains `point`. Same `callback` and
+            `out` semantics as `query`.
+        """
+        assert isinstance(point, Vector)
+        return self._query_bounds(
+            point.x, point.y, point.x, point.y, callback, out)
 
-            # Traverse up the tree and fix other aabb's
-            current = old_parent
-            while current is not None:
-                new_aabb = current.aabb.union(shape_aabb)
-                if current.aabb == new_aabb:
-                    break
-                current.aabb = new_aabb
-                current = current.parent
-        return leaf_node.node_id
+    def _query_bounds(self, x1, y1, x2, y2, callback, out):
+        if callback is None and out is None:
+            out = []
+        if self._root == NULL:
+            return True if callback is not None else out
 
-    def remove(self, node_id):
-        node = self._leaves.pop(node_id, None)
-        if node is None:
-            raise KeyError(node_id)
-        parent = node.parent
-        # Check if it's last (root) node
-        if parent is None:
-            self._root = None
-            return
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        left_links, right_links = self._left, self._right
+        objects = self._objects
+        # Callbacks may query the tree again, so each running query takes
+        # its own stack from the pool. `pop` is atomic, so readers of a
+        # snapshot in other threads don't get the same one
+        try:
+            stack = self._stacks.pop()
+        except IndexError:
+            stack = []
+        stack.append(self._root)
+        visited = tested = 0
+        try:
+            while stack:
+                node = stack.pop()
+                visited += 1
+                if x1 > max_x[node] or y1 > max_y[node] or \
+                        x2 < min_x[node] or y2 < min_y[node]:
+                    continue
+                left = left_links[node]
+                if left != NULL:
+                    stack.append(left)
+                    stack.append(right_links[node])
+                    continue
+                tested += 1
+                if callback is None:
+                    out.append(objects[node])
+                elif callback(objects[node]) is False:
+                    return False
+        finally:
+            del stack[:]
+            self._stacks.append(stack)
+            if self._counted:
+                self._nodes_visited += visited
+                self._leaves_tested += tested
+        return True if callback is not None else out
 
-        # Remove parent node, as not needed anymore
-        grand_parent = parent.parent
-        if node is parent.left:
-            sibling = parent.right
-        else:
-            sibling = parent.left
-        # If parent's parent is root - just place sibling there
-        if grand_parent is None:
-            self._root = sibling
-            sibling.parent = None
+    def _query_leaves(self, x1, y1, x2, y2, out):
+        """ Same as `_query_bounds`, but collects leaf indices """
+        if self._root == NULL:
             return
-        # Link grand_parent and sibling
-        if grand_parent.left is parent:
-            grand_parent.left = sibling
-        else:
-            grand_parent.right = sibling
-        sibling.parent = grand_parent
-
-        # Adjust all nodes up the tree
-        current = grand_parent
-        while current is not None:
-            new_aabb = current.left.aabb.union(current.right.aabb)
-            if current.aabb == new_aabb:
-                break
-            current.aabb = new_aabb
-            current = current.parent
-
-        # Unlink node for easier GC
-        node.parent = None
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        left_links, right_links = self._left, self._right
+        try:
+            stack = self._stacks.pop()
+        except IndexError:
+            stack = []
+        stack.append(self._root)
+        while stack:
+            node = stack.pop()
+            if x1 > max_x[node] or y1 > max_y[node] or \
+                    x2 < min_x[node] or y2 < min_y[node]:
+                continue
+            left = left_links[node]
+            if left != NULL:
+                stack.append(left)
+                stack.append(right_links[node])
+            else:
+                out.append(node)
+        self._stacks.append(stack)
 
-    def _insert_strategy(self, node, aabb):
-        """ For each node we can do one of the 3 cases for insertion:
-                * insert to right branch recurcively
-                * insert to left branch recurcively
-                * add it to current node
-            Returns node to proceed recurcively on or None to indicate
-            insertion to this node
+    def closest(self, point, k=None, max_distance=None, distance=None):
+        """ Iterate over objects in the order of distance from `point` to
+            their fat AABB's. See `closest_items`.
         """
-        left = node.left
-        right = node.right
-
-        area = node.aabb.area()
-        combined_area = node.aabb.union(aabb).area()
-        # Cost of creating a new node instead of this one
-        cost_parent = 2 * area
-        # Minimum cost of pushing the leaf further down the tree
-        cost_descend = 2 * (combined_area - area)
+        for _, obj in self.closest_items(point, k, max_distance, distance):
+            yield obj
 
-        # cost of descending into left node
-        cost_left = left.aabb.union(aabb).area() + cost_descend
-        if not left.leaf:
-            cost_left -= left.aabb.area()
+    def closest_items(self, point, k=None, max_distance=None,
+                      distance=None):
+        """ Iterate over (distance, obj) pairs in the order of distance from
+            `point` to objects' fat AABB's. Best-first search: nodes are
+            visited from the closest one using a heap, so only nodes, that
+            can hold the next result, are opened. The iterator is lazy -
+            taking the first few objects only costs that much. Stops after
+            `k` objects or on objects farther than `max_distance`.
 
-        # cost of descending into right node
-        cost_right = right.aabb.union(aabb).area() + cost_descend
-        if not right.leaf:
-            cost_right -= right.aabb.area()
+            If `distance(obj, point)` is passed, objects are ordered by it
+            instead. It must not be less than the distance to object's fat
+            AABB, which holds for distance to the object's shape.
 
-        if cost_left >= cost_parent and cost_right >= cost_parent:
-            return None
-        elif cost_left < cost_right:
-            return left
+            Don't change the tree while iterating.
+        """
+        assert isinstance(point, Vector)
+        if self._root == NULL or k == 0:
+            return
+        px, py = point.x, point.y
+        if max_distance is None:
+            max_distance2 = float("inf")
         else:
-            return right
+            max_distance2 = max_distance ** 2
 
-    def query_shape(self, shape):
-        if not isinstance(shape, BaseShape):
-            raise ValueError(shape)
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        left_links, right_links = self._left, self._right
+        objects = self._objects
+        heappush, heappop = heapq.heappush, heapq.heappop
 
-        shape_aabb = shape.bbox()
-        results = []
-        for obj in self._query_aabb(self._root, shape_aabb):
-            results.append(obj)
-        return results
+        def box_distance2(node):
+            dx = max(min_x[node] - px, px - max_x[node], 0)
+            dy = max(min_y[node] - py, py - max_y[node], 0)
+            return dx * dx + dy * dy
+
+        # (squared distance, node, exact). Exact entries hold leaves, that
+        # were already measured with `distance`
+        heap = [(box_distance2(self._root), self._root, False)]
+        found = 0
+        visited, tested = 1, 0
+        try:
+            while heap:
+                dist2, node, exact = heappop(heap)
+                if dist2 > max_distance2:
+                    return
+                left = left_links[node]
+                if left == NULL:
+                    if not exact:
+                        tested += 1
+                        if distance is not None:
+                            d = max(distance(objects[node], point), 0)
+                            heappush(heap, (d * d, node, True))
+                            continue
+                    yield math.sqrt(dist2), objects[node]
+                    found += 1
+                    if found == k:
+                        return
+                    continue
+                for child in (left, right_links[node]):
+                    visited += 1
+                    child_dist2 = box_distance2(child)
+                    if child_dist2 <= max_distance2:
+                        heappush(heap, (child_dist2, child, False))
+        finally:
+            if self._counted:
+                self._nodes_visited += visited
+                self._leaves_tested += tested
 
     def raycast(self, point, direction, *, callback, max_distance=None):
         """ Implementation taken directly from Box2D, as it's quite extensible
@@ -235,74 +301,936 @@ class DynamicAABB(ABCBroadPhase):
         """
         assert abs(direction.length2() - 1) < EPSILON
 
-        if self._root is None:
+        if self._root == NULL:
             return None
 
-        v = direction.rotate_deg(90)
-        abs_v = Vector(math.fabs(v.x), math.fabs(v.y))
-
         if max_distance is None:
             max_distance = float("inf")
+        last_result, _, _ = self._raycast_subtree(
+            self._root, point, direction, max_distance, callback)
+        return last_result
 
-        p2 = point + direction * max_distance
-        segment_aabb = AABB(min_vector(point, p2), max_vector(point, p2))
+    def _raycast_subtree(self, root, point, direction, max_distance,
+                         callback):
+        """ Body of `raycast` starting at `root`. Returns the last reported
+            object, the clipped `max_distance` and whether the callback has
+            terminated the ray.
+        """
+        # Separating axis for segment (Gino, p80).
+        # |dot(v, p1 - c)| > dot(|v|, h)
+        px, py = point.x, point.y
+        vx, vy = -direction.y, direction.x
+        abs_vx, abs_vy = math.fabs(vx), math.fabs(vy)
 
-        node_stack = [self._root]
+        x1, y1, x2, y2 = segment_bounds(
+            px, py, direction.x, direction.y, max_distance)
+
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        left_links, right_links = self._left, self._right
+        node_stack = [root]
         last_result = None
+        visited = tested = 0
         while node_stack:
             node = node_stack.pop()
+            visited += 1
             # First check AABB
-            if not node.aabb.intersects(segment_aabb):
+            n_x1, n_y1 = min_x[node], min_y[node]
+            n_x2, n_y2 = max_x[node], max_y[node]
+            if x1 > n_x2 or y1 > n_y2 or x2 < n_x1 or y2 < n_y1:
                 continue
-            # Separating axis for segment (Gino, p80).
-            # |dot(v, p1 - c)| > dot(|v|, h)
-            c = node.aabb.center
-            h = node.aabb.extents
-            separation = abs(v.dot(point - c)) - abs_v.dot(h)
+            # Separating axis for segment
+            cx, cy = (n_x1 + n_x2) * 0.5, (n_y1 + n_y2) * 0.5
+            hx, hy = (n_x2 - n_x1) * 0.5, (n_y2 - n_y1) * 0.5
+            separation = abs(vx * (px - cx) + vy * (py - cy)) - \
+                (abs_vx * hx + abs_vy * hy)
             if separation > 0:
                 continue
             # Ok, now we know, this AABB intersects the ray
-            if node.leaf:
-                value = callback(node.obj, point, direction, max_distance)
+            left = left_links[node]
+            if left == NULL:
+                tested += 1
+                obj = self._objects[node]
+                value = callback(obj, point, direction, max_distance)
                 if value is None:
                     continue
-                last_result = node.obj
+                last_result = obj
                 if value == 0:
                     # Client has terminated the raycast
-                    return last_result
+                    if self._counted:
+                        self._nodes_visited += visited
+                        self._leaves_tested += tested
+                    return last_result, max_distance, True
                 if value > 0:
                     # Fixup the bounds of our AABB
                     max_distance = value
-                    p2 = point + direction * max_distance
-                    segment_aabb = AABB(
-                        min_vector(point, p2), max_vector(point, p2))
+                    x1, y1, x2, y2 = segment_bounds(
+                        px, py, direction.x, direction.y, max_distance)
+            else:
+                node_stack.append(left)
+                node_stack.append(right_links[node])
+        if self._counted:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
+        return last_result, max_distance, False
+
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0):
+        """ Sweep `shape` by `translation` through the tree, same as
+        `raycast` does with a ray. Node AABB's are inflated by the extents
+        of the shape's bbox and tested against the path of its center, so
+        all objects the moving bbox may touch are visited.
+            Callback is called as:
+
+                callback(obj, shape, translation, max_fraction)
+
+        and returns None to ignore the object, 0 to stop the cast or a
+        fraction of `translation` (like the one `time_of_impact` returns) to
+        shorten the sweep. Returns the last reported object.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        if self._root == NULL:
+            return None
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        ex, ey = (hi.x - lo.x) * 0.5, (hi.y - lo.y) * 0.5
+        px, py = lo.x + ex, lo.y + ey
+        dx, dy = translation.x, translation.y
+        # Separating axis for segment, same as in `raycast`. The axis does
+        # not need to be normalized
+        vx, vy = -dy, dx
+        abs_vx, abs_vy = math.fabs(vx), math.fabs(vy)
+
+        x1, y1, x2, y2 = segment_bounds(px, py, dx, dy, max_fraction)
+
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        left_links, right_links = self._left, self._right
+        node_stack = [self._root]
+        last_result = None
+        visited = tested = 0
+        while node_stack:
+            node = node_stack.pop()
+            visited += 1
+            # Inflated AABB against bounds of the center's path
+            n_x1, n_y1 = min_x[node] - ex, min_y[node] - ey
+            n_x2, n_y2 = max_x[node] + ex, max_y[node] + ey
+            if x1 > n_x2 or y1 > n_y2 or x2 < n_x1 or y2 < n_y1:
+                continue
+            cx, cy = (n_x1 + n_x2) * 0.5, (n_y1 + n_y2) * 0.5
+            hx, hy = (n_x2 - n_x1) * 0.5, (n_y2 - n_y1) * 0.5
+            separation = abs(vx * (px - cx) + vy * (py - cy)) - \
+                (abs_vx * hx + abs_vy * hy)
+            if separation > 0:
+                continue
+            left = left_links[node]
+            if left == NULL:
+                tested += 1
+                obj = self._objects[node]
+                value = callback(obj, shape, translation, max_fraction)
+                if value is None:
+                    continue
+                last_result = obj
+                if value == 0:
+                    # Client has terminated the cast
+                    break
+                if value > 0:
+                    max_fraction = value
+                    x1, y1, x2, y2 = segment_bounds(
+                        px, py, dx, dy, max_fraction)
             else:
-                node_stack.append(node.left)
-                node_stack.append(node.right)
+                node_stack.append(left)
+                node_stack.append(right_links[node])
+        if self._counted:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
         return last_result
 
-    def _query_aabb(self, node, aabb):
-        if node is None or not node.aabb.intersects(aabb):
-            return
-        if node.leaf:
-            yield node.obj
+    def raycast_many(self, origins, directions, max_distance=None, *,
+                     callback):
+        """ Batched version of `raycast` for N rays (same arguments as
+        `BaseShape.raycast_many`), like a shotgun spread or a visibility fan.
+        The tree is traversed level by level for all rays at once: every
+        pending (node, ray) pair of a level is checked with one vectorized
+        slab test, so the number of numpy calls depends on the height of
+        the tree instead of the number of visited nodes. Once few pairs are
+        left, they are finished with the scalar `raycast` loop.
+            Callback gets the index of the ray in front of the usual
+        arguments:
+
+            callback(ray, obj, point, direction, max_distance)
+
+        and follows the same protocol as in `raycast` for that ray: None
+        ignores the object, 0 terminates the ray and drops it from the
+        batch, a positive value clips it. As the order of visited leaves
+        differs from `raycast`, only the `first hit` style of callbacks
+        gives the same results. The tree can't be changed from the callback,
+        as it's read through views of the node arrays.
+            Returns a list with the last reported object for each ray.
+        """
+        origins, directions, max_distance = as_rays(
+            origins, directions, max_distance)
+        count = len(origins)
+        results = [None] * count
+        if self._root == NULL or not count:
+            return results
+        assert np.all(np.fabs(np.einsum(
+            "ij,ij->i", directions, directions) - 1) < EPSILON)
+
+        px, py = origins[:, 0], origins[:, 1]
+        dx, dy = directions[:, 0], directions[:, 1]
+        max_distance = max_distance.astype(np.float64)
+        points = [Vector(x, y) for x, y in origins.tolist()]
+        vectors = [Vector(x, y) for x, y in directions.tolist()]
+        parallel_x, parallel_y = dx == 0, dy == 0
+        has_parallel = bool(parallel_x.any() or parallel_y.any())
+        with np.errstate(divide="ignore"):
+            inv_x, inv_y = 1.0 / dx, 1.0 / dy
+        active = np.ones(count, dtype=bool)
+
+        min_x, min_y, max_x, max_y, left_links, right_links = [
+            np.frombuffer(links, dtype=links.typecode) for links in (
+                self._min_x, self._min_y, self._max_x, self._max_y,
+                self._left, self._right)]
+        nodes = np.full(count, self._root, dtype=left_links.dtype)
+        rays = np.arange(count)
+        visited = tested = 0
+        while len(rays):
+            # Drop rays, that were terminated on the previous level
+            alive = active[rays]
+            nodes, rays = nodes[alive], rays[alive]
+            if len(rays) < MIN_PACKET_SIZE:
+                # Numpy overhead is not worth it for a couple of pairs
+                for node, ray in zip(nodes.tolist(), rays.tolist()):
+                    if not active[ray]:
+                        continue
+                    obj, max_distance[ray], stopped = self._raycast_subtree(
+                        node, points[ray], vectors[ray],
+                        float(max_distance[ray]),
+                        functools.partial(callback, ray))
+                    if obj is not None:
+                        results[ray] = obj
+                    if stopped:
+                        active[ray] = False
+                break
+
+            # Slab test of all pairs
+            visited += len(nodes)
+            n_x1, n_y1 = min_x[nodes], min_y[nodes]
+            n_x2, n_y2 = max_x[nodes], max_y[nodes]
+            r_px, r_py = px[rays], py[rays]
+            r_inv_x, r_inv_y = inv_x[rays], inv_y[rays]
+            with np.errstate(invalid="ignore"):
+                tx1, tx2 = (n_x1 - r_px) * r_inv_x, (n_x2 - r_px) * r_inv_x
+                ty1, ty2 = (n_y1 - r_py) * r_inv_y, (n_y2 - r_py) * r_inv_y
+            t_min = np.maximum(np.minimum(tx1, tx2), np.minimum(ty1, ty2))
+            t_max = np.minimum(np.maximum(tx1, tx2), np.maximum(ty1, ty2))
+            if has_parallel:
+                # Parallel rays never leave the slab they start in
+                r_parallel_x, r_parallel_y = parallel_x[rays], parallel_y[rays]
+                t_min = np.where(r_parallel_x, np.minimum(ty1, ty2), t_min)
+                t_max = np.where(r_parallel_x, np.maximum(ty1, ty2), t_max)
+                t_min = np.where(r_parallel_y, np.minimum(tx1, tx2), t_min)
+                t_max = np.where(r_parallel_y, np.maximum(tx1, tx2), t_max)
+            hit = (np.maximum(t_min, 0) <= np.minimum(
+                t_max, max_distance[rays]))
+            if has_parallel:
+                hit &= ~r_parallel_x | ((n_x1 <= r_px) & (r_px <= n_x2))
+                hit &= ~r_parallel_y | ((n_y1 <= r_py) & (r_py <= n_y2))
+            nodes, rays = nodes[hit], rays[hit]
+
+            # Report leaves and descend into branches
+            lefts = left_links[nodes]
+            is_leaf = lefts == NULL
+            for node, ray in zip(nodes[is_leaf].tolist(),
+                                 rays[is_leaf].tolist()):
+                if not active[ray]:
+                    continue
+                tested += 1
+                obj = self._objects[node]
+                value = callback(ray, obj, points[ray], vectors[ray],
+                                 float(max_distance[ray]))
+                if value is None:
+                    continue
+                results[ray] = obj
+                if value == 0:
+                    # Client has terminated this ray
+                    active[ray] = False
+                elif value > 0:
+                    max_distance[ray] = value
+            branch = ~is_leaf
+            rays = rays[branch]
+            nodes = np.concatenate((lefts[branch], right_links[nodes[branch]]))
+            rays = np.concatenate((rays, rays))
+        if self._counted:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
+        return results
+
+    def quality(self):
+        """ Metrics of how well the tree fits its objects. Walks all nodes,
+            so call it now and then, not every tick:
+
+                * sah_cost - expected cost of a query by the surface area
+                  heuristic: areas of all nodes relative to the root. A
+                  random query visits a node with probability of its area
+                  (internal nodes are traversal steps and leaves are tests)
+                * area_ratio - areas of internal nodes relative to the
+                  root, as `GetAreaRatio` in Box2D. Moves and removals make
+                  it grow, rebuilding with `from_items` brings it back
+        """
+        internal_area = leaf_area = 0.0
+        internal = 0
+        root = self._root
+        if root != NULL:
+            boxes = AABBArray(np.vstack([
+                np.frombuffer(coords, dtype=coords.typecode) for coords in (
+                    self._min_x, self._min_y, self._max_x, self._max_y)]))
+            areas = boxes.area()
+            heights, left_links = [
+                np.frombuffer(links, dtype=links.typecode)
+                for links in (self._height, self._left)]
+            # Free nodes have a negative height
+            live = heights >= 0
+            branch = live & (left_links != NULL)
+            internal_area = float(areas[branch].sum())
+            leaf_area = float(areas[live & ~branch].sum())
+            internal = int(np.count_nonzero(branch))
+        root_area = self._area(root) if root != NULL else 0.0
+        if root_area > 0:
+            sah_cost = (internal_area + leaf_area) / root_area
+            area_ratio = internal_area / root_area
         else:
-            yield from self._query_aabb(node.right, aabb)
-            yield from self._query_aabb(node.left, aabb)
+            sah_cost = area_ratio = 0.0
+        return {
+            "leaves": self._leaf_count,
+            "nodes": self._leaf_count + internal,
+            "height": self.get_height(),
+            "sah_cost": sah_cost,
+            "area_ratio": area_ratio,
+        }
 
     def _print_tree(self, node=None, indent=0):
         if node is None:
             node = self._root
-        print(" " * indent + str(node))
-        if not node.leaf:
-            self._print_tree(node.left, indent=indent + 2)
-            self._print_tree(node.right, indent=indent + 2)
+        if node == NULL:
+            return
+        if self._left[node] == NULL:
+            print(" " * indent + "Leaf({}, {})".format(
+                self._objects[node], self._get_aabb(node)))
+        else:
+            print(" " * indent + "Node({})".format(self._get_aabb(node)))
+            self._print_tree(self._left[node], indent=indent + 2)
+            self._print_tree(self._right[node], indent=indent + 2)
 
     def get_height(self, node=None):
+        """ Number of levels in the tree (or subtree of `node`). Heights are
+            stored on nodes, so this is O(1).
+        """
         if node is None:
             node = self._root
-        if node.leaf:
-            return 1
+            if node == NULL:
+                return 0
+        return self._height[node] + 1
+
+
+class DynamicAABB(DynamicAABBReader, ABCBroadPhase):
+    """ Leaves store `fat` AABB's: the object's AABB enlarged by `margin`
+        (and by the expected movement in `move`). While the object stays
+        inside its fat AABB `move` does not need to touch the tree at all,
+        which is the common case for slowly moving actors. Queries may then
+        return objects, that are up to `margin` away from the query shape.
+        Static objects can use the default margin of 0.
+
+        Nodes live in a pool of parallel arrays instead of separate objects:
+        node `i` is described by i'th element of each array, and links
+        between nodes are indices. A leaf's index is the `node_id` returned
+        by `add`. Removed nodes go to a free list and are reused, so churn
+        does not allocate anything, and copying a tree is copying a few flat
+        arrays.
+
+        Same arrays make snapshots cheap: `snapshot` hands the current ones
+        to a read-only view, and the first change after that copies them
+        before writing (copy-on-write), so the view never changes.
+    """
+
+    def __init__(self, margin=0.0, displacement_multiplier=2.0):
+        # Node pool
+        self._min_x = array("d")
+        self._min_y = array("d")
+        self._max_x = array("d")
+        self._max_y = array("d")
+        self._left = array("l")
+        self._right = array("l")
+        self._parent = array("l")
+        # Leaves have height 0, free nodes -1
+        self._height = array("l")
+        # Payload of leaves, None for branches
+        self._objects = []
+        # Indices of free nodes
+        self._free = []
+        # Traversal stacks for reuse between queries
+        self._stacks = []
+        # Node arrays are referenced by a snapshot and must be copied
+        # before the next change
+        self._shared = False
+
+        # Pair management. Leaves added or reinserted since the last
+        # `update_pairs`
+        self._move_buffer = set()
+        # (node_a, node_b) -> (obj_a, obj_b) for overlapping leaves, where
+        # node_a < node_b
+        self._pairs = {}
+        # node_id -> set of node_id's it has pairs with
+        self._partners = {}
+        # Object pairs of removed leaves, to be reported as ended
+        self._ended = []
+
+        self._root = NULL
+        self._leaf_count = 0
+        self._margin = margin
+        # Fat AABB's are extended this many times the displacement passed
+        # to `move` in the direction of movement
+        self._displacement_multiplier = displacement_multiplier
+
+    def copy(self):
+        """ Independent copy of the tree, sharing only the objects """
+        tree = DynamicAABB.__new__(DynamicAABB)
+        tree.__dict__.update(self.__dict__)
+        for name in NODE_ARRAYS + ("_free",):
+            setattr(tree, name, getattr(self, name)[:])
+        tree._stacks = []
+        tree._shared = False
+        # Stats wrappers are bound to this tree
+        tree.__dict__.pop("_stats", None)
+        uninstrument(tree, self._instrumented)
+        tree.__dict__.pop("_instrumented", None)
+        tree._move_buffer = set(self._move_buffer)
+        tree._pairs = dict(self._pairs)
+        tree._partners = {
+            node: set(partners) for node, partners in self._partners.items()}
+        tree._ended = list(self._ended)
+        return tree
+
+    def snapshot(self):
+        """ Immutable view of the tree as it is now, to be queried by other
+            threads or tasks while this tree keeps changing. Taking one is
+            O(1): the view shares node arrays with the tree and the next
+            `add`, `remove` or reinserting `move` copies them once, so a
+            tree pays for at most one copy per snapshot. Readers take no
+            locks and never see a half-updated tree, as the arrays they
+            read are never written again.
+
+            Take snapshots on the thread, that changes the tree, between
+            changes (e.g. at the end of a tick) and pass them to readers.
+        """
+        self._shared = True
+        return DynamicAABBSnapshot(self)
+
+    def _unshare(self):
+        """ Copy node arrays referenced by snapshots before a change """
+        if self._shared:
+            for name in NODE_ARRAYS:
+                setattr(self, name, getattr(self, name)[:])
+            self._shared = False
+
+    @classmethod
+    def from_items(cls, items, margin=0.0, displacement_multiplier=2.0,
+                   bins=SAH_BINS):
+        """ Build a tree from (obj, aabb) pairs at once. The tree is built
+            top-down, splitting each set of leaves where the Surface Area
+            Heuristic (binned, see Ingo Wald's "On fast Construction of
+            SAH-based Bounding Volume Hierarchies") gives the lowest cost.
+            That is faster than adding items one by one and gives a tree with
+            smaller nodes, so queries visit less of them. The result is a
+            regular tree, it can be changed with add/remove/move afterwards.
+
+            Leaf of the i'th item gets node_id `i`.
+        """
+        tree = cls(margin=margin,
+                   displacement_multiplier=displacement_multiplier)
+        for obj, aabb in items:
+            leaf = tree._allocate()
+            tree._objects[leaf] = obj
+            tree._set_aabb(leaf, tree._fatten(aabb))
+        count = len(tree._height)
+        tree._leaf_count = count
+        tree._move_buffer.update(range(count))
+        if count == 0:
+            return tree
+
+        min_x, min_y, max_x, max_y = \
+            tree._min_x, tree._min_y, tree._max_x, tree._max_y
+        # Centroids, doubled to save on multiplication
+        centers = (
+            [min_x[i] + max_x[i] for i in range(count)],
+            [min_y[i] + max_y[i] for i in range(count)],
+        )
+
+        branches = []
+        stack = [(list(range(count)), NULL, True)]
+        while stack:
+            leaves, parent, is_left = stack.pop()
+            if len(leaves) == 1:
+                node = leaves[0]
+            else:
+                node = tree._allocate()
+                branches.append(node)
+                left, right = tree._sah_split(leaves, centers, bins)
+                stack.append((right, node, False))
+                stack.append((left, node, True))
+            tree._parent[node] = parent
+            if parent == NULL:
+                tree._root = node
+            elif is_left:
+                tree._left[parent] = node
+            else:
+                tree._right[parent] = node
+
+        # Children are allocated after parents, so fix bounds bottom-up
+        height = tree._height
+        for node in reversed(branches):
+            left, right = tree._left[node], tree._right[node]
+            tree._union_into(node, left, right)
+            height[node] = 1 + max(height[left], height[right])
+        return tree
+
+    def _sah_split(self, leaves, centers, bins):
+        """ Split leaves into 2 non-empty lists by the cheapest bin border
+            on either axis. Cost of a split is sum of area * leaf count of
+            both sides.
+        """
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        best_cost = float("inf")
+        best = None
+        for axis_centers in centers:
+            lo = min(axis_centers[i] for i in leaves)
+            hi = max(axis_centers[i] for i in leaves)
+            if hi - lo <= 0:
+                continue
+            scale = bins / (hi - lo)
+            inf = float("inf")
+            counts = [0] * bins
+            bounds = [[inf, inf, -inf, -inf] for _ in range(bins)]
+            for i in leaves:
+                b = min(int((axis_centers[i] - lo) * scale), bins - 1)
+                counts[b] += 1
+                bound = bounds[b]
+                if min_x[i] < bound[0]:
+                    bound[0] = min_x[i]
+                if min_y[i] < bound[1]:
+                    bound[1] = min_y[i]
+                if max_x[i] > bound[2]:
+                    bound[2] = max_x[i]
+                if max_y[i] > bound[3]:
+                    bound[3] = max_y[i]
+
+            # Cost of the right side of each border, sweeping from the end
+            right_costs = [0.0] * bins
+            x1 = y1 = inf
+            x2 = y2 = -inf
+            total = 0
+            for b in range(bins - 1, 0, -1):
+                if counts[b]:
+                    bound = bounds[b]
+                    x1, y1 = min(x1, bound[0]), min(y1, bound[1])
+                    x2, y2 = max(x2, bound[2]), max(y2, bound[3])
+                    total += counts[b]
+                if total:
+                    right_costs[b] = (x2 - x1) * (y2 - y1) * total
+            x1 = y1 = inf
+            x2 = y2 = -inf
+            total = 0
+            for b in range(bins - 1):
+                if counts[b]:
+                    bound = bounds[b]
+                    x1, y1 = min(x1, bound[0]), min(y1, bound[1])
+                    x2, y2 = max(x2, bound[2]), max(y2, bound[3])
+                    total += counts[b]
+                if not total or total == len(leaves):
+                    continue
+                cost = (x2 - x1) * (y2 - y1) * total + right_costs[b + 1]
+                if cost < best_cost:
+                    best_cost = cost
+                    best = (axis_centers, lo, scale, b)
+
+        if best is None:
+            # All centroids are the same, any split is as good
+            half = len(leaves) // 2
+            return leaves[:half], leaves[half:]
+        axis_centers, lo, scale, border = best
+        left, right = [], []
+        for i in leaves:
+            if min(int((axis_centers[i] - lo) * scale), bins - 1) <= border:
+                left.append(i)
+            else:
+                right.append(i)
+        return left, right
+
+    # Node pool
+
+    def _allocate(self):
+        if self._free:
+            index = self._free.pop()
+            self._left[index] = NULL
+            self._right[index] = NULL
+            self._parent[index] = NULL
+            self._height[index] = 0
+            return index
+        for coords in (self._min_x, self._min_y, self._max_x, self._max_y):
+            coords.append(0.0)
+        for links in (self._left, self._right, self._parent):
+            links.append(NULL)
+        self._height.append(0)
+        self._objects.append(None)
+        return len(self._height) - 1
+
+    def _free_node(self, index):
+        self._height[index] = -1
+        self._objects[index] = None
+        self._free.append(index)
+
+    def _set_aabb(self, index, aabb):
+        self._min_x[index] = aabb.min.x
+        self._min_y[index] = aabb.min.y
+        self._max_x[index] = aabb.max.x
+        self._max_y[index] = aabb.max.y
+
+    def _union_into(self, index, a, b):
+        """ Set AABB of node `index` to the union of nodes `a` and `b` """
+        self._min_x[index] = min(self._min_x[a], self._min_x[b])
+        self._min_y[index] = min(self._min_y[a], self._min_y[b])
+        self._max_x[index] = max(self._max_x[a], self._max_x[b])
+        self._max_y[index] = max(self._max_y[a], self._max_y[b])
+
+    def _union_area(self, a, b):
+        return (max(self._max_x[a], self._max_x[b]) -
+                min(self._min_x[a], self._min_x[b])) * \
+            (max(self._max_y[a], self._max_y[b]) -
+             min(self._min_y[a], self._min_y[b]))
+
+    def _fatten(self, aabb):
+        if self._margin:
+            return aabb.inflate(self._margin)
+        return aabb
+
+    # Public API
+
+    def add(self, obj, shape_aabb):
+        self._unshare()
+        leaf = self._allocate()
+        self._objects[leaf] = obj
+        self._set_aabb(leaf, self._fatten(shape_aabb))
+        self._insert_leaf(leaf)
+        self._leaf_count += 1
+        self._move_buffer.add(leaf)
+        return leaf
+
+    def remove(self, node_id):
+        self._check_leaf(node_id)
+        self._unshare()
+        self._remove_leaf(node_id)
+        self._move_buffer.discard(node_id)
+        # Node id will be reused, so end the pairs right away
+        for other in self._partners.pop(node_id, ()):
+            self._partners[other].discard(node_id)
+            key = (node_id, other) if node_id < other else (other, node_id)
+            self._ended.append(self._pairs.pop(key))
+        self._free_node(node_id)
+        self._leaf_count -= 1
+
+    def move(self, node_id, aabb, displacement=None):
+        """ Update the AABB of a previously added object. `displacement` is
+            the expected movement till the next update, the fat AABB is
+            extended in that direction to avoid reinsertion next tick.
+            Returns False if `aabb` still fits in the fat AABB and the tree
+            was not changed, True if the leaf was reinserted.
+        """
+        self._check_leaf(node_id)
+        lo, hi = aabb.min, aabb.max
+        if (self._min_x[node_id] <= lo.x and self._min_y[node_id] <= lo.y and
+                hi.x <= self._max_x[node_id] and
+                hi.y <= self._max_y[node_id]):
+            return False
+
+        fat = self._fatten(aabb)
+        if displacement is not None:
+            d = displacement * self._displacement_multiplier
+            lo, hi = fat.min, fat.max
+            fat = AABB(
+                Vector(lo.x + min(d.x, 0), lo.y + min(d.y, 0)),
+                Vector(hi.x + max(d.x, 0), hi.y + max(d.y, 0)))
+
+        self._unshare()
+        self._remove_leaf(node_id)
+        self._set_aabb(node_id, fat)
+        self._insert_leaf(node_id)
+        self._move_buffer.add(node_id)
+        return True
+
+    def update_pairs(self, callback):
+        """ Report changes in the set of overlapping leaf pairs since the
+            last call, same as b2BroadPhase::UpdatePairs. Only leaves, that
+            were added or reinserted by `move` since then, are queried
+            against the tree, so the cost depends on the number of movers,
+            not the size of the tree. Calls `callback(event, obj_a, obj_b)`
+            once per pair with:
+                * PAIR_BEGIN - fat AABB's started to overlap
+                * PAIR_PERSIST - still overlap
+                * PAIR_END - don't overlap anymore or one was removed
+        """
+        pairs = self._pairs
+        partners = self._partners
+        objects = self._objects
+
+        ended, self._ended = self._ended, []
+        for obj_a, obj_b in ended:
+            callback(PAIR_END, obj_a, obj_b)
+
+        # Find pairs of moved leaves. A pair of 2 moved leaves is found
+        # twice, so collect them in a set
+        new_pairs = set()
+        found = []
+        for node in self._move_buffer:
+            del found[:]
+            self._query_leaves(
+                self._min_x[node], self._min_y[node],
+                self._max_x[node], self._max_y[node], found)
+            for other in found:
+                if node < other:
+                    new_pairs.add((node, other))
+                elif other < node:
+                    new_pairs.add((other, node))
+        self._move_buffer.clear()
+
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        for key in list(pairs):
+            if key in new_pairs:
+                new_pairs.discard(key)
+                callback(PAIR_PERSIST, *pairs[key])
+                continue
+            a, b = key
+            if (min_x[a] > max_x[b] or min_y[a] > max_y[b] or
+                    max_x[a] < min_x[b] or max_y[a] < min_y[b]):
+                obj_a, obj_b = pairs.pop(key)
+                partners[a].discard(b)
+                partners[b].discard(a)
+                callback(PAIR_END, obj_a, obj_b)
+            else:
+                callback(PAIR_PERSIST, *pairs[key])
+
+        for a, b in sorted(new_pairs):
+            pairs[a, b] = objects[a], objects[b]
+            partners.setdefault(a, set()).add(b)
+            partners.setdefault(b, set()).add(a)
+            callback(PAIR_BEGIN, objects[a], objects[b])
+
+    @property
+    def pair_count(self):
+        return len(self._pairs)
+
+    # Tree maintenance
+
+    def _insert_leaf(self, leaf):
+        if self._root == NULL:
+            self._root = leaf
+            self._parent[leaf] = NULL
+            return
+
+        # Find which node to append to
+        left_links = self._left
+        node = self._root
+        while left_links[node] != NULL:
+            insert_to = self._insert_strategy(node, leaf)
+            if insert_to == NULL:  # Node found
+                break
+            node = insert_to
+
+        old_parent = self._parent[node]
+        new_parent = self._allocate()
+        self._parent[new_parent] = old_parent
+        self._union_into(new_parent, node, leaf)
+        self._height[new_parent] = self._height[node] + 1
+
+        # Link nodes togather
+        self._left[new_parent] = node
+        self._right[new_parent] = leaf
+        self._parent[node] = new_parent
+        self._parent[leaf] = new_parent
+        if old_parent == NULL:
+            self._root = new_parent
+        else:
+            if self._left[old_parent] == node:
+                self._left[old_parent] = new_parent
+            else:
+                self._right[old_parent] = new_parent
+            self._refit_up(old_parent)
+
+    def _remove_leaf(self, leaf):
+        # Check if it's last (root) node
+        if leaf == self._root:
+            self._root = NULL
+            return
+
+        parent = self._parent[leaf]
+        self._parent[leaf] = NULL
+
+        # Remove parent node, as not needed anymore
+        grand_parent = self._parent[parent]
+        if self._left[parent] == leaf:
+            sibling = self._right[parent]
+        else:
+            sibling = self._left[parent]
+        self._free_node(parent)
+        # If parent's parent is root - just place sibling there
+        if grand_parent == NULL:
+            self._root = sibling
+            self._parent[sibling] = NULL
+            return
+        # Link grand_parent and sibling
+        if self._left[grand_parent] == parent:
+            self._left[grand_parent] = sibling
+        else:
+            self._right[grand_parent] = sibling
+        self._parent[sibling] = grand_parent
+        self._refit_up(grand_parent)
+
+    def _refit_up(self, node):
+        """ Walk up the tree from `node`, rebalancing and fixing heights and
+            aabb's of all ancestors.
+        """
+        height = self._height
+        while node != NULL:
+            node = self._balance(node)
+            left, right = self._left[node], self._right[node]
+            height[node] = 1 + max(height[left], height[right])
+            self._union_into(node, left, right)
+            node = self._parent[node]
+
+    def _replace_child(self, old, new):
+        """ Put `new` in place of `old` under old's parent """
+        parent = self._parent[old]
+        self._parent[new] = parent
+        if parent == NULL:
+            self._root = new
+        elif self._left[parent] == old:
+            self._left[parent] = new
+        else:
+            self._right[parent] = new
+
+    def _balance(self, a):
+        r""" AVL-like rotation, same as b2DynamicTree::Balance. If one child
+            of `a` is higher than the other one by more than 1, that child is
+            rotated up to take `a`'s place and `a` gets its lower grandchild.
+            Returns the node, that now holds a's place in the tree.
+
+                  a                 c
+                 / \               / \
+                b   c      =>     a   f
+                   / \           / \
+                  f   g         b   g
+        """
+        height = self._height
+        left, right, parent = self._left, self._right, self._parent
+        if height[a] < 2:
+            return a
+        b, c = left[a], right[a]
+        balance = height[c] - height[b]
+
+        # Rotate C up
+        if balance > 1:
+            f, g = left[c], right[c]
+            self._replace_child(a, c)
+            left[c] = a
+            parent[a] = c
+            # Keep the higher grandchild under C
+            if height[f] < height[g]:
+                f, g = g, f
+            right[c] = f
+            right[a] = g
+            parent[g] = a
+            self._union_into(a, b, g)
+            height[a] = 1 + max(height[b], height[g])
+            self._union_into(c, a, f)
+            height[c] = 1 + max(height[a], height[f])
+            return c
+
+        # Rotate B up
+        if balance < -1:
+            d, e = left[b], right[b]
+            self._replace_child(a, b)
+            left[b] = a
+            parent[a] = b
+            # Keep the higher grandchild under B
+            if height[d] < height[e]:
+                d, e = e, d
+            right[b] = d
+            left[a] = e
+            parent[e] = a
+            self._union_into(a, c, e)
+            height[a] = 1 + max(height[c], height[e])
+            self._union_into(b, a, d)
+            height[b] = 1 + max(height[a], height[d])
+            return b
+
+        return a
+
+    def _insert_strategy(self, node, leaf):
+        """ For each node we can do one of the 3 cases for insertion:
+                * insert to right branch recurcively
+                * insert to left branch recurcively
+                * add it to current node
+            Returns node to proceed recurcively on or NULL to indicate
+            insertion to this node
+        """
+        left = self._left[node]
+        right = self._right[node]
+
+        area = self._area(node)
+        combined_area = self._union_area(node, leaf)
+        # Cost of creating a new node instead of this one
+        cost_parent = 2 * area
+        # Minimum cost of pushing the leaf further down the tree
+        cost_descend = 2 * (combined_area - area)
+
+        # cost of descending into left node
+        cost_left = self._union_area(left, leaf) + cost_descend
+        if self._left[left] != NULL:
+            cost_left -= self._area(left)
+
+        # cost of descending into right node
+        cost_right = self._union_area(right, leaf) + cost_descend
+        if self._left[right] != NULL:
+            cost_right -= self._area(right)
+
+        if cost_left >= cost_parent and cost_right >= cost_parent:
+            return NULL
+        elif cost_left < cost_right:
+            return left
         else:
-            h = max(self.get_height(node.left), self.get_height(node.right))
-            return h + 1
+            return right
+
+
+class DynamicAABBSnapshot(DynamicAABBReader):
+    """ Read-only view of a `DynamicAABB` returned by `snapshot`. Has the
+        same queries as the tree and answers them as of the moment it was
+        taken. Queries don't write to it, not even the traversal counters,
+        so any number of threads can query it at once.
+    """
+
+    # Snapshots are not counted
+    stats = None
+    _counted = False
+
+    def __init__(self, tree):
+        for name in NODE_ARRAYS:
+            setattr(self, name, getattr(tree, name))
+        self._root = tree._root
+        self._leaf_count = tree._leaf_count
+        self._margin = tree._margin
+        self._stacks = []
+
+    def snapshot(self):
+        return self
@@ -0,0 +1,502 @@
+"""
+    Loose quadtree, see Thatcher Ulrich "Loose Octrees" in Game Programming
+    Gems 1.
+
+    A regular quadtree has to keep an object in the smallest node, that
+    fully contains it, so small objects on the borders of big cells get stuck
+    high in the tree. In a loose quadtree the bounds of each node are
+    enlarged `looseness` times around its cell, while objects are placed by
+    their center. Then the depth of an object only depends on its size:
+
+        an object of half size `r` fits any node with
+        (looseness - 1) * cell half size >= r
+
+    so the node is found with a bit of arithmetic instead of a descent, and
+    moving an object is just moving its id between 2 buckets, if it changes
+    the cell at all. The price is that node bounds overlap, so queries look
+    at more nodes than in a regular quadtree.
+
+    The tree covers a fixed square. Objects with centers outside of it are
+    kept in the root node and checked by every query.
+"""
+import heapq
+import math
+from array import array
+
+from engine.geometry.shapes.shape import BaseShape
+from engine.geometry.vector import EPSILON
+from engine.geometry import AABB, Vector
+
+from .abc import ABCBroadPhase
+from .utils import ray_aabb_entry
+
+DEFAULT_MAX_DEPTH = 8
+DEFAULT_LOOSENESS = 2.0
+
+ROOT = (0, 0, 0)
+
+
+class LooseQuadtree(ABCBroadPhase):
+    """ Same interface as `DynamicAABB`, including `margin` for fat
+        AABB's. Node ids are reused after removal.
+
+        Nodes are addressed by (depth, column, row) and only exist in the
+        `_buckets` dict while they have objects, so empty space costs
+        nothing. `_counts` holds the number of objects in each subtree, to
+        skip empty branches.
+    """
+
+    def __init__(self, center=Vector(0, 0), half_size=1024.0,
+                 max_depth=DEFAULT_MAX_DEPTH, looseness=DEFAULT_LOOSENESS,
+                 margin=0.0):
+        assert half_size > 0 and looseness > 1 and max_depth >= 0
+        self._center = center
+        self._half_size = half_size
+        self._max_depth = max_depth
+        self._looseness = looseness
+        self._margin = margin
+        # Corner of the root cell
+        self._origin_x = center.x - half_size
+        self._origin_y = center.y - half_size
+
+        # Per node data. Bounds of free nodes are not used
+        self._min_x = array("d")
+        self._min_y = array("d")
+        self._max_x = array("d")
+        self._max_y = array("d")
+        self._keys = []
+        self._objects = []
+        self._free = []
+        self._count = 0
+
+        # (depth, column, row) -> array of node ids
+        self._buckets = {}
+        # (depth, column, row) -> number of objects in the subtree
+        self._counts = {}
+
+    @classmethod
+    def from_items(cls, items, **kw):
+        """ Tree of (obj, aabb) pairs. Unless `center` and `half_size` are
+            given, the tree covers the bounds of all items. Leaf of the i'th
+            item gets node_id `i`.
+        """
+        items = list(items)
+        if items and "center" not in kw and "half_size" not in kw:
+            lo = Vector(min(aabb.min.x for _, aabb in items),
+                        min(aabb.min.y for _, aabb in items))
+            hi = Vector(max(aabb.max.x for _, aabb in items),
+                        max(aabb.max.y for _, aabb in items))
+            kw["center"] = (lo + hi) * 0.5
+            kw["half_size"] = max(hi.x - lo.x, hi.y - lo.y, EPSILON) * 0.5
+        tree = cls(**kw)
+        for obj, aabb in items:
+            tree.add(obj, aabb)
+        return tree
+
+    @property
+    def margin(self):
+        return self._margin
+
+    @property
+    def looseness(self):
+        return self._looseness
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    def __len__(self):
+        return self._count
+
+    def get_height(self):
+        """ Number of levels down to the deepest non-empty node """
+        if not self._count:
+            return 0
+        return max(depth for depth, _, _ in self._buckets) + 1
+
+    def _check_node(self, node_id):
+        if not 0 <= node_id < len(self._keys) or \
+                self._keys[node_id] is None:
+            raise KeyError(node_id)
+
+    def _cell_half_size(self, depth):
+        return self._half_size / (1 << depth)
+
+    def _loose_bounds(self, key):
+        depth, column, row = key
+        half = self._cell_half_size(depth)
+        loose = half * self._looseness
+        cx = self._origin_x + (2 * column + 1) * half
+        cy = self._origin_y + (2 * row + 1) * half
+        return cx - loose, cy - loose, cx + loose, cy + loose
+
+    def _key_for(self, x1, y1, x2, y2):
+        """ Deepest node, which loose bounds hold the box """
+        cx, cy = (x1 + x2) * 0.5, (y1 + y2) * 0.5
+        size = self._half_size * 2
+        fx = (cx - self._origin_x) / size
+        fy = (cy - self._origin_y) / size
+        if not (0 <= fx < 1 and 0 <= fy < 1):
+            return ROOT
+        radius = max(x2 - x1, y2 - y1) * 0.5
+        slack = (self._looseness - 1) * self._half_size
+        if radius <= 0:
+            depth = self._max_depth
+        else:
+            depth = min(int(math.floor(math.log2(slack / radius))),
+                        self._max_depth)
+            if depth < 0:
+                return ROOT
+        cells = 1 << depth
+        return (depth, int(fx * cells), int(fy * cells))
+
+    def _link(self, node_id, key):
+        self._keys[node_id] = key
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = bucket = array("l")
+        bucket.append(node_id)
+        self._update_counts(key, 1)
+
+    def _unlink(self, node_id):
+        key = self._keys[node_id]
+        bucket = self._buckets[key]
+        # Swap-remove, order in a bucket does not matter
+        index = bucket.index(node_id)
+        last = bucket.pop()
+        if index < len(bucket):
+            bucket[index] = last
+        if not bucket:
+            del self._buckets[key]
+        self._update_counts(key, -1)
+
+    def _update_counts(self, key, delta):
+        counts = self._counts
+        depth, column, row = key
+        while True:
+            key = (depth, column, row)
+            count = counts.get(key, 0) + delta
+            if count:
+                counts[key] = count
+            else:
+                del counts[key]
+            if not depth:
+                break
+            depth, column, row = depth - 1, column >> 1, row >> 1
+
+    def _children(self, key):
+        depth, column, row = key
+        if depth == self._max_depth:
+            return ()
+        depth += 1
+        column *= 2
+        row *= 2
+        counts = self._counts
+        return [child for child in (
+            (depth, column, row), (depth, column + 1, row),
+            (depth, column, row + 1), (depth, column + 1, row + 1))
+            if child in counts]
+
+    def _set_bounds(self, node_id, aabb):
+        margin = self._margin
+        self._min_x[node_id] = aabb.min.x - margin
+        self._min_y[node_id] = aabb.min.y - margin
+        self._max_x[node_id] = aabb.max.x + margin
+        self._max_y[node_id] = aabb.max.y + margin
+
+    def _node_key(self, node_id):
+        return self._key_for(self._min_x[node_id], self._min_y[node_id],
+                             self._max_x[node_id], self._max_y[node_id])
+
+    def add(self, obj, shape_aabb):
+        if self._free:
+            node_id = self._free.pop()
+            self._objects[node_id] = obj
+        else:
+            node_id = len(self._keys)
+            for values in (self._min_x, self._min_y, self._max_x,
+                           self._max_y):
+                values.append(0.0)
+            self._keys.append(None)
+            self._objects.append(obj)
+        self._set_bounds(node_id, shape_aabb)
+        self._link(node_id, self._node_key(node_id))
+        self._count += 1
+        return node_id
+
+    def remove(self, node_id):
+        self._check_node(node_id)
+        self._unlink(node_id)
+        self._keys[node_id] = None
+        self._objects[node_id] = None
+        self._free.append(node_id)
+        self._count -= 1
+
+    def move(self, node_id, aabb, displacement=None):
+        """ Update bounds of the object. Returns True if it moved to another
+            node. With a `margin` bounds are only updated once `aabb` leaves
+            the fat AABB. `displacement` is accepted for compatibility with
+            `DynamicAABB`, but not used.
+        """
+        self._check_node(node_id)
+        if self._margin:
+            lo, hi = aabb.min, aabb.max
+            if (self._min_x[node_id] <= lo.x and
+                    self._min_y[node_id] <= lo.y and
+                    hi.x <= self._max_x[node_id] and
+                    hi.y <= self._max_y[node_id]):
+                return False
+        self._set_bounds(node_id, aabb)
+        key = self._node_key(node_id)
+        if key == self._keys[node_id]:
+            return False
+        self._unlink(node_id)
+        self._link(node_id, key)
+        return True
+
+    def get_fat_aabb(self, node_id):
+        self._check_node(node_id)
+        return AABB(Vector(self._min_x[node_id], self._min_y[node_id]),
+                    Vector(self._max_x[node_id], self._max_y[node_id]))
+
+    def get_object(self, node_id):
+        self._check_node(node_id)
+        return self._objects[node_id]
+
+    def occupancy(self):
+        """ Statistics for tuning `half_size`, `max_depth` and `looseness`:
+            a lot of objects in `root` means the tree does not cover the
+            map or objects are too big for it; a lot of objects at
+            `max_depth` means the tree could go deeper.
+        """
+        per_depth = [0] * (self._max_depth + 1)
+        nodes_per_depth = [0] * (self._max_depth + 1)
+        max_bucket = 0
+        for (depth, _, _), bucket in self._buckets.items():
+            per_depth[depth] += len(bucket)
+            nodes_per_depth[depth] += 1
+            max_bucket = max(max_bucket, len(bucket))
+        nodes = len(self._buckets)
+        return {
+            "objects": self._count,
+            "nodes": nodes,
+            "subtrees": len(self._counts),
+            "root": len(self._buckets.get(ROOT, ())),
+            "objects_per_depth": per_depth,
+            "nodes_per_depth": nodes_per_depth,
+            "max_per_node": max_bucket,
+            "mean_per_node": self._count / nodes if nodes else 0.0,
+        }
+
+    # Reported in `stats.snapshot()`
+    quality = occupancy
+
+    # Queries
+
+    def query(self, shape, callback=None, out=None):
+        """ Objects, whose fat AABB overlaps the bbox of `shape`. Same
+            `callback` and `out` semantics as `DynamicAABB.query`.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        return self._query_bounds(lo.x, lo.y, hi.x, hi.y, callback, out)
+
+    # Compatibility alias
+    query_shape = query
+
+    def query_point(self, point, callback=None, out=None):
+        """ Objects, whose fat AABB contains `point` """
+        assert isinstance(point, Vector)
+        return self._query_bounds(
+            point.x, point.y, point.x, point.y, callback, out)
+
+    def _query_bounds(self, x1, y1, x2, y2, callback, out):
+        if callback is None and out is None:
+            out = []
+        if not self._count:
+            return True if callback is not None else out
+        buckets = self._buckets
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+        # Root is always visited, as it holds objects outside of the tree
+        stack = [ROOT]
+        visited, tested = 1, 0
+        try:
+            while stack:
+                key = stack.pop()
+                bucket = buckets.get(key, ())
+                visited += len(bucket)
+                for node in bucket:
+                    if x1 > max_x[node] or y1 > max_y[node] or \
+                            x2 < min_x[node] or y2 < min_y[node]:
+                        continue
+                    tested += 1
+                    if callback is None:
+                        out.append(objects[node])
+                    elif callback(objects[node]) is False:
+                        return False
+                for child in self._children(key):
+                    visited += 1
+                    n_x1, n_y1, n_x2, n_y2 = self._loose_bounds(child)
+                    if x1 > n_x2 or y1 > n_y2 or x2 < n_x1 or y2 < n_y1:
+                        continue
+                    stack.append(child)
+        finally:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
+        return True if callback is not None else out
+
+    def raycast(self, point, direction, *, callback, max_distance=None):
+        """ Same callback protocol as `DynamicAABB.raycast`. Nodes and
+            objects are visited in the order the ray enters them, using a
+            heap, so a clipping callback stops the search right after the
+            closest hit.
+        """
+        assert abs(direction.length2() - 1) < EPSILON
+        if not self._count:
+            return None
+        if max_distance is None:
+            max_distance = float("inf")
+        return self._cast(
+            point.x, point.y, direction.x, direction.y, 0.0, 0.0,
+            max_distance,
+            lambda obj, max_distance: callback(
+                obj, point, direction, max_distance))
+
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0):
+        """ Same as `DynamicAABB.shape_cast`. Nodes and objects are visited
+            like in `raycast`, with their bounds inflated by the extents of
+            the shape.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        if not self._count:
+            return None
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        ex, ey = (hi.x - lo.x) * 0.5, (hi.y - lo.y) * 0.5
+        return self._cast(
+            lo.x + ex, lo.y + ey, translation.x, translation.y, ex, ey,
+            max_fraction,
+            lambda obj, max_fraction: callback(
+                obj, shape, translation, max_fraction))
+
+    def _cast(self, px, py, dx, dy, ex, ey, max_distance, report):
+        """ Pass objects to `report(obj, max_distance)` in the order a ray
+            enters their boxes inflated by `ex`, `ey`.
+        """
+        buckets = self._buckets
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+
+        # (entry distance, is object, node key or node id)
+        heap = [(0.0, False, ROOT)]
+        last_result = None
+        visited, tested = 1, 0
+        while heap:
+            t, is_object, item = heapq.heappop(heap)
+            if t > max_distance:
+                break
+            if is_object:
+                tested += 1
+                obj = objects[item]
+                value = report(obj, max_distance)
+                if value is None:
+                    continue
+                last_result = obj
+                if value == 0:
+                    # Client has terminated the cast
+                    break
+                if value > 0:
+                    max_distance = value
+                continue
+            bucket = buckets.get(item, ())
+            children = self._children(item)
+            visited += len(bucket) + len(children)
+            for node in bucket:
+                t = ray_aabb_entry(
+                    px, py, dx, dy, min_x[node] - ex, min_y[node] - ey,
+                    max_x[node] + ex, max_y[node] + ey, max_distance)
+                if t is not None:
+                    heapq.heappush(heap, (t, True, node))
+            for child in children:
+                n_x1, n_y1, n_x2, n_y2 = self._loose_bounds(child)
+                t = ray_aabb_entry(
+                    px, py, dx, dy, n_x1 - ex, n_y1 - ey, n_x2 + ex,
+                    n_y2 + ey, max_distance)
+                if t is not None:
+                    heapq.heappush(heap, (t, False, child))
+        self._nodes_visited += visited
+        self._leaves_tested += tested
+        return last_result
+
+    def closest(self, point, k=None, max_distance=None, distance=None):
+        """ Iterate over objects nearest first, same as
+            `DynamicAABB.closest`. See `closest_items`.
+        """
+        for _, obj in self.closest_items(point, k, max_distance, distance):
+            yield obj
+
+    def closest_items(self, point, k=None, max_distance=None,
+                      distance=None):
+        """ Iterate over (distance, obj) pairs nearest first, same as
+            `DynamicAABB.closest_items`. Best-first search over loose node
+            bounds.
+        """
+        assert isinstance(point, Vector)
+        if not self._count or k == 0:
+            return
+        if max_distance is None:
+            max_distance = float("inf")
+        px, py = point.x, point.y
+        buckets = self._buckets
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+
+        def box_distance(x1, y1, x2, y2):
+            ddx = max(x1 - px, px - x2, 0)
+            ddy = max(y1 - py, py - y2, 0)
+            return math.sqrt(ddx * ddx + ddy * ddy)
+
+        # (distance, kind, node key or node id). Kind 0 are nodes, 1 objects
+        # measured by the AABB and 2 objects measured by `distance`
+        heap = [(0.0, 0, ROOT)]
+        found = 0
+        visited, tested = 1, 0
+        try:
+            while heap:
+                d, kind, item = heapq.heappop(heap)
+                if d > max_distance:
+                    return
+                if kind == 1:
+                    tested += 1
+                    if distance is not None:
+                        d = max(distance(objects[item], point), 0)
+                        heapq.heappush(heap, (d, 2, item))
+                        continue
+                if kind:
+                    yield d, objects[item]
+                    found += 1
+                    if found == k:
+                        return
+                    continue
+                bucket = buckets.get(item, ())
+                children = self._children(item)
+                visited += len(bucket) + len(children)
+                for node in bucket:
+                    d = box_distance(min_x[node], min_y[node],
+                                     max_x[node], max_y[node])
+                    if d <= max_distance:
+                        heapq.heappush(heap, (d, 1, node))
+                for child in children:
+                    d = box_distance(*self._loose_bounds(child))
+                    if d <= max_distance:
+                        heapq.heappush(heap, (d, 0, child))
+        finally:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
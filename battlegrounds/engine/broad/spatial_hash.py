@@ -0,0 +1,529 @@
+"""
+    Uniform grid broad phase. Space is split into square cells of
+    `cell_size`, and each object is registered in every cell its AABB
+    touches. Cells are kept in a dict by (column, row), so the grid has no
+    bounds and empty space costs nothing.
+
+    Works best if objects are about the size of a cell or smaller, like the
+    props of our maps. Then add, remove and move touch 1-4 cells and a query
+    only looks at the few cells around it, while a tree always pays for its
+    depth. Objects much larger than a cell are registered in a lot of cells,
+    so the cell size should be chosen close to the typical object size.
+
+    Raycasts walk the cells along the ray (see Amanatides, Woo "A Fast Voxel
+    Traversal Algorithm for Ray Tracing"), so the first hit is found without
+    looking at cells behind it.
+"""
+import heapq
+import math
+from array import array
+
+from engine.geometry.shapes.shape import BaseShape
+from engine.geometry.vector import EPSILON
+from engine.geometry import AABB, Vector
+
+from .abc import ABCBroadPhase
+from .utils import segment_bounds, ray_aabb_entry
+
+DEFAULT_CELL_SIZE = 8.0
+
+
+class SpatialHashGrid(ABCBroadPhase):
+    """ Same interface as `DynamicAABB`, including `margin` for fat
+        AABB's. Node ids are reused after removal.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, margin=0.0):
+        assert cell_size > 0
+        self._cell_size = cell_size
+        self._inv_cell_size = 1 / cell_size
+        self._margin = margin
+        # Per node data. Bounds of free nodes are not used
+        self._min_x = array("d")
+        self._min_y = array("d")
+        self._max_x = array("d")
+        self._max_y = array("d")
+        # Range of cells the node is registered in, inclusive
+        self._cell_x1 = array("l")
+        self._cell_y1 = array("l")
+        self._cell_x2 = array("l")
+        self._cell_y2 = array("l")
+        self._objects = []
+        self._alive = []
+        self._free = []
+        self._count = 0
+        # (column, row) -> array of node ids
+        self._cells = {}
+        # Range of cells, that were ever used. Lets raycasts stop once
+        # they leave the populated area
+        self._bounds = None
+
+    @classmethod
+    def from_items(cls, items, **kw):
+        """ Grid of (obj, aabb) pairs. Leaf of the i'th item gets node_id
+            `i`.
+        """
+        grid = cls(**kw)
+        for obj, aabb in items:
+            grid.add(obj, aabb)
+        return grid
+
+    @property
+    def cell_size(self):
+        return self._cell_size
+
+    @property
+    def margin(self):
+        return self._margin
+
+    def __len__(self):
+        return self._count
+
+    def get_height(self):
+        """ Grid is flat: 1 level if there are any objects """
+        return 1 if self._count else 0
+
+    def _check_node(self, node_id):
+        if not 0 <= node_id < len(self._alive) or not self._alive[node_id]:
+            raise KeyError(node_id)
+
+    def _cell(self, x, y):
+        inv = self._inv_cell_size
+        return int(math.floor(x * inv)), int(math.floor(y * inv))
+
+    def _cell_range(self, x1, y1, x2, y2):
+        inv = self._inv_cell_size
+        return (int(math.floor(x1 * inv)), int(math.floor(y1 * inv)),
+                int(math.floor(x2 * inv)), int(math.floor(y2 * inv)))
+
+    def _link(self, node_id, cx1, cy1, cx2, cy2):
+        cells = self._cells
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cells[cx, cy] = cell = array("l")
+                cell.append(node_id)
+        self._cell_x1[node_id] = cx1
+        self._cell_y1[node_id] = cy1
+        self._cell_x2[node_id] = cx2
+        self._cell_y2[node_id] = cy2
+
+        bounds = self._bounds
+        if bounds is None:
+            self._bounds = [cx1, cy1, cx2, cy2]
+        else:
+            bounds[0] = min(bounds[0], cx1)
+            bounds[1] = min(bounds[1], cy1)
+            bounds[2] = max(bounds[2], cx2)
+            bounds[3] = max(bounds[3], cy2)
+
+    def _unlink(self, node_id):
+        cells = self._cells
+        for cx in range(self._cell_x1[node_id], self._cell_x2[node_id] + 1):
+            for cy in range(
+                    self._cell_y1[node_id], self._cell_y2[node_id] + 1):
+                cell = cells[cx, cy]
+                # Swap-remove, order in a cell does not matter
+                index = cell.index(node_id)
+                last = cell.pop()
+                if index < len(cell):
+                    cell[index] = last
+                if not cell:
+                    del cells[cx, cy]
+
+    def _set_bounds(self, node_id, aabb):
+        margin = self._margin
+        self._min_x[node_id] = aabb.min.x - margin
+        self._min_y[node_id] = aabb.min.y - margin
+        self._max_x[node_id] = aabb.max.x + margin
+        self._max_y[node_id] = aabb.max.y + margin
+
+    def add(self, obj, shape_aabb):
+        if self._free:
+            node_id = self._free.pop()
+            self._objects[node_id] = obj
+            self._alive[node_id] = True
+        else:
+            node_id = len(self._alive)
+            for values in (self._min_x, self._min_y, self._max_x,
+                           self._max_y):
+                values.append(0.0)
+            for values in (self._cell_x1, self._cell_y1, self._cell_x2,
+                           self._cell_y2):
+                values.append(0)
+            self._objects.append(obj)
+            self._alive.append(True)
+        self._set_bounds(node_id, shape_aabb)
+        self._link(node_id, *self._cell_range(
+            self._min_x[node_id], self._min_y[node_id],
+            self._max_x[node_id], self._max_y[node_id]))
+        self._count += 1
+        return node_id
+
+    def remove(self, node_id):
+        self._check_node(node_id)
+        self._unlink(node_id)
+        self._objects[node_id] = None
+        self._alive[node_id] = False
+        self._free.append(node_id)
+        self._count -= 1
+        if not self._count:
+            self._bounds = None
+
+    def move(self, node_id, aabb, displacement=None):
+        """ Update bounds of the object. Returns True if it moved to other
+            cells. With a `margin` bounds are only updated once `aabb` leaves
+            the fat AABB. `displacement` is accepted for compatibility with
+            `DynamicAABB`, but not used.
+        """
+        self._check_node(node_id)
+        if self._margin:
+            lo, hi = aabb.min, aabb.max
+            if (self._min_x[node_id] <= lo.x and
+                    self._min_y[node_id] <= lo.y and
+                    hi.x <= self._max_x[node_id] and
+                    hi.y <= self._max_y[node_id]):
+                return False
+        self._set_bounds(node_id, aabb)
+        cell_range = self._cell_range(
+            self._min_x[node_id], self._min_y[node_id],
+            self._max_x[node_id], self._max_y[node_id])
+        if cell_range == (self._cell_x1[node_id], self._cell_y1[node_id],
+                          self._cell_x2[node_id], self._cell_y2[node_id]):
+            return False
+        self._unlink(node_id)
+        self._link(node_id, *cell_range)
+        return True
+
+    def get_fat_aabb(self, node_id):
+        self._check_node(node_id)
+        return AABB(Vector(self._min_x[node_id], self._min_y[node_id]),
+                    Vector(self._max_x[node_id], self._max_y[node_id]))
+
+    def get_object(self, node_id):
+        self._check_node(node_id)
+        return self._objects[node_id]
+
+    def quality(self):
+        """ How well `cell_size` fits the objects. A lot of cells per
+            object means objects are big for the grid, a lot of objects per
+            cell means they are crowded.
+        """
+        cells = len(self._cells)
+        entries = sum(len(cell) for cell in self._cells.values())
+        return {
+            "objects": self._count,
+            "cells": cells,
+            "cells_per_object": entries / self._count if self._count else 0.0,
+            "mean_per_cell": entries / cells if cells else 0.0,
+            "max_per_cell": max(map(len, self._cells.values()), default=0),
+        }
+
+    # Queries
+
+    def query(self, shape, callback=None, out=None):
+        """ Objects, whose fat AABB overlaps the bbox of `shape`. Same
+            `callback` and `out` semantics as `DynamicAABB.query`.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        return self._query_bounds(lo.x, lo.y, hi.x, hi.y, callback, out)
+
+    # Compatibility alias
+    query_shape = query
+
+    def query_point(self, point, callback=None, out=None):
+        """ Objects, whose fat AABB contains `point` """
+        assert isinstance(point, Vector)
+        return self._query_bounds(
+            point.x, point.y, point.x, point.y, callback, out)
+
+    def _query_bounds(self, x1, y1, x2, y2, callback, out):
+        if callback is None and out is None:
+            out = []
+        cells = self._cells
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        # Objects in many cells are found more than once. A single cell
+        # has no duplicates
+        seen = set() if cx1 != cx2 or cy1 != cy2 else None
+        visited = (cx2 - cx1 + 1) * (cy2 - cy1 + 1)
+        tested = 0
+        try:
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell is None:
+                        continue
+                    visited += len(cell)
+                    for node in cell:
+                        if x1 > max_x[node] or y1 > max_y[node] or \
+                                x2 < min_x[node] or y2 < min_y[node]:
+                            continue
+                        if seen is not None:
+                            if node in seen:
+                                continue
+                            seen.add(node)
+                        tested += 1
+                        if callback is None:
+                            out.append(objects[node])
+                        elif callback(objects[node]) is False:
+                            return False
+        finally:
+            self._nodes_visited += visited
+            self._leaves_tested += tested
+        return True if callback is not None else out
+
+    def raycast(self, point, direction, *, callback, max_distance=None):
+        """ Same callback protocol as `DynamicAABB.raycast`: return None to
+            skip the object, a distance to clip the ray at it or 0 to stop.
+            Cells are visited in ray order, so with a clipping callback the
+            walk stops at the first cell behind the closest hit.
+        """
+        assert abs(direction.length2() - 1) < EPSILON
+        if self._bounds is None:
+            return None
+        if max_distance is None:
+            max_distance = float("inf")
+
+        cs = self._cell_size
+        px, py = point.x, point.y
+        dx, dy = direction.x, direction.y
+        bx1, by1, bx2, by2 = self._bounds
+        # Skip the empty space before the populated cells
+        t = ray_aabb_entry(
+            px, py, dx, dy, bx1 * cs, by1 * cs, (bx2 + 1) * cs,
+            (by2 + 1) * cs, max_distance)
+        if t is None:
+            return None
+        cx, cy = self._cell(px + dx * t, py + dy * t)
+        cx = min(max(cx, bx1), bx2)
+        cy = min(max(cy, by1), by2)
+
+        if dx > 0:
+            step_x, t_next_x = 1, ((cx + 1) * cs - px) / dx
+            t_delta_x = cs / dx
+        elif dx < 0:
+            step_x, t_next_x = -1, (cx * cs - px) / dx
+            t_delta_x = -cs / dx
+        else:
+            step_x, t_next_x, t_delta_x = 0, float("inf"), 0
+        if dy > 0:
+            step_y, t_next_y = 1, ((cy + 1) * cs - py) / dy
+            t_delta_y = cs / dy
+        elif dy < 0:
+            step_y, t_next_y = -1, (cy * cs - py) / dy
+            t_delta_y = -cs / dy
+        else:
+            step_y, t_next_y, t_delta_y = 0, float("inf"), 0
+
+        cells = self._cells
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+        seen = set()
+        last_result = None
+        visited = tested = 0
+        stopped = False
+        while t <= max_distance and bx1 <= cx <= bx2 and by1 <= cy <= by2:
+            visited += 1
+            cell = cells.get((cx, cy))
+            if cell is not None:
+                for node in cell:
+                    if node in seen:
+                        continue
+                    seen.add(node)
+                    if ray_aabb_entry(
+                            px, py, dx, dy, min_x[node], min_y[node],
+                            max_x[node], max_y[node], max_distance) is None:
+                        continue
+                    tested += 1
+                    obj = objects[node]
+                    value = callback(obj, point, direction, max_distance)
+                    if value is None:
+                        continue
+                    last_result = obj
+                    if value == 0:
+                        # Client has terminated the raycast
+                        stopped = True
+                        break
+                    if value > 0:
+                        max_distance = value
+                if stopped:
+                    break
+            # Step to the neighbour cell, that the ray enters first
+            if t_next_x < t_next_y:
+                t = t_next_x
+                t_next_x += t_delta_x
+                cx += step_x
+            else:
+                t = t_next_y
+                t_next_y += t_delta_y
+                cy += step_y
+        self._nodes_visited += visited + len(seen)
+        self._leaves_tested += tested
+        return last_result
+
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0):
+        """ Same as `DynamicAABB.shape_cast`. Unlike `raycast` it does not
+            walk the cells: objects from all cells under the swept bbox are
+            passed to the callback in the order the sweep reaches them.
+            Movements are short compared to rays, so these are a few cells.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        if self._bounds is None:
+            return None
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        ex, ey = (hi.x - lo.x) * 0.5, (hi.y - lo.y) * 0.5
+        px, py = lo.x + ex, lo.y + ey
+        dx, dy = translation.x, translation.y
+        x1, y1, x2, y2 = segment_bounds(px, py, dx, dy, max_fraction)
+        cx1, cy1, cx2, cy2 = self._cell_range(
+            x1 - ex, y1 - ey, x2 + ex, y2 + ey)
+        bx1, by1, bx2, by2 = self._bounds
+
+        cells = self._cells
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        seen = set()
+        hits = []
+        visited = 0
+        for cx in range(max(cx1, bx1), min(cx2, bx2) + 1):
+            for cy in range(max(cy1, by1), min(cy2, by2) + 1):
+                visited += 1
+                for node in cells.get((cx, cy), ()):
+                    if node in seen:
+                        continue
+                    seen.add(node)
+                    t = ray_aabb_entry(
+                        px, py, dx, dy, min_x[node] - ex, min_y[node] - ey,
+                        max_x[node] + ex, max_y[node] + ey, max_fraction)
+                    if t is not None:
+                        hits.append((t, node))
+        hits.sort()
+
+        objects = self._objects
+        last_result = None
+        tested = 0
+        for t, node in hits:
+            if t > max_fraction:
+                break
+            tested += 1
+            obj = objects[node]
+            value = callback(obj, shape, translation, max_fraction)
+            if value is None:
+                continue
+            last_result = obj
+            if value == 0:
+                # Client has terminated the cast
+                break
+            if value > 0:
+                max_fraction = value
+        self._nodes_visited += visited + len(seen)
+        self._leaves_tested += tested
+        return last_result
+
+    def closest(self, point, k=None, max_distance=None, distance=None):
+        """ Iterate over objects nearest first, same as
+            `DynamicAABB.closest`. See `closest_items`.
+        """
+        for _, obj in self.closest_items(point, k, max_distance, distance):
+            yield obj
+
+    def closest_items(self, point, k=None, max_distance=None,
+                      distance=None):
+        """ Iterate over (distance, obj) pairs nearest first, same as
+            `DynamicAABB.closest_items`. Cells are scanned in growing
+            square rings around `point`, and an object is yielded once no
+            unscanned cell can hold anything closer.
+        """
+        assert isinstance(point, Vector)
+        if self._bounds is None or k == 0:
+            return
+        if max_distance is None:
+            max_distance = float("inf")
+        cs = self._cell_size
+        px, py = point.x, point.y
+        pcx, pcy = self._cell(px, py)
+        bx1, by1, bx2, by2 = self._bounds
+        # Rings past this one don't touch any populated cell
+        last_ring = max(pcx - bx1, bx2 - pcx, pcy - by1, by2 - pcy, 0)
+
+        cells = self._cells
+        min_x, min_y, max_x, max_y = \
+            self._min_x, self._min_y, self._max_x, self._max_y
+        objects = self._objects
+        heap = []
+        seen = set()
+        found = 0
+        ring = 0
+        visited = 0
+        try:
+            while True:
+                if ring <= last_ring:
+                    for cx, cy in _ring_cells(pcx, pcy, ring):
+                        visited += 1
+                        cell = cells.get((cx, cy))
+                        if cell is None:
+                            continue
+                        for node in cell:
+                            if node in seen:
+                                continue
+                            seen.add(node)
+                            if distance is None:
+                                ddx = max(
+                                    min_x[node] - px, px - max_x[node], 0)
+                                ddy = max(
+                                    min_y[node] - py, py - max_y[node], 0)
+                                d = math.sqrt(ddx * ddx + ddy * ddy)
+                            else:
+                                d = max(distance(objects[node], point), 0)
+                            if d <= max_distance:
+                                heapq.heappush(heap, (d, node))
+                    # Anything outside of scanned rings is at least this far
+                    bound = min(
+                        px - (pcx - ring) * cs, (pcx + ring + 1) * cs - px,
+                        py - (pcy - ring) * cs, (pcy + ring + 1) * cs - py)
+                    ring += 1
+                else:
+                    bound = float("inf")
+                while heap and heap[0][0] <= bound:
+                    d, node = heapq.heappop(heap)
+                    yield d, objects[node]
+                    found += 1
+                    if found == k:
+                        return
+                if bound == float("inf") or bound > max_distance:
+                    # Remaining candidates are all closer than the bound
+                    while heap:
+                        d, node = heapq.heappop(heap)
+                        yield d, objects[node]
+                        found += 1
+                        if found == k:
+                            return
+                    return
+        finally:
+            self._nodes_visited += visited + len(seen)
+            self._leaves_tested += len(seen)
+
+
+def _ring_cells(cx, cy, ring):
+    """ Cells on the border of the square of (2 * ring + 1) cells around
+        (cx, cy)
+    """
+    if ring == 0:
+        yield cx, cy
+        return
+    for x in range(cx - ring, cx + ring + 1):
+        yield x, cy - ring
+        yield x, cy + ring
+    for y in range(cy - ring + 1, cy + ring):
+        yield cx - ring, y
+        yield cx + ring, y
@@ -0,0 +1,306 @@
+""" Usage counters of a broad phase.
+
+    Stats are opt-in, same as in `IntersectionDispatcher`:
+
+        tree.enable_stats()
+        world.tick(dt)
+        metrics.send(tree.stats.snapshot())
+
+    `enable_stats` wraps the public methods of that one broad phase object
+    with counting versions (see `instrument`), and `disable_stats` removes
+    them, so without stats the plain class methods run and nothing is
+    timed. Traversals only keep local counts of the nodes and leaves they
+    check and add them to 2 integers of the broad phase once per call.
+    Wrappers attribute the difference to the query type.
+
+    Per query type (`query`, `query_point`, `raycast`, `raycast_many`,
+    `shape_cast` and `closest`) we count:
+
+        * calls
+        * nodes - bounds checks done, of tree nodes and leaves, grid cells
+          and objects in them or endpoints, depending on the broad phase
+        * leaves - objects passed on: to `out`, the callback, the
+          `distance` function or measured for `closest`
+        * results - objects returned or reported
+        * latency histogram
+
+    Inserts, removes, moves and reinserts are counted and turned into rates
+    per second. `snapshot` adds `quality()` of the broad phase, like SAH
+    cost and area ratio of `DynamicAABB`.
+
+    Queries from inside of callbacks are counted on their own and in the
+    node counts of the outer query.
+"""
+import functools
+import time
+
+QUERY_TYPES = ("query", "query_point", "raycast", "raycast_many",
+               "shape_cast", "closest")
+# Upper bounds of latency buckets are 1, 2, 4, ... 2 ** 19 microseconds,
+# the last bucket holds everything slower than that
+LATENCY_BUCKETS = 21
+
+
+class LatencyHistogram(object):
+    """ Counts of durations in power of 2 buckets of microseconds """
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * LATENCY_BUCKETS
+        # Seconds
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1e6).bit_length()
+        self.counts[min(bucket, LATENCY_BUCKETS - 1)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """ Upper bound of the bucket with the `percent` percentile, in
+            microseconds. None if nothing was added, inf for the last bucket
+        """
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = count * percent / 100.0
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                break
+        if bucket == LATENCY_BUCKETS - 1:
+            return float("inf")
+        return 2 ** bucket
+
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            "counts": list(self.counts),
+            "total": self.total,
+            "max": self.max,
+            "mean": self.total / count if count else 0.0,
+            "p50_us": self.percentile(50),
+            "p99_us": self.percentile(99),
+        }
+
+
+class QueryStats(object):
+
+    __slots__ = ("calls", "nodes", "leaves", "results", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.nodes = 0
+        self.leaves = 0
+        self.results = 0
+        self.latency = LatencyHistogram()
+
+    def snapshot(self):
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "results": self.results,
+            "nodes_per_call": self.nodes / calls,
+            "leaves_per_call": self.leaves / calls,
+            "latency": self.latency.snapshot(),
+        }
+
+    def __repr__(self):
+        return "QueryStats(calls={}, nodes={}, leaves={}, results={})".format(
+            self.calls, self.nodes, self.leaves, self.results)
+
+
+class BroadPhaseStats(object):
+
+    __slots__ = ("queries", "inserts", "removes", "moves", "reinserts",
+                 "started", "_owner")
+
+    def __init__(self, owner=None):
+        # Broad phase, that is asked for `quality()` in `snapshot`
+        self._owner = owner
+        self.reset()
+
+    def reset(self):
+        self.queries = {name: QueryStats() for name in QUERY_TYPES}
+        self.inserts = 0
+        self.removes = 0
+        # Calls to `move` and the ones, that changed the structure
+        self.moves = 0
+        self.reinserts = 0
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        """ All stats as a dict of plain values """
+        elapsed = time.monotonic() - self.started
+        per_second = 1.0 / elapsed if elapsed > 0 else 0.0
+        result = {
+            "elapsed": elapsed,
+            "inserts": self.inserts,
+            "removes": self.removes,
+            "moves": self.moves,
+            "reinserts": self.reinserts,
+            "insert_rate": self.inserts * per_second,
+            "remove_rate": self.removes * per_second,
+            "move_rate": self.moves * per_second,
+            "reinsert_rate": self.reinserts * per_second,
+            "queries": {
+                name: query.snapshot()
+                for name, query in self.queries.items()},
+        }
+        quality = getattr(self._owner, "quality", None)
+        if quality is not None:
+            result["quality"] = quality()
+        return result
+
+    def __repr__(self):
+        return ("BroadPhaseStats(inserts={}, removes={}, moves={}, "
+                "reinserts={}, queries={})").format(
+            self.inserts, self.removes, self.moves, self.reinserts,
+            {name: query.calls for name, query in self.queries.items()})
+
+
+def _counted_query(broad_phase, method, stats, count_results):
+    """ Wrapper for methods, that return their results at once """
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def counted(*args, **kw):
+        nodes, leaves = broad_phase._nodes_visited, broad_phase._leaves_tested
+        start = perf_counter()
+        res = method(*args, **kw)
+        stats.latency.add(perf_counter() - start)
+        stats.calls += 1
+        stats.nodes += broad_phase._nodes_visited - nodes
+        stats.leaves += broad_phase._leaves_tested - leaves
+        stats.results += count_results(res)
+        return res
+    return counted
+
+
+def _counted_volume_query(broad_phase, method, stats):
+    """ `query` and `query_point` return a list or report to a callback """
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def counted(shape, callback=None, out=None):
+        found = [0]
+        if callback is not None:
+            def counting_callback(obj, callback=callback):
+                found[0] += 1
+                return callback(obj)
+            size = 0
+        else:
+            counting_callback = None
+            size = len(out) if out is not None else 0
+        nodes, leaves = broad_phase._nodes_visited, broad_phase._leaves_tested
+        start = perf_counter()
+        res = method(shape, counting_callback, out)
+        stats.latency.add(perf_counter() - start)
+        stats.calls += 1
+        stats.nodes += broad_phase._nodes_visited - nodes
+        stats.leaves += broad_phase._leaves_tested - leaves
+        stats.results += found[0] if callback is not None else len(res) - size
+        return res
+    return counted
+
+
+def _counted_iterator(broad_phase, method, stats):
+    """ Lazy `closest`: only the time spent inside the iterator counts """
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def counted(*args, **kw):
+        nodes, leaves = broad_phase._nodes_visited, broad_phase._leaves_tested
+        spent = 0.0
+        found = 0
+        iterator = method(*args, **kw)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    spent += perf_counter() - start
+                found += 1
+                yield item
+        finally:
+            # Traversal adds up its counters, when it's closed
+            iterator.close()
+            stats.latency.add(spent)
+            stats.calls += 1
+            stats.nodes += broad_phase._nodes_visited - nodes
+            stats.leaves += broad_phase._leaves_tested - leaves
+            stats.results += found
+    return counted
+
+
+def _counted_update(method, stats, name):
+    @functools.wraps(method)
+    def counted(*args, **kw):
+        res = method(*args, **kw)
+        setattr(stats, name, getattr(stats, name) + 1)
+        return res
+    return counted
+
+
+def _counted_move(method, stats):
+    @functools.wraps(method)
+    def counted(*args, **kw):
+        changed = method(*args, **kw)
+        stats.moves += 1
+        if changed:
+            stats.reinserts += 1
+        return changed
+    return counted
+
+
+def _one_result(res):
+    return 0 if res is None else 1
+
+
+def _many_results(res):
+    return sum(1 for obj in res if obj is not None)
+
+
+def instrument(broad_phase, stats):
+    """ Replace public methods of `broad_phase` object with counting ones.
+        `closest_items` is wrapped instead of `closest`, if the broad phase
+        has it, as `closest` is based on it.
+    """
+    queries = stats.queries
+    wrappers = {}
+    for name in ("query", "query_point"):
+        wrappers[name] = _counted_volume_query(
+            broad_phase, getattr(broad_phase, name), queries[name])
+    if hasattr(broad_phase, "query_shape"):
+        wrappers["query_shape"] = wrappers["query"]
+    for name, count_results in (("raycast", _one_result),
+                                ("shape_cast", _one_result),
+                                ("raycast_many", _many_results)):
+        if hasattr(broad_phase, name):
+            wrappers[name] = _counted_query(
+                broad_phase, getattr(broad_phase, name), queries[name],
+                count_results)
+    closest = "closest_items" if hasattr(
+        broad_phase, "closest_items") else "closest"
+    wrappers[closest] = _counted_iterator(
+        broad_phase, getattr(broad_phase, closest), queries["closest"])
+    wrappers["add"] = _counted_update(broad_phase.add, stats, "inserts")
+    wrappers["remove"] = _counted_update(broad_phase.remove, stats, "removes")
+    wrappers["move"] = _counted_move(broad_phase.move, stats)
+    vars(broad_phase).update(wrappers)
+    return list(wrappers)
+
+
+def uninstrument(broad_phase, names):
+    """ Undo `instrument`, class methods are used again """
+    for name in names:
+        vars(broad_phase).pop(name, None)
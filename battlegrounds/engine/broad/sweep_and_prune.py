@@ -0,0 +1,554 @@
+"""
+    Sweep and prune (sort and sweep) broad phase, see David Baraff's thesis
+    "Dynamic Simulation of Non-Penetrating Rigid Bodies" or Pierre
+    Terdiman's "Sweep-and-prune" paper.
+
+    Min and max coordinates of all objects are kept in a sorted list per
+    axis. Two boxes overlap only if their intervals overlap on both axes, and
+    the overlap on an axis can only start or end when an endpoint of one box
+    passes an endpoint of the other in the sorted list. Objects move just a
+    bit between ticks, so after a move each endpoint is put back in place
+    with insertion sort, that only swaps with the few endpoints it passed,
+    and each swap updates the set of overlapping pairs:
+
+        * min of A moves left past max of B - intervals start to overlap,
+          the pair begins if boxes overlap on the other axis too
+        * max of A moves left past min of B - intervals don't overlap
+          anymore, the pair ends
+
+    (and the mirrored cases for moving right). So pairs are maintained
+    incrementally with the cost proportional to the movement, not to the
+    number of objects. It degrades if a lot of objects are lined up along an
+    axis and move along it, or on big jumps like teleports.
+
+    Queries have no hierarchy to descend, they scan the min endpoints of the
+    x axis between `query.min.x - largest width` and `query.max.x`.
+"""
+import heapq
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+from engine.geometry.shapes.shape import BaseShape
+from engine.geometry.vector import EPSILON
+from engine.geometry import AABB, Vector
+
+from .abc import ABCBroadPhase, PAIR_BEGIN, PAIR_PERSIST, PAIR_END
+from .utils import segment_bounds, ray_aabb_entry
+
+
+class SweepAndPrune(ABCBroadPhase):
+    """ Same interface as `DynamicAABB`, including `margin` for fat AABB's
+        and `update_pairs`. Node ids are reused after removal.
+
+        Endpoints are stored in 2 parallel arrays per axis: the coordinate
+        and `node_id * 2 + is_max`. On equal coordinates min endpoints go
+        first, so touching boxes overlap.
+    """
+
+    def __init__(self, margin=0.0):
+        self._margin = margin
+        # Per node data. Bounds of free nodes are not used
+        self._min = (array("d"), array("d"))
+        self._max = (array("d"), array("d"))
+        self._objects = []
+        self._alive = []
+        self._free = []
+        self._count = 0
+        # Sorted endpoints per axis
+        self._values = (array("d"), array("d"))
+        self._ends = (array("l"), array("l"))
+        # Largest size of a box on each axis, that was ever added. Queries
+        # start looking for min endpoints that far before the query box.
+        self._max_size = [0.0, 0.0]
+
+        # (node_a, node_b) -> (obj_a, obj_b) for overlapping nodes, where
+        # node_a < node_b
+        self._pairs = {}
+        # node_id -> set of node_id's it has pairs with
+        self._partners = {}
+        # (node_a, node_b) -> (obj_a, obj_b) as of the last `update_pairs`
+        self._reported = {}
+        # Reported pairs, that stopped overlapping since then
+        self._separated = set()
+        # Object pairs of removed nodes, to be reported as ended
+        self._ended = []
+
+    @classmethod
+    def from_items(cls, items, **kw):
+        """ Broad phase of (obj, aabb) pairs. Leaf of the i'th item gets
+            node_id `i`.
+        """
+        sap = cls(**kw)
+        for obj, aabb in items:
+            sap.add(obj, aabb)
+        return sap
+
+    @property
+    def margin(self):
+        return self._margin
+
+    @property
+    def pair_count(self):
+        return len(self._pairs)
+
+    def __len__(self):
+        return self._count
+
+    def get_height(self):
+        """ Lists are flat: 1 level if there are any objects """
+        return 1 if self._count else 0
+
+    def _check_node(self, node_id):
+        if not 0 <= node_id < len(self._alive) or not self._alive[node_id]:
+            raise KeyError(node_id)
+
+    def _set_bounds(self, node_id, aabb):
+        margin = self._margin
+        lo, hi = aabb.min, aabb.max
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        min_x[node_id] = lo.x - margin
+        min_y[node_id] = lo.y - margin
+        max_x[node_id] = hi.x + margin
+        max_y[node_id] = hi.y + margin
+        max_size = self._max_size
+        max_size[0] = max(max_size[0], max_x[node_id] - min_x[node_id])
+        max_size[1] = max(max_size[1], max_y[node_id] - min_y[node_id])
+
+    def _overlaps(self, a, b):
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        return not (min_x[a] > max_x[b] or min_y[a] > max_y[b] or
+                    max_x[a] < min_x[b] or max_y[a] < min_y[b])
+
+    def _find(self, axis, end, value):
+        """ Index of the endpoint `end` with coordinate `value` """
+        values, ends = self._values[axis], self._ends[axis]
+        index = bisect_left(values, value)
+        while ends[index] != end:
+            index += 1
+        return index
+
+    # Pairs
+
+    def _add_pair(self, a, b):
+        key = (a, b) if a < b else (b, a)
+        # Endpoints of a moving box can pass its own other endpoint
+        if a == b or key in self._pairs:
+            return
+        objects = self._objects
+        self._pairs[key] = objects[key[0]], objects[key[1]]
+        self._partners.setdefault(a, set()).add(b)
+        self._partners.setdefault(b, set()).add(a)
+
+    def _remove_pair(self, a, b):
+        key = (a, b) if a < b else (b, a)
+        if self._pairs.pop(key, None) is not None:
+            self._partners[a].discard(b)
+            self._partners[b].discard(a)
+            if key in self._reported:
+                self._separated.add(key)
+
+    def update_pairs(self, callback):
+        """ Report changes in the set of overlapping pairs since the last
+            call, same as `DynamicAABB.update_pairs`. Pairs are already up to
+            date after each `move`, this only compares them with the last
+            reported ones.
+        """
+        ended, self._ended = self._ended, []
+        for obj_a, obj_b in ended:
+            callback(PAIR_END, obj_a, obj_b)
+
+        pairs = self._pairs
+        reported = self._reported
+        for key, objects in reported.items():
+            if key not in pairs:
+                callback(PAIR_END, *objects)
+        for key, (obj_a, obj_b) in sorted(pairs.items()):
+            if key in reported:
+                callback(PAIR_PERSIST, obj_a, obj_b)
+            else:
+                callback(PAIR_BEGIN, obj_a, obj_b)
+        self._reported = dict(pairs)
+        self._separated.clear()
+
+    # Public API
+
+    def add(self, obj, shape_aabb):
+        if self._free:
+            node_id = self._free.pop()
+            self._objects[node_id] = obj
+            self._alive[node_id] = True
+        else:
+            node_id = len(self._alive)
+            for values in self._min + self._max:
+                values.append(0.0)
+            self._objects.append(obj)
+            self._alive.append(True)
+        self._set_bounds(node_id, shape_aabb)
+        self._count += 1
+
+        # Pairs with the new box, before it's in the lists
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        found = []
+        self._query_nodes(min_x[node_id], min_y[node_id],
+                          max_x[node_id], max_y[node_id], found)
+        for other in found:
+            self._add_pair(node_id, other)
+
+        # Binary search for the place, min endpoints before equal values
+        # and max endpoints after them
+        for axis in (0, 1):
+            values, ends = self._values[axis], self._ends[axis]
+            lo, hi = self._min[axis][node_id], self._max[axis][node_id]
+            index = bisect_left(values, lo)
+            values.insert(index, lo)
+            ends.insert(index, node_id * 2)
+            index = bisect_right(values, hi)
+            values.insert(index, hi)
+            ends.insert(index, node_id * 2 + 1)
+        return node_id
+
+    def remove(self, node_id):
+        self._check_node(node_id)
+        for axis in (0, 1):
+            values, ends = self._values[axis], self._ends[axis]
+            for end, bound in ((node_id * 2 + 1, self._max[axis]),
+                               (node_id * 2, self._min[axis])):
+                index = self._find(axis, end, bound[node_id])
+                del values[index]
+                del ends[index]
+
+        # Node id will be reused, so end the pairs right away
+        for other in self._partners.pop(node_id, ()):
+            self._partners[other].discard(node_id)
+            key = (node_id, other) if node_id < other else (other, node_id)
+            objects = self._pairs.pop(key)
+            if self._reported.pop(key, None) is not None:
+                self._ended.append(objects)
+        # Same for reported pairs, that separated since, or the pair of
+        # the node, that reuses the id, would look like a persisting one
+        for key in [key for key in self._separated if node_id in key]:
+            self._separated.discard(key)
+            objects = self._reported.pop(key, None)
+            if objects is not None:
+                self._ended.append(objects)
+
+        self._objects[node_id] = None
+        self._alive[node_id] = False
+        self._free.append(node_id)
+        self._count -= 1
+
+    def move(self, node_id, aabb, displacement=None):
+        """ Update bounds of the object and the pairs it's in. Returns True
+            if any endpoint changed its place in the lists. With a `margin`
+            bounds are only updated once `aabb` leaves the fat AABB.
+            `displacement` is accepted for compatibility with `DynamicAABB`,
+            but not used.
+        """
+        self._check_node(node_id)
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        if self._margin:
+            lo, hi = aabb.min, aabb.max
+            if (min_x[node_id] <= lo.x and min_y[node_id] <= lo.y and
+                    hi.x <= max_x[node_id] and hi.y <= max_y[node_id]):
+                return False
+
+        old = (min_x[node_id], min_y[node_id],
+               max_x[node_id], max_y[node_id])
+        self._set_bounds(node_id, aabb)
+        changed = False
+        for axis in (0, 1):
+            for end, bound, old_value in (
+                    (node_id * 2, self._min[axis], old[axis]),
+                    (node_id * 2 + 1, self._max[axis], old[axis + 2])):
+                value = bound[node_id]
+                if value == old_value:
+                    continue
+                index = self._find(axis, end, old_value)
+                self._values[axis][index] = value
+                changed |= self._sort_endpoint(axis, index)
+        return changed
+
+    def _sort_endpoint(self, axis, index):
+        """ Insertion sort step for the endpoint at `index`, which value was
+            just changed. Updates pairs for every endpoint it passes.
+            Returns True if the endpoint was moved.
+        """
+        values, ends = self._values[axis], self._ends[axis]
+        value, end = values[index], ends[index]
+        node, is_max = end >> 1, end & 1
+        start = index
+
+        # Move left
+        while index > 0:
+            prev_value, prev_end = values[index - 1], ends[index - 1]
+            if prev_value < value or (
+                    prev_value == value and (prev_end & 1) <= is_max):
+                break
+            other = prev_end >> 1
+            if is_max and not prev_end & 1:
+                # Max passed min of other: intervals are apart now
+                self._remove_pair(node, other)
+            elif not is_max and prev_end & 1:
+                # Min passed max of other: intervals overlap now
+                if self._overlaps(node, other):
+                    self._add_pair(node, other)
+            values[index], ends[index] = prev_value, prev_end
+            index -= 1
+
+        if index == start:
+            # Move right
+            last = len(values) - 1
+            while index < last:
+                next_value, next_end = values[index + 1], ends[index + 1]
+                if next_value > value or (
+                        next_value == value and (next_end & 1) >= is_max):
+                    break
+                other = next_end >> 1
+                if not is_max and next_end & 1:
+                    # Min passed max of other: intervals are apart now
+                    self._remove_pair(node, other)
+                elif is_max and not next_end & 1:
+                    # Max passed min of other: intervals overlap now
+                    if self._overlaps(node, other):
+                        self._add_pair(node, other)
+                values[index], ends[index] = next_value, next_end
+                index += 1
+
+        values[index], ends[index] = value, end
+        return index != start
+
+    def get_fat_aabb(self, node_id):
+        self._check_node(node_id)
+        return AABB(Vector(self._min[0][node_id], self._min[1][node_id]),
+                    Vector(self._max[0][node_id], self._max[1][node_id]))
+
+    def get_object(self, node_id):
+        self._check_node(node_id)
+        return self._objects[node_id]
+
+    def quality(self):
+        """ `window_ratio` is the scan window of queries (largest width ever
+            added) relative to the mean width of boxes. One big object
+            makes every query scan more endpoints.
+        """
+        min_x, max_x = self._min[0], self._max[0]
+        widths = [max_x[node] - min_x[node]
+                  for node, alive in enumerate(self._alive) if alive]
+        mean_width = sum(widths) / len(widths) if widths else 0.0
+        return {
+            "objects": self._count,
+            "pairs": len(self._pairs),
+            "window": self._max_size[0],
+            "window_ratio": (self._max_size[0] / mean_width
+                             if mean_width > 0 else 0.0),
+        }
+
+    # Queries
+
+    def query(self, shape, callback=None, out=None):
+        """ Objects, whose fat AABB overlaps the bbox of `shape`. Same
+            `callback` and `out` semantics as `DynamicAABB.query`.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        return self._query_bounds(lo.x, lo.y, hi.x, hi.y, callback, out)
+
+    # Compatibility alias
+    query_shape = query
+
+    def query_point(self, point, callback=None, out=None):
+        """ Objects, whose fat AABB contains `point` """
+        assert isinstance(point, Vector)
+        return self._query_bounds(
+            point.x, point.y, point.x, point.y, callback, out)
+
+    def _query_bounds(self, x1, y1, x2, y2, callback, out):
+        if callback is None and out is None:
+            out = []
+        found = []
+        self._query_nodes(x1, y1, x2, y2, found)
+        self._leaves_tested += len(found)
+        objects = self._objects
+        for node in found:
+            if callback is None:
+                out.append(objects[node])
+            elif callback(objects[node]) is False:
+                return False
+        return True if callback is not None else out
+
+    def _query_nodes(self, x1, y1, x2, y2, out):
+        """ Append ids of nodes overlapping the bounds to `out` """
+        values, ends = self._values[0], self._ends[0]
+        min_y = self._min[1]
+        max_x, max_y = self._max
+        start = bisect_left(values, x1 - self._max_size[0])
+        stop = bisect_right(values, x2)
+        self._nodes_visited += stop - start
+        for index in range(start, stop):
+            end = ends[index]
+            if end & 1:
+                continue
+            node = end >> 1
+            if max_x[node] < x1 or min_y[node] > y2 or max_y[node] < y1:
+                continue
+            out.append(node)
+
+    def raycast(self, point, direction, *, callback, max_distance=None):
+        """ Same callback protocol as `DynamicAABB.raycast`. Candidates are
+            all boxes in the x range of the ray, they are passed to the
+            callback in the order the ray enters them, so a clipping callback
+            stops the search right after the closest hit.
+        """
+        assert abs(direction.length2() - 1) < EPSILON
+        if not self._count:
+            return None
+        if max_distance is None:
+            max_distance = float("inf")
+
+        return self._cast(
+            point.x, point.y, direction.x, direction.y, 0.0, 0.0,
+            max_distance,
+            lambda obj, max_distance: callback(
+                obj, point, direction, max_distance))
+
+    def shape_cast(self, shape, translation, *, callback, max_fraction=1.0):
+        """ Same as `DynamicAABB.shape_cast`. Candidates are ordered like in
+            `raycast`, with boxes inflated by the extents of the shape.
+        """
+        if not isinstance(shape, BaseShape):
+            raise ValueError(shape)
+        if not self._count:
+            return None
+        shape_aabb = shape.bbox()
+        lo, hi = shape_aabb.min, shape_aabb.max
+        ex, ey = (hi.x - lo.x) * 0.5, (hi.y - lo.y) * 0.5
+        return self._cast(
+            lo.x + ex, lo.y + ey, translation.x, translation.y, ex, ey,
+            max_fraction,
+            lambda obj, max_fraction: callback(
+                obj, shape, translation, max_fraction))
+
+    def _cast(self, px, py, dx, dy, ex, ey, max_distance, report):
+        """ Pass objects to `report(obj, max_distance)` in the order a ray
+            enters their boxes inflated by `ex`, `ey`.
+        """
+        x1, y1, x2, y2 = segment_bounds(px, py, dx, dy, max_distance)
+        found = []
+        self._query_nodes(x1 - ex, y1 - ey, x2 + ex, y2 + ey, out=found)
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        hits = []
+        for node in found:
+            t = ray_aabb_entry(
+                px, py, dx, dy, min_x[node] - ex, min_y[node] - ey,
+                max_x[node] + ex, max_y[node] + ey, max_distance)
+            if t is not None:
+                hits.append((t, node))
+        hits.sort()
+
+        last_result = None
+        tested = 0
+        for t, node in hits:
+            if t > max_distance:
+                break
+            tested += 1
+            obj = self._objects[node]
+            value = report(obj, max_distance)
+            if value is None:
+                continue
+            last_result = obj
+            if value == 0:
+                # Client has terminated the cast
+                break
+            if value > 0:
+                max_distance = value
+        self._leaves_tested += tested
+        return last_result
+
+    def closest(self, point, k=None, max_distance=None, distance=None):
+        """ Iterate over objects nearest first, same as
+            `DynamicAABB.closest`. See `closest_items`.
+        """
+        for _, obj in self.closest_items(point, k, max_distance, distance):
+            yield obj
+
+    def closest_items(self, point, k=None, max_distance=None,
+                      distance=None):
+        """ Iterate over (distance, obj) pairs nearest first, same as
+            `DynamicAABB.closest_items`. Min endpoints of the x axis are
+            scanned outwards from `point` on both sides, and an object is
+            yielded once no unscanned endpoint can belong to anything
+            closer.
+        """
+        assert isinstance(point, Vector)
+        if not self._count or k == 0:
+            return
+        if max_distance is None:
+            max_distance = float("inf")
+        inf = float("inf")
+        px, py = point.x, point.y
+        values, ends = self._values[0], self._ends[0]
+        min_x, min_y = self._min
+        max_x, max_y = self._max
+        objects = self._objects
+        width = self._max_size[0]
+
+        heap = []
+        found = 0
+        right = bisect_left(values, px)
+        left = right - 1
+        tested = 0
+        try:
+            while True:
+                # Nodes with min endpoints beyond `left` and `right` are at
+                # least this far
+                left_bound = max(px - values[left] - width, 0) \
+                    if left >= 0 else inf
+                right_bound = max(values[right] - px, 0) \
+                    if right < len(values) else inf
+                bound = min(left_bound, right_bound)
+                while heap and heap[0][0] <= bound:
+                    d, node = heapq.heappop(heap)
+                    yield d, objects[node]
+                    found += 1
+                    if found == k:
+                        return
+                if bound > max_distance or bound == inf:
+                    # Remaining candidates are all closer than the bound
+                    while heap:
+                        d, node = heapq.heappop(heap)
+                        yield d, objects[node]
+                        found += 1
+                        if found == k:
+                            return
+                    return
+
+                if left_bound <= right_bound:
+                    end = ends[left]
+                    left -= 1
+                else:
+                    end = ends[right]
+                    right += 1
+                if end & 1:
+                    continue
+                node = end >> 1
+                if distance is None:
+                    ddx = max(min_x[node] - px, px - max_x[node], 0)
+                    ddy = max(min_y[node] - py, py - max_y[node], 0)
+                    d = math.sqrt(ddx * ddx + ddy * ddy)
+                else:
+                    d = max(distance(objects[node], point), 0)
+                tested += 1
+                if d <= max_distance:
+                    heapq.heappush(heap, (d, node))
+        finally:
+            # Endpoints scanned on both sides
+            self._nodes_visited += right - left - 1
+            self._leaves_tested += tested
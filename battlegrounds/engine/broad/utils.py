@@ -0,0 +1,31 @@
+""" Float helpers shared by broad phases. They work on plain coordinates,
+    as broad phases store bounds in flat arrays instead of AABB objects.
+"""
+
+
+def segment_bounds(px, py, dx, dy, max_distance):
+    """ Bounds of the segment from (px, py) along (dx, dy). Zero direction
+        components don't produce NaN for infinite `max_distance`.
+    """
+    ex = px + dx * max_distance if dx else px
+    ey = py + dy * max_distance if dy else py
+    return min(px, ex), min(py, ey), max(px, ex), max(py, ey)
+
+
+def ray_aabb_entry(px, py, dx, dy, x1, y1, x2, y2, max_distance):
+    """ Distance along the ray, at which it enters the box, or None if it
+        misses the box before `max_distance`. Slab test.
+    """
+    t_min, t_max = 0.0, max_distance
+    for p, d, lo, hi in ((px, dx, x1, x2), (py, dy, y1, y2)):
+        if d == 0:
+            if p < lo or p > hi:
+                return None
+            continue
+        t1, t2 = (lo - p) / d, (hi - p) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        t_min, t_max = max(t_min, t1), min(t_max, t2)
+        if t_min > t_max:
+            return None
+    return t_min
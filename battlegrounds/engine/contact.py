@@ -0,0 +1,98 @@
+""" Persistent contacts between pairs of objects.
+    Objects move just a bit between 2 ticks (if at all), so the contact
+    manifold of a pair barely changes. `ContactCache` remembers the last
+    manifold of each pair together with the relative position, that it was
+    computed for, and returns it as is while the pair moved less than
+    `threshold` since then. It also lets a solver look at the previous tick's
+    contact of a pair to warm-start from it.
+
+    Example:
+
+        contacts = ContactCache()
+        for tick in ticks:
+            for prop in candidates:
+                manifold = contacts.collide(
+                    (prop, actor), actor.shape,
+                    actor.position - prop.position, prop.shape)
+            contacts.step()
+
+    Reused manifolds may be off by up to `threshold` in depth and contact
+    points, so keep it well below the sizes a solver cares about.
+"""
+
+# Relative motion (in world units), below which the manifold is reused
+CONTACT_MOTION_THRESHOLD = 0.01
+
+
+class Contact(object):
+
+    __slots__ = ("manifold", "position", "tick")
+
+    def __init__(self, manifold, position, tick):
+        # Last computed manifold, None if the pair did not touch
+        self.manifold = manifold
+        # Relative position of the pair, that `manifold` was computed for
+        self.position = position
+        # Last tick the pair was tested
+        self.tick = tick
+
+    def __repr__(self):
+        return "Contact({}, position={}, tick={})".format(
+            self.manifold, self.position, self.tick)
+
+
+class ContactCache(object):
+
+    def __init__(self, threshold=CONTACT_MOTION_THRESHOLD, max_age=1):
+        self._threshold2 = threshold ** 2
+        # Pairs not tested for more than `max_age` ticks are forgotten
+        self._max_age = max_age
+        self._contacts = {}
+        self._tick = 0
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def __contains__(self, key):
+        return key in self._contacts
+
+    def get(self, key):
+        """ Last `Contact` of the pair or None. Use it to warm-start """
+        return self._contacts.get(key)
+
+    def collide(self, key, shape, position, other):
+        """ Intersect `shape` placed at `position` with `other`, where
+            `position` is relative to `other`'s coordinate system. Returns the
+            manifold (or None), same as `shape.intersects(other)`. The
+            manifold is only recomputed if the pair moved by more than
+            `threshold` since the last computation.
+        """
+        contact = self._contacts.get(key)
+        if contact is not None:
+            contact.tick = self._tick
+            if contact.position.distance2(position) <= self._threshold2:
+                return contact.manifold
+            manifold = shape.translate(position).intersects(other)
+            contact.manifold = manifold
+            contact.position = position
+            return manifold
+        manifold = shape.translate(position).intersects(other)
+        self._contacts[key] = Contact(manifold, position, self._tick)
+        return manifold
+
+    def step(self):
+        """ Advance to the next tick and drop pairs, that were not tested
+            recently. Call once per simulation tick.
+        """
+        self._tick += 1
+        oldest = self._tick - self._max_age
+        stale = [key for key, contact in self._contacts.items()
+                 if contact.tick < oldest]
+        for key in stale:
+            del self._contacts[key]
+
+    def remove(self, key):
+        self._contacts.pop(key, None)
+
+    def clear(self):
+        self._contacts.clear()
@@ -1,13 +1,20 @@
 from .shapes.aabb import AABB
+from .shapes.aabb_array import AABBArray
 from .shapes.circle import Circle
 from .shapes.polygon import Polygon, Triangle, classify_polygon
+from .shapes.sweeps import SweptCircle, SweptPolygon
 from .vector import Vector
+from .vector_array import VectorArray
 
 __all__ = [
     "AABB",
+    "AABBArray",
     "Vector",
+    "VectorArray",
     "Circle",
     "Triangle",
     "Polygon",
+    "SweptCircle",
+    "SweptPolygon",
     "classify_polygon"
 ]
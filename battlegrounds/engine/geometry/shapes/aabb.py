@@ -1,8 +1,11 @@
 import math
 
-from .shape import BaseIntersection, BaseShape
+import numpy as np
+
+from .shape import BaseIntersection, BaseShape, as_rays
 from ..utils import orient
 from ..vector import EPSILON, Vector
+from ..vector_array import VectorArray, as_points
 
 
 class AABBIntersection(BaseIntersection):
@@ -115,16 +118,12 @@ class AABB(BaseShape):
     def distance(self, other):
         return math.sqrt(self.distance2(other))
 
-    def intersects(self, other):
-        if isinstance(other, AABB):
-            return intersect_aabb_aabb(self, other)
-        elif isinstance(other, Circle):
-            return intersect_aabb_circle(self, other)
-        elif isinstance(other, Polygon):
-            return intersect_aabb_polygon(self, other)
-        elif isinstance(other, Triangle):
-            return intersect_aabb_triangle(self, other)
-        raise ValueError(other)
+    def overlaps(self, other):
+        """ Plain boolean AABB vs AABB test. Touching boxes overlap. Broad
+            phases only need this answer, so don't build a manifold for it.
+        """
+        return not (other._min.x > self._max.x or other._min.y > self._max.y or
+                    other._max.x < self._min.x or other._max.y < self._min.y)
 
     def raycast(self, point, direction):
         tmin = 0
@@ -142,6 +141,9 @@ class AABB(BaseShape):
                 tmax = t2
             if tmin > tmax:
                 return None
+        elif point.x < self._min.x or point.x > self._max.x:
+            # Parallel to X slab and outside of it
+            return None
         # Check Y slab
         if math.fabs(direction.y) > EPSILON:
             ood = 1.0 / direction.y
@@ -155,11 +157,38 @@ class AABB(BaseShape):
                 tmax = t2
             if tmin > tmax:
                 return None
+        elif point.y < self._min.y or point.y > self._max.y:
+            return None
 
         return tmin
 
     time_of_impact = raycast
 
+    def raycast_many(self, origins, directions, max_distance=None):
+        """ Vectorized slab test, same as `raycast` for a batch of rays
+        """
+        p, d, max_distance = as_rays(origins, directions, max_distance)
+        n = len(p)
+        tmin = np.zeros(n)
+        tmax = np.full(n, np.inf)
+        miss = np.zeros(n, dtype=bool)
+        bounds = ((self._min.x, self._max.x), (self._min.y, self._max.y))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for axis, (lo, hi) in enumerate(bounds):
+                pa, da = p[:, axis], d[:, axis]
+                parallel = np.fabs(da) <= EPSILON
+                # Parallel rays miss if they start outside of the slab
+                miss |= parallel & ((pa < lo) | (pa > hi))
+                ood = 1.0 / da
+                t1 = (lo - pa) * ood
+                t2 = (hi - pa) * ood
+                t1, t2 = np.minimum(t1, t2), np.maximum(t1, t2)
+                tmin = np.where(parallel, tmin, np.maximum(tmin, t1))
+                tmax = np.where(parallel, tmax, np.minimum(tmax, t2))
+        miss |= (tmin > tmax) | (tmin > max_distance)
+        tmin[miss] = np.nan
+        return tmin
+
     def _closest_point(self, point):
         p_x, p_y = point.x, point.y
         if p_x < self._min.x:
@@ -174,6 +203,40 @@ class AABB(BaseShape):
 
     closest_point = _closest_point
 
+    def contains_many(self, points):
+        points = as_points(points)
+        x, y = points[:, 0], points[:, 1]
+        return (x >= self._min.x) & (x <= self._max.x) & \
+            (y >= self._min.y) & (y <= self._max.y)
+
+    def closest_point_many(self, points):
+        points = as_points(points)
+        return VectorArray(np.clip(
+            points, (self._min.x, self._min.y), (self._max.x, self._max.y)))
+
+    def distance_many(self, points):
+        """ Same as `distance`: 0 for points inside or on the border """
+        points = as_points(points)
+        c = self.center
+        ext = self.extents
+        dx = np.maximum(np.fabs(points[:, 0] - c.x) - ext.x, 0)
+        dy = np.maximum(np.fabs(points[:, 1] - c.y) - ext.y, 0)
+        return np.hypot(dx, dy)
+
+    def support(self, direction):
+        """ Corner furthest along `direction` """
+        return Vector(
+            self._max.x if direction.x > 0 else self._min.x,
+            self._max.y if direction.y > 0 else self._min.y)
+
+    def _extent(self, nx, ny):
+        """ (min, max) projection of the box on axis (nx, ny) """
+        c = nx * (self._min.x + self._max.x) * 0.5 + \
+            ny * (self._min.y + self._max.y) * 0.5
+        r = math.fabs(nx) * (self._max.x - self._min.x) * 0.5 + \
+            math.fabs(ny) * (self._max.y - self._min.y) * 0.5
+        return c - r, c + r
+
     def union(self, other):
         """ Combine 2 AABB's to produce one, that contains both
         """
@@ -185,6 +248,14 @@ class AABB(BaseShape):
         max_y = max(max1.y, max2.y)
         return AABB(Vector(min_x, min_y), Vector(max_x, max_y))
 
+    def contains_aabb(self, other):
+        """ Check if `other` AABB is fully inside this one (border included)
+        """
+        return (self._min.x <= other._min.x and
+                self._min.y <= other._min.y and
+                other._max.x <= self._max.x and
+                other._max.y <= self._max.y)
+
     def area(self):
         return (self._max.x - self._min.x) * (self._max.y - self.min.y)
 
@@ -199,10 +270,4 @@ class AABB(BaseShape):
 
 # Circular import
 from .circle import Circle  # noqa
-from .polygon import Polygon, Triangle  # noqa
-from .intersection import (  # noqa
-    intersect_aabb_aabb,
-    intersect_aabb_circle,
-    intersect_aabb_triangle,
-    intersect_aabb_polygon
-)
+from . import intersection  # noqa  Registers intersection functions
@@ -0,0 +1,197 @@
+""" Structure-of-arrays container for many AABB's.
+    Bounds are stored as one contiguous (4, N) float64 array with rows
+    `min_x`, `min_y`, `max_x`, `max_y`, so every row is itself a contiguous
+    1D array. All operations are performed on the whole batch at once, which
+    makes broad phase candidate filtering and insertion cost evaluation a
+    couple of NumPy calls instead of a Python loop over `AABB` objects.
+
+    Example:
+
+        boxes = AABBArray.from_aabbs([prop.shape.bbox() for prop in props])
+        mask = boxes.intersects(query_aabb)
+        candidates = [prop for prop, hit in zip(props, mask) if hit]
+"""
+import numpy as np
+
+from .aabb import AABB
+from ..vector import Vector
+from ..vector_array import VectorArray, as_points
+
+
+class AABBArray(object):
+
+    __slots__ = ("_data", )
+
+    def __init__(self, data):
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.size == 0:
+            data = data.reshape(4, 0)
+        if data.ndim != 2 or data.shape[0] != 4:
+            raise ValueError("Expected a (4, N) array, got shape {}".format(
+                data.shape))
+        self._data = data
+
+    @classmethod
+    def from_aabbs(cls, aabbs):
+        return cls(np.array(
+            [(a.min.x, a.min.y, a.max.x, a.max.y) for a in aabbs],
+            dtype=np.float64).reshape(-1, 4).T)
+
+    @classmethod
+    def from_min_max(cls, mins, maxs):
+        mins, maxs = as_points(mins), as_points(maxs)
+        return cls(np.vstack((mins.T, maxs.T)))
+
+    def to_aabbs(self):
+        return [AABB(Vector(x1, y1), Vector(x2, y2))
+                for x1, y1, x2, y2 in self._data.T.tolist()]
+
+    @property
+    def data(self):
+        """ Underlying (4, N) ndarray. Mutating it mutates this array """
+        return self._data
+
+    @property
+    def min_x(self):
+        return self._data[0]
+
+    @property
+    def min_y(self):
+        return self._data[1]
+
+    @property
+    def max_x(self):
+        return self._data[2]
+
+    @property
+    def max_y(self):
+        return self._data[3]
+
+    @property
+    def min(self):
+        return VectorArray(self._data[:2].T)
+
+    @property
+    def max(self):
+        return VectorArray(self._data[2:].T)
+
+    @property
+    def center(self):
+        d = self._data
+        return VectorArray.from_xy((d[0] + d[2]) * 0.5, (d[1] + d[3]) * 0.5)
+
+    @property
+    def extents(self):
+        d = self._data
+        return VectorArray.from_xy((d[2] - d[0]) * 0.5, (d[3] - d[1]) * 0.5)
+
+    def __len__(self):
+        return self._data.shape[1]
+
+    def __iter__(self):
+        return iter(self.to_aabbs())
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            x1, y1, x2, y2 = self._data[:, index].tolist()
+            return AABB(Vector(x1, y1), Vector(x2, y2))
+        return AABBArray(self._data[:, index])
+
+    def __repr__(self):
+        return "AABBArray({})".format(self.to_aabbs())
+
+    def copy(self):
+        return AABBArray(self._data.copy())
+
+    def bounds(self):
+        """ Single AABB enclosing all boxes in this array or None if the
+            array is empty
+        """
+        d = self._data
+        if d.shape[1] == 0:
+            return None
+        return AABB(Vector(d[0].min(), d[1].min()),
+                    Vector(d[2].max(), d[3].max()))
+
+    @staticmethod
+    def _bounds_of(other):
+        """ Rows of `other` as 4 scalars (for AABB) or 4 arrays """
+        if isinstance(other, AABB):
+            return other.min.x, other.min.y, other.max.x, other.max.y
+        if isinstance(other, AABBArray):
+            return other._data
+        raise ValueError(other)
+
+    def area(self):
+        d = self._data
+        return (d[2] - d[0]) * (d[3] - d[1])
+
+    def intersects(self, other):
+        """ One-vs-many (`other` is AABB) or pairwise (`other` is an AABBArray
+            of the same length) overlap test. Touching boxes overlap, same as
+            in `intersect_aabb_aabb`. Returns a boolean mask.
+        """
+        x1, y1, x2, y2 = self._bounds_of(other)
+        d = self._data
+        return (x1 <= d[2]) & (y1 <= d[3]) & (x2 >= d[0]) & (y2 >= d[1])
+
+    def intersects_many(self, other):
+        """ Many-vs-many overlap test. Returns an (N, M) boolean matrix, where
+            `result[i, j]` tells if `self[i]` overlaps `other[j]`.
+        """
+        if isinstance(other, AABB):
+            other = AABBArray.from_aabbs([other])
+        a, b = self._data[:, :, None], other._data[:, None, :]
+        return (b[0] <= a[2]) & (b[1] <= a[3]) & \
+            (b[2] >= a[0]) & (b[3] >= a[1])
+
+    def union(self, other):
+        """ Boxes containing both `self[i]` and `other` (or `other[i]`) """
+        x1, y1, x2, y2 = self._bounds_of(other)
+        d = self._data
+        return AABBArray(np.vstack((
+            np.minimum(d[0], x1), np.minimum(d[1], y1),
+            np.maximum(d[2], x2), np.maximum(d[3], y2))))
+
+    def union_area(self, other):
+        """ Same as `self.union(other).area()`, without building the boxes.
+            This is the inner term of insertion cost evaluation.
+        """
+        x1, y1, x2, y2 = self._bounds_of(other)
+        d = self._data
+        return (np.maximum(d[2], x2) - np.minimum(d[0], x1)) * \
+            (np.maximum(d[3], y2) - np.minimum(d[1], y1))
+
+    def contains(self, point):
+        """ Mask of boxes containing `point` (border included) """
+        assert isinstance(point, Vector)
+        d = self._data
+        x, y = point.x, point.y
+        return (d[0] <= x) & (x <= d[2]) & (d[1] <= y) & (y <= d[3])
+
+    def contains_aabb(self, other):
+        """ Mask of boxes that fully enclose `other` (or `other[i]`) """
+        x1, y1, x2, y2 = self._bounds_of(other)
+        d = self._data
+        return (d[0] <= x1) & (d[1] <= y1) & (x2 <= d[2]) & (y2 <= d[3])
+
+    def translate(self, position):
+        """ Move all boxes by a `Vector` or each box by its own vector from a
+            `VectorArray`.
+        """
+        if isinstance(position, Vector):
+            dx, dy = position.x, position.y
+        else:
+            offset = as_points(position)
+            dx, dy = offset[:, 0], offset[:, 1]
+        d = self._data
+        return AABBArray(np.vstack((
+            d[0] + dx, d[1] + dy, d[2] + dx, d[3] + dy)))
+
+    def inflate(self, dx, dy=None):
+        """ Grow all boxes by `dx`, `dy` (scalars or arrays of N values) """
+        if dy is None:
+            dy = dx
+        d = self._data
+        return AABBArray(np.vstack((
+            d[0] - dx, d[1] - dy, d[2] + dx, d[3] + dy)))
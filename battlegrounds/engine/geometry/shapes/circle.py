@@ -1,8 +1,11 @@
 import math
 
-from .shape import BaseIntersection, BaseShape
+import numpy as np
+
+from .shape import BaseIntersection, BaseShape, as_rays
 from ..utils import orient
-from ..vector import Vector
+from ..vector import EPSILON, Vector
+from ..vector_array import VectorArray, as_points
 
 
 class CircleIntersection(BaseIntersection):
@@ -79,7 +82,7 @@ class Circle(BaseShape):
     def contains(self, other):
         assert isinstance(other, Vector)
         dist2 = other.distance2(self._c)
-        r2 = self._r ** self._r
+        r2 = self._r ** 2
         if dist2 > r2:
             return False
         return True
@@ -91,20 +94,34 @@ class Circle(BaseShape):
             return dist - self._r
         return -1
 
-    def intersects(self, other):
-        assert isinstance(other, BaseShape)
-        if isinstance(other, Circle):
-            return intersect_circle_circle(self, other)
-        if isinstance(other, AABB):
-            res = intersect_aabb_circle(other, self)
-            if res is not None:
-                res.inverse()
-            return res
-        if isinstance(other, Triangle):
-            return intersect_circle_triangle(self, other)
-        if isinstance(other, Polygon):
-            return intersect_circle_polygon(self, other)
-        raise ValueError(other)
+    def closest_point(self, other):
+        assert isinstance(other, Vector)
+        d = other - self._c
+        dist = d.length()
+        if dist <= self._r:
+            return other
+        return self._c + d * (self._r / dist)
+
+    def _center_offsets(self, points):
+        points = as_points(points)
+        offsets = points - (self._c.x, self._c.y)
+        return points, offsets, np.hypot(offsets[:, 0], offsets[:, 1])
+
+    def contains_many(self, points):
+        _, _, dist = self._center_offsets(points)
+        return dist <= self._r
+
+    def closest_point_many(self, points):
+        points, offsets, dist = self._center_offsets(points)
+        outside = dist > self._r
+        closest = points.copy()
+        closest[outside] = (self._c.x, self._c.y) + \
+            offsets[outside] * (self._r / dist[outside])[:, None]
+        return VectorArray(closest)
+
+    def distance_many(self, points):
+        _, _, dist = self._center_offsets(points)
+        return np.where(dist >= self._r, dist - self._r, -1.0)
 
     def raycast(self, point, direction):
         m = point - self._c
@@ -126,7 +143,39 @@ class Circle(BaseShape):
             t = 0
         return t
 
-    time_of_impact = raycast
+    def time_of_impact(self, point, movement):
+        """ Same as `raycast`, but `movement` does not need to be a unit
+            vector. Returns the fraction of `movement` before the point
+            touches the circle (may be above 1) or None.
+        """
+        length = movement.length()
+        if length < EPSILON:
+            return 0 if self.contains(point) else None
+        t = self.raycast(point, movement * (1 / length))
+        if t is None:
+            return None
+        return t / length
+
+    def raycast_many(self, origins, directions, max_distance=None):
+        """ Vectorized `raycast`. Directions need not be unit vectors here,
+            so we solve the full (d·d)t^2 + 2(m·d)t + (m·m)−r2 = 0
+        """
+        p, d, max_distance = as_rays(origins, directions, max_distance)
+        mx, my = p[:, 0] - self._c.x, p[:, 1] - self._c.y
+        dx, dy = d[:, 0], d[:, 1]
+        a = dx * dx + dy * dy
+        b = mx * dx + my * dy
+        c = mx * mx + my * my - self._r ** 2
+        discr = b * b - a * c
+        # Same fast exit as in `raycast` plus missing rays
+        miss = ((c > 0) & (b > 0)) | (discr < 0) | (a == 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = (-b - np.sqrt(discr)) / a
+        # Ray started inside sphere
+        t = np.maximum(t, 0)
+        miss |= t > max_distance
+        t[miss] = np.nan
+        return t
 
     def translate(self, position):
         return Circle(self._c + position, self._r)
@@ -134,10 +183,4 @@ class Circle(BaseShape):
 
 # Circular import
 from .aabb import AABB  # noqa
-from .polygon import Polygon, Triangle  # noqa
-from .intersection import (  # noqa
-    intersect_circle_circle,
-    intersect_aabb_circle,
-    intersect_circle_triangle,
-    intersect_circle_polygon
-)
+from . import intersection  # noqa  Registers intersection functions
@@ -0,0 +1,158 @@
+""" Dispatch of shape pairs to intersection functions.
+    Each pair of shape types maps to one `intersect_x_y(a, b)` function in a
+    dict keyed by (type(a), type(b)), so `a.intersects(b)` is a single
+    lookup instead of a chain of isinstance checks.
+
+    Registering a function for (A, B) also covers (B, A): the reversed pair
+    calls it with swapped arguments and inverts the manifold, so the normal
+    still points from the second argument to the first. New shape types
+    register their own pairs:
+
+        register_intersection(Capsule, Circle, intersect_capsule_circle)
+
+    Subclasses without own registrations fall back to the functions of their
+    base classes. The resolved function is then stored for the concrete
+    types, so the fallback is only paid once.
+
+    Stats mode counts calls, hits (non-None results) and total time per
+    pair, to see which narrow phase pairs dominate a tick:
+
+        dispatcher.enable_stats()
+        world.tick(dt)
+        for (a, b), stats in dispatcher.stats.items():
+            print(a.__name__, b.__name__, stats)
+
+    With stats disabled the dispatch table holds plain functions, so there's
+    no overhead at all.
+"""
+import time
+
+
+class PairStats(object):
+
+    __slots__ = ("calls", "hits", "time")
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        # Cumulative time spent in the function, seconds
+        self.time = 0.0
+
+    def __repr__(self):
+        return "PairStats(calls={}, hits={}, time={:.6f})".format(
+            self.calls, self.hits, self.time)
+
+
+def _reversed(func):
+    def intersect_reversed(a, b):
+        res = func(b, a)
+        if res is not None:
+            res.inverse()
+        return res
+    intersect_reversed.__name__ = func.__name__ + "_reversed"
+    return intersect_reversed
+
+
+def _counted(func, stats):
+    perf_counter = time.perf_counter
+
+    def intersect_counted(a, b):
+        start = perf_counter()
+        res = func(a, b)
+        stats.time += perf_counter() - start
+        stats.calls += 1
+        if res is not None:
+            stats.hits += 1
+        return res
+    return intersect_counted
+
+
+class IntersectionDispatcher(object):
+
+    def __init__(self):
+        # Functions as registered (and reversed ones), by type pair
+        self._registry = {}
+        # Lookup table used by `intersect`. Same as `_registry` plus
+        # resolved subclass pairs, wrapped with counters in stats mode
+        self._table = {}
+        self._stats = None
+
+    def register(self, type_a, type_b, func):
+        """ Use `func(a, b)` for (type_a, type_b) pairs and the inverted
+            result of `func(b, a)` for (type_b, type_a), unless the reversed
+            pair has its own function.
+        """
+        registry = self._registry
+        registry[type_a, type_b] = func
+        if type_a is not type_b:
+            reverse = registry.get((type_b, type_a))
+            if reverse is None or getattr(reverse, "_auto_reversed", False):
+                reverse = _reversed(func)
+                reverse._auto_reversed = True
+                registry[type_b, type_a] = reverse
+        # Resolved subclass pairs may be stale now
+        self._rebuild()
+
+    def lookup(self, type_a, type_b):
+        """ Function for the pair, looking through base classes if the
+            exact pair is not registered. Raises ValueError for unknown pairs.
+        """
+        func = self._table.get((type_a, type_b))
+        if func is None:
+            func = self._resolve(type_a, type_b)
+        return func
+
+    def _resolve(self, type_a, type_b):
+        registry = self._registry
+        for base_a in type_a.__mro__:
+            for base_b in type_b.__mro__:
+                func = registry.get((base_a, base_b))
+                if func is not None:
+                    self._table[type_a, type_b] = self._wrap(
+                        func, type_a, type_b)
+                    return self._table[type_a, type_b]
+        raise ValueError((type_a, type_b))
+
+    def __call__(self, a, b):
+        """ Intersect 2 shapes. Returns None or manifold object """
+        try:
+            func = self._table[type(a), type(b)]
+        except KeyError:
+            func = self._resolve(type(a), type(b))
+        return func(a, b)
+
+    def _wrap(self, func, type_a, type_b):
+        if self._stats is None:
+            return func
+        stats = self._stats.setdefault((type_a, type_b), PairStats())
+        return _counted(func, stats)
+
+    def _rebuild(self):
+        self._table = {
+            pair: self._wrap(func, *pair)
+            for pair, func in self._registry.items()}
+
+    @property
+    def stats(self):
+        """ Dict of (type_a, type_b) -> `PairStats` or None if disabled """
+        return self._stats
+
+    def enable_stats(self):
+        if self._stats is None:
+            self._stats = {}
+            self._rebuild()
+
+    def disable_stats(self):
+        if self._stats is not None:
+            self._stats = None
+            self._rebuild()
+
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats.clear()
+            self._rebuild()
+
+
+dispatcher = IntersectionDispatcher()
+register_intersection = dispatcher.register
+intersect = dispatcher
@@ -0,0 +1,465 @@
+""" GJK distance and EPA penetration for any pair of convex shapes.
+
+    Both algorithms work only on support functions of the shapes, so a single
+    implementation covers Circle, AABB, Triangle and Polygon, as well as any
+    future convex shape, that can be converted to a `DistanceProxy`.
+
+    GJK implementation follows Box2D's b2Distance (which is described in
+    Erin Catto's "Computing Distance" GDC 2010 talk):
+
+        https://github.com/erincatto/Box2D/blob/master/Box2D/Box2D/Collision/b2Distance.cpp
+
+    Rounded shapes (circles) are represented as a core point set plus a
+    radius. GJK runs on cores only, which converges in a few iterations even
+    for circles, and the radii are applied afterwards.
+
+    EPA (Expanding Polytope Algorithm) is used when cores overlap. It expands
+    the last GJK simplex towards the boundary of the Minkowski difference to
+    find the minimum translation, that separates the shapes. See "Real Time
+    Collision Detection" or Gino van den Bergen's "Collision Detection in
+    Interactive 3D Environments".
+
+    Example:
+
+        cache = SimplexCache()
+        for tick in ticks:
+            # Warm-started from last tick's simplex, usually 1-2 iterations
+            out = gjk_distance(a, b, simplex_cache=cache)
+            if out.distance == 0:
+                depth, normal = gjk_penetration(a, b, simplex_cache=cache)
+"""
+import math
+from collections import namedtuple
+
+from .aabb import AABB
+from .circle import Circle
+from .polygon import ConvexShape
+from ..vector import EPSILON, Vector
+
+GJK_MAX_ITERATIONS = 20
+EPA_MAX_ITERATIONS = 50
+EPA_TOLERANCE = 1e-9
+
+
+DistanceOutput = namedtuple(
+    "DistanceOutput", ("distance", "point_a", "point_b", "iterations"))
+""" distance: distance between shapes, 0 if they overlap
+    point_a, point_b: closest points on each shape
+    iterations: number of GJK iterations performed
+"""
+
+Penetration = namedtuple("Penetration", ("depth", "normal"))
+""" depth: length of the minimum translation, that separates shapes
+    normal: unit vector pointing from shape `b` towards shape `a`. Moving `a`
+        by `normal * depth` resolves the overlap (same convention as
+        `CircleManifold`).
+"""
+
+
+class DistanceProxy(object):
+    """ Convex core point set and a radius, as seen by GJK
+    """
+
+    __slots__ = ("vertices", "radius", "_support")
+
+    def __init__(self, vertices, radius=0.0, support=None):
+        self.vertices = vertices
+        self.radius = radius
+        self._support = support
+
+    @classmethod
+    def from_shape(cls, shape):
+        if isinstance(shape, DistanceProxy):
+            return shape
+        if isinstance(shape, ConvexShape):
+            return cls(shape._coords, 0.0, shape._support_index)
+        if isinstance(shape, Circle):
+            c = shape.center
+            return cls(((c.x, c.y), ), shape.radius)
+        if isinstance(shape, AABB):
+            x1, y1, x2, y2 = shape.min.x, shape.min.y, shape.max.x, shape.max.y
+            return cls(((x1, y1), (x2, y1), (x2, y2), (x1, y2)), 0.0,
+                       _aabb_support_index)
+        # Other convex shapes (like swept ones) can provide their own proxy
+        make_proxy = getattr(shape, "_distance_proxy", None)
+        if make_proxy is not None:
+            return make_proxy()
+        raise ValueError(shape)
+
+    def support(self, dx, dy):
+        """ Index of the vertex furthest along (dx, dy) """
+        if self._support is not None:
+            return self._support(dx, dy)
+        vertices = self.vertices
+        best = 0
+        best_value = dx * vertices[0][0] + dy * vertices[0][1]
+        for i in range(1, len(vertices)):
+            value = dx * vertices[i][0] + dy * vertices[i][1]
+            if value > best_value:
+                best = i
+                best_value = value
+        return best
+
+
+def _aabb_support_index(dx, dy):
+    # Corners are in order: min, (max_x, min_y), max, (min_x, max_y)
+    if dx > 0:
+        return 2 if dy > 0 else 1
+    return 3 if dy > 0 else 0
+
+
+class SimplexCache(object):
+    """ Vertex indices of the last simplex for a pair of shapes. Passing the
+        same cache between ticks warm-starts GJK from the previous result.
+        Shapes should keep the same topology (vertex count) for the cache to
+        be valid, position may change freely.
+    """
+
+    __slots__ = ("indices", )
+
+    def __init__(self):
+        self.indices = ()
+
+
+class _SimplexVertex(object):
+
+    __slots__ = ("ax", "ay", "bx", "by", "wx", "wy", "a", "index_a",
+                 "index_b")
+
+    def set(self, proxy_a, proxy_b, index_a, index_b):
+        self.index_a = index_a
+        self.index_b = index_b
+        self.ax, self.ay = proxy_a.vertices[index_a]
+        self.bx, self.by = proxy_b.vertices[index_b]
+        # Support point of Minkowski difference B - A
+        self.wx = self.bx - self.ax
+        self.wy = self.by - self.ay
+        self.a = 1.0
+
+
+def _solve2(v):
+    """ Closest point on segment w1-w2 to the origin """
+    w1, w2 = v[0], v[1]
+    e12x, e12y = w2.wx - w1.wx, w2.wy - w1.wy
+    # w1 region
+    d12_2 = -(w1.wx * e12x + w1.wy * e12y)
+    if d12_2 <= 0:
+        w1.a = 1.0
+        return 1
+    # w2 region
+    d12_1 = w2.wx * e12x + w2.wy * e12y
+    if d12_1 <= 0:
+        w2.a = 1.0
+        v[0], v[1] = w2, w1
+        return 1
+    # Must be in e12 region
+    inv = 1.0 / (d12_1 + d12_2)
+    w1.a = d12_1 * inv
+    w2.a = d12_2 * inv
+    return 2
+
+
+def _solve3(v):
+    """ Closest feature of triangle w1-w2-w3 to the origin using barycentric
+        coordinates. Reorders `v` so the first `count` vertices form the
+        reduced simplex.
+    """
+    w1, w2, w3 = v[0], v[1], v[2]
+    # Edge12
+    e12x, e12y = w2.wx - w1.wx, w2.wy - w1.wy
+    d12_1 = w2.wx * e12x + w2.wy * e12y
+    d12_2 = -(w1.wx * e12x + w1.wy * e12y)
+    # Edge13
+    e13x, e13y = w3.wx - w1.wx, w3.wy - w1.wy
+    d13_1 = w3.wx * e13x + w3.wy * e13y
+    d13_2 = -(w1.wx * e13x + w1.wy * e13y)
+    # Edge23
+    e23x, e23y = w3.wx - w2.wx, w3.wy - w2.wy
+    d23_1 = w3.wx * e23x + w3.wy * e23y
+    d23_2 = -(w2.wx * e23x + w2.wy * e23y)
+    # Triangle123
+    n123 = e12x * e13y - e12y * e13x
+    d123_1 = n123 * (w2.wx * w3.wy - w2.wy * w3.wx)
+    d123_2 = n123 * (w3.wx * w1.wy - w3.wy * w1.wx)
+    d123_3 = n123 * (w1.wx * w2.wy - w1.wy * w2.wx)
+
+    # w1 region
+    if d12_2 <= 0 and d13_2 <= 0:
+        w1.a = 1.0
+        return 1
+    # e12
+    if d12_1 > 0 and d12_2 > 0 and d123_3 <= 0:
+        inv = 1.0 / (d12_1 + d12_2)
+        w1.a = d12_1 * inv
+        w2.a = d12_2 * inv
+        return 2
+    # e13
+    if d13_1 > 0 and d13_2 > 0 and d123_2 <= 0:
+        inv = 1.0 / (d13_1 + d13_2)
+        w1.a = d13_1 * inv
+        w3.a = d13_2 * inv
+        v[1], v[2] = w3, w2
+        return 2
+    # w2 region
+    if d12_1 <= 0 and d23_2 <= 0:
+        w2.a = 1.0
+        v[0], v[1] = w2, w1
+        return 1
+    # w3 region
+    if d13_1 <= 0 and d23_1 <= 0:
+        w3.a = 1.0
+        v[0], v[2] = w3, w1
+        return 1
+    # e23
+    if d23_1 > 0 and d23_2 > 0 and d123_1 <= 0:
+        inv = 1.0 / (d23_1 + d23_2)
+        w2.a = d23_1 * inv
+        w3.a = d23_2 * inv
+        v[0], v[2] = w3, w1
+        return 2
+    # Must be in triangle123
+    inv = 1.0 / (d123_1 + d123_2 + d123_3)
+    w1.a = d123_1 * inv
+    w2.a = d123_2 * inv
+    w3.a = d123_3 * inv
+    return 3
+
+
+def _gjk(proxy_a, proxy_b, simplex_cache):
+    """ Core GJK loop. Returns (simplex vertices, count, iterations), where
+        count == 3 means the cores overlap.
+    """
+    v = [_SimplexVertex(), _SimplexVertex(), _SimplexVertex()]
+    count = 0
+    if simplex_cache is not None:
+        len_a, len_b = len(proxy_a.vertices), len(proxy_b.vertices)
+        for index_a, index_b in simplex_cache.indices:
+            if index_a < len_a and index_b < len_b:
+                v[count].set(proxy_a, proxy_b, index_a, index_b)
+                count += 1
+    if count == 0:
+        v[0].set(proxy_a, proxy_b, 0, 0)
+        count = 1
+
+    iterations = 0
+    while iterations < GJK_MAX_ITERATIONS:
+        # Remember the simplex to detect cycling
+        saved = [(x.index_a, x.index_b) for x in v[:count]]
+
+        if count == 2:
+            count = _solve2(v)
+        elif count == 3:
+            count = _solve3(v)
+        # If we have 3 points, then the origin is in the corresponding
+        # triangle
+        if count == 3:
+            break
+
+        # Search direction towards the origin
+        if count == 1:
+            dx, dy = -v[0].wx, -v[0].wy
+        else:
+            e12x, e12y = v[1].wx - v[0].wx, v[1].wy - v[0].wy
+            sgn = e12x * -v[0].wy - e12y * -v[0].wx
+            if sgn > 0:
+                # Origin is left of e12
+                dx, dy = -e12y, e12x
+            else:
+                dx, dy = e12y, -e12x
+
+        # Origin is probably contained by a line segment or point. Thus the
+        # shapes are overlapped
+        if dx * dx + dy * dy < EPSILON * EPSILON * EPSILON:
+            break
+
+        vertex = v[count]
+        vertex.set(proxy_a, proxy_b,
+                   proxy_a.support(-dx, -dy), proxy_b.support(dx, dy))
+        iterations += 1
+
+        # Main termination criterion: we found a duplicate support point,
+        # so no progress can be made
+        if (vertex.index_a, vertex.index_b) in saved:
+            break
+        count += 1
+
+    if simplex_cache is not None:
+        simplex_cache.indices = tuple(
+            (x.index_a, x.index_b) for x in v[:count])
+    return v, count, iterations
+
+
+def _witness_points(v, count):
+    if count == 1:
+        return v[0].ax, v[0].ay, v[0].bx, v[0].by
+    if count == 2:
+        a1, a2 = v[0].a, v[1].a
+        return (a1 * v[0].ax + a2 * v[1].ax, a1 * v[0].ay + a2 * v[1].ay,
+                a1 * v[0].bx + a2 * v[1].bx, a1 * v[0].by + a2 * v[1].by)
+    a1, a2, a3 = v[0].a, v[1].a, v[2].a
+    x = a1 * v[0].ax + a2 * v[1].ax + a3 * v[2].ax
+    y = a1 * v[0].ay + a2 * v[1].ay + a3 * v[2].ay
+    return x, y, x, y
+
+
+def gjk_distance(a, b, simplex_cache=None):
+    """ Distance and closest points between 2 convex shapes. Returns
+        `DistanceOutput`. Pass a `SimplexCache` to warm-start from the
+        previous call for the same pair.
+    """
+    proxy_a = DistanceProxy.from_shape(a)
+    proxy_b = DistanceProxy.from_shape(b)
+    v, count, iterations = _gjk(proxy_a, proxy_b, simplex_cache)
+    ax, ay, bx, by = _witness_points(v, count)
+    dist = math.hypot(bx - ax, by - ay)
+
+    r_a, r_b = proxy_a.radius, proxy_b.radius
+    if r_a or r_b:
+        if dist > r_a + r_b and dist > EPSILON:
+            # Shapes are still not overlapped. Move the witness points to
+            # the outer surface.
+            nx, ny = (bx - ax) / dist, (by - ay) / dist
+            dist -= r_a + r_b
+            ax, ay = ax + nx * r_a, ay + ny * r_a
+            bx, by = bx - nx * r_b, by - ny * r_b
+        else:
+            # Shapes are overlapped when radii are considered. Move the
+            # witness points to the middle.
+            ax = bx = (ax + bx) * 0.5
+            ay = by = (ay + by) * 0.5
+            dist = 0.0
+    return DistanceOutput(dist, Vector(ax, ay), Vector(bx, by), iterations)
+
+
+def gjk_overlap(a, b, simplex_cache=None):
+    """ Fast boolean overlap test for 2 convex shapes. Touching shapes (up
+        to EPSILON) overlap, same as in SAT based tests.
+    """
+    return gjk_distance(
+        a, b, simplex_cache=simplex_cache).distance <= EPSILON
+
+
+def _minkowski_support(proxy_a, proxy_b, dx, dy):
+    """ Support point of B - A in direction (dx, dy) """
+    ax, ay = proxy_a.vertices[proxy_a.support(-dx, -dy)]
+    bx, by = proxy_b.vertices[proxy_b.support(dx, dy)]
+    return bx - ax, by - ay
+
+
+def _orient(p1, p2, p3):
+    return (p2[0] - p1[0]) * (p3[1] - p1[1]) - \
+        (p2[1] - p1[1]) * (p3[0] - p1[0])
+
+
+def _initial_polytope(proxy_a, proxy_b, v, count):
+    """ Counter-clockwise triangle of Minkowski difference points, that
+        contains the origin. GJK may stop with the origin on a vertex or an
+        edge of the simplex, in which case we add support points around it.
+        Returns None if the Minkowski difference is degenerate there, which
+        means cores just touch.
+    """
+    polytope = [(x.wx, x.wy) for x in v[:count]]
+    if len(polytope) == 1:
+        for dx, dy in ((1.0, 0.0), (-1.0, 0.0), (0.0, 1.0), (0.0, -1.0)):
+            w = _minkowski_support(proxy_a, proxy_b, dx, dy)
+            if (w[0] - polytope[0][0]) ** 2 + \
+                    (w[1] - polytope[0][1]) ** 2 > EPSILON * EPSILON:
+                polytope.append(w)
+                break
+        else:
+            return None
+    if len(polytope) == 2:
+        (x1, y1), (x2, y2) = polytope
+        ex, ey = x2 - x1, y2 - y1
+        for nx, ny in ((-ey, ex), (ey, -ex)):
+            w = _minkowski_support(proxy_a, proxy_b, nx, ny)
+            if nx * (w[0] - x1) + ny * (w[1] - y1) > EPSILON * EPSILON:
+                polytope.append(w)
+                break
+        else:
+            return None
+    if _orient(*polytope) < 0:
+        polytope.reverse()
+    return polytope
+
+
+def _epa(proxy_a, proxy_b, v, count):
+    """ Expand the GJK simplex, that contains the origin, to find the
+        closest edge of Minkowski difference B - A. Returns (depth, nx, ny)
+        where (nx, ny) is the outward normal of that edge.
+    """
+    polytope = _initial_polytope(proxy_a, proxy_b, v, count)
+    if polytope is None:
+        # Cores are just touching
+        if count == 2:
+            ex, ey = v[1].wx - v[0].wx, v[1].wy - v[0].wy
+            length = math.hypot(ex, ey)
+            if length > EPSILON:
+                return 0.0, ey / length, -ex / length
+        return 0.0, 1.0, 0.0
+
+    for _ in range(EPA_MAX_ITERATIONS):
+        # Find the edge closest to the origin
+        best = None
+        le = len(polytope)
+        for i in range(le):
+            x1, y1 = polytope[i]
+            x2, y2 = polytope[(i + 1) % le]
+            ex, ey = x2 - x1, y2 - y1
+            length = math.hypot(ex, ey)
+            if length < EPSILON * EPSILON:
+                continue
+            nx, ny = ey / length, -ex / length
+            dist = nx * x1 + ny * y1
+            if best is None or dist < best[0]:
+                best = (dist, nx, ny, i)
+        dist, nx, ny, i = best
+        w = _minkowski_support(proxy_a, proxy_b, nx, ny)
+        if nx * w[0] + ny * w[1] - dist < EPA_TOLERANCE * max(1.0, dist):
+            # Can't expand further, this edge is on the boundary
+            break
+        polytope.insert(i + 1, w)
+        # `w` may also be beyond neighbouring edges. Remove vertices, that
+        # became reflex, to keep the polytope convex (2D version of removing
+        # faces visible from `w`)
+        j = i + 1
+        while len(polytope) > 3:
+            le = len(polytope)
+            prev, prev2 = (j - 1) % le, (j - 2) % le
+            if _orient(polytope[prev2], polytope[prev], w) > 0:
+                break
+            del polytope[prev]
+            j = polytope.index(w)
+        while len(polytope) > 3:
+            le = len(polytope)
+            nxt, nxt2 = (j + 1) % le, (j + 2) % le
+            if _orient(w, polytope[nxt], polytope[nxt2]) > 0:
+                break
+            del polytope[nxt]
+            j = polytope.index(w)
+    return max(dist, 0.0), nx, ny
+
+
+def gjk_penetration(a, b, simplex_cache=None):
+    """ Penetration depth and normal of 2 overlapping convex shapes. Returns
+        None if shapes do not overlap, `Penetration` otherwise.
+    """
+    proxy_a = DistanceProxy.from_shape(a)
+    proxy_b = DistanceProxy.from_shape(b)
+    v, count, _ = _gjk(proxy_a, proxy_b, simplex_cache)
+    ax, ay, bx, by = _witness_points(v, count)
+    dist = math.hypot(bx - ax, by - ay)
+    radius = proxy_a.radius + proxy_b.radius
+
+    if count < 3 and dist > EPSILON:
+        # Cores are separated, but radii may still overlap
+        if dist > radius:
+            return None
+        # Normal from B towards A
+        return Penetration(radius - dist,
+                           Vector((ax - bx) / dist, (ay - by) / dist))
+
+    depth, nx, ny = _epa(proxy_a, proxy_b, v, count)
+    # (nx, ny) is the outward normal of B - A. Moving A along it pushes the
+    # origin out of the Minkowski difference
+    return Penetration(depth + radius, Vector(nx, ny))
@@ -37,7 +37,15 @@
         correction = manifold.normal.rotate_deg(90) * t
         return move + correction
 
-    `Polygon` manifolds are a bit more tricky to work with
+    `Polygon` manifolds are a bit more tricky to work with. They are built
+    by clipping the `incident` edge of one shape against the side planes of
+    the `reference` edge of the other (the edge with the least penetration),
+    so they can hold up to 2 contact points. For a resting box this gives
+    both corners instead of one arbitrary point.
+
+    In both cases `normal` is a unit vector pointing from the second shape
+    to the first one, so `a` moved by `normal * depth` no longer overlaps
+    `b`. Contact `points` are in the same coordinate system as the shapes.
 
 """
 import math
@@ -46,45 +54,235 @@ from engine.geometry.vector import EPSILON, Vector
 
 from .aabb import AABB
 from .circle import Circle
+from .dispatch import intersect, register_intersection  # noqa
 from .polygon import Polygon, Triangle
 
 
-class Manifold:
-
-    def __init__(self, *, points=(), depth=0, normal=Vector(1, 0)):
-        points = points
-        depth = depth
-        normal = normal
+# Prefer the first shape's edge as reference face unless the second one's
+# separation is noticeably bigger. Keeps the chosen face (and so contact
+# points) from flickering between ticks for almost parallel edges.
+REFERENCE_FACE_TOLERANCE = 1e-3
 
 
-class CircleManifold:
+class Manifold:
 
-    def __init__(self, depth, normal):
+    def __init__(self, *, points=(), depth=0, normal=Vector(1, 0)):
+        self.points = tuple(points)
         self.depth = depth
         self.normal = normal
 
+    def __repr__(self):
+        return "{}(points={}, depth={}, normal={})".format(
+            self.__class__.__name__, list(self.points), self.depth,
+            self.normal)
+
     def inverse(self):
         self.normal *= -1
 
+    def translate(self, dv):
+        """ Same manifold with contact points moved by `dv` """
+        return self.__class__(
+            points=[p + dv for p in self.points], depth=self.depth,
+            normal=self.normal)
+
+
+class CircleManifold(Manifold):
+
+    def __init__(self, depth, normal, points=()):
+        super().__init__(points=points, depth=depth, normal=normal)
+
+
+class SeparatingAxisCache:
+    """ Remembers the axis, that separated a pair of shapes last time, so it
+        can be tried first on the next test of the same pair. Objects rarely
+        move much between ticks, so the same axis most likely separates them
+        again. Keep one instance per pair of shapes and pass it to the
+        intersection function:
+
+            cache = SeparatingAxisCache()
+            for tick in ticks:
+                manifold = intersect_polygon_polygon(a, b, cache=cache)
+
+        `axis` is a tuple (owner, index), where owner is 0 for an edge normal
+        of the first shape and 1 for the second.
+    """
+
+    __slots__ = ("axis", )
+
+    def __init__(self):
+        self.axis = None
+
+
+def _axis_separates(axis, other):
+    nx, ny, lo, hi = axis
+    o_min, o_max = other._extent(nx, ny)
+    return o_max < lo or o_min > hi
+
+
+def _sat_separated(axes, other, cache=None, owner=0):
+    """ Check if any of the `axes` (prepared (nx, ny, min, max) tuples, see
+        `ConvexShape._sat_axes`) separates the owner shape from `other`.
+        Stops on the first separating axis. `other` only needs an `_extent`
+        method, which is O(1) for AABB's and O(log n) for big polygons.
+    """
+    for index, axis in enumerate(axes):
+        if _axis_separates(axis, other):
+            if cache is not None:
+                cache.axis = (owner, index)
+            return True
+    return False
+
 
-def _sat_test(points1, points2, normal):
-    sp = []  # projections of self's vertexes onto line n
-    for v in points1:
-        sp.append(normal.dot(v))
-    op = []  # projections of other's vertexes onto line n
-    for v in points2:
-        op.append(normal.dot(v))
-    if max(op) < min(sp) or min(op) > max(sp):
+def _cached_axis_separates(cache, a, b):
+    """ Try the axis, that separated this pair last time """
+    if cache is None or cache.axis is None:
         return False
-    return True
+    owner, index = cache.axis
+    if owner == 0:
+        return _axis_separates(a._sat_axes[index], b)
+    return _axis_separates(b._sat_axes[index], a)
 
 
-def intersect_aabb_aabb(a: AABB, b: AABB) -> Manifold:
-    if b.min.x > a.max.x or b.min.y > a.max.y:
+def _bounding_circles_separated(a, b):
+    """ Cheap rejection test before doing any SAT """
+    r = a._bounding_radius + b._bounding_radius
+    return a.centroid.distance2(b.centroid) > r * r
+
+
+def _max_separation(a, b):
+    """ Edge of `a` with the largest separation from `b`.
+        Returns (edge index, separation), separation is negative if shapes
+        overlap along this edge's normal.
+    """
+    best_index, best = 0, -math.inf
+    for index, (nx, ny, _, hi) in enumerate(a._sat_axes):
+        lo, _ = b._extent(nx, ny)
+        separation = lo - hi
+        if separation > best:
+            best_index, best = index, separation
+    return best_index, best
+
+
+def _incident_edge(incident, normal):
+    """ Edge of `incident` most anti-parallel to the reference `normal` """
+    nx, ny = normal.x, normal.y
+    best_index, best = 0, math.inf
+    for index, (ix, iy, _, _) in enumerate(incident._sat_axes):
+        dot = nx * ix + ny * iy
+        if dot < best:
+            best_index, best = index, dot
+    return best_index
+
+
+def _clip_segment(points, normal, offset):
+    """ Keep the part of a segment, that is behind the plane
+        `normal.dot(p) <= offset`.
+    """
+    if len(points) < 2:
+        # Segment was already clipped down to a point
+        return [p for p in points if normal.dot(p) - offset <= EPSILON]
+    result = []
+    p1, p2 = points
+    d1 = normal.dot(p1) - offset
+    d2 = normal.dot(p2) - offset
+    if d1 <= EPSILON:
+        result.append(p1)
+    if d2 <= EPSILON:
+        result.append(p2)
+    if d1 * d2 < 0 and len(result) < 2:
+        # Points on different sides, add the crossing point
+        result.append(p1 + (p2 - p1) * (d1 / (d1 - d2)))
+    return result
+
+
+def _clip_polygons(a, b):
+    """ Contact manifold for 2 convex polygons, as in Box2D's
+        b2CollidePolygons:
+        1. Find the edge with the largest separation on each polygon. If any
+           separation is positive - polygons don't overlap.
+        2. The edge with the largest separation is the `reference` face, its
+           polygon is the `reference` polygon.
+        3. Find the `incident` edge on the other polygon - the one facing the
+           reference face the most.
+        4. Clip the incident edge by the side planes of the reference face and
+           keep the points, that are behind it.
+    """
+    edge_a, separation_a = _max_separation(a, b)
+    if separation_a > 0:
+        return None
+    edge_b, separation_b = _max_separation(b, a)
+    if separation_b > 0:
         return None
-    if b.max.x < a.min.x or b.max.y < a.min.y:
+
+    if separation_b > separation_a + REFERENCE_FACE_TOLERANCE:
+        reference, incident, edge, flip = b, a, edge_b, False
+        depth = -separation_b
+    else:
+        reference, incident, edge, flip = a, b, edge_a, True
+        depth = -separation_a
+
+    v1 = reference.points[edge - 1]
+    v2 = reference.points[edge]
+    normal = reference.unit_normals[edge]
+    tangent = (v2 - v1).unit()
+
+    inc = _incident_edge(incident, normal)
+    segment = [incident.points[inc - 1], incident.points[inc]]
+    segment = _clip_segment(segment, tangent * -1, -tangent.dot(v1))
+    segment = _clip_segment(segment, tangent, tangent.dot(v2))
+
+    # Depth is taken from the reference face separation and not from the
+    # clipped points, as the deepest incident vertex may be clipped away.
+    offset = normal.dot(v1)
+    points = [p for p in segment if normal.dot(p) - offset <= EPSILON]
+    if not points:
+        # Both separations say the polygons overlap, but the incident edge
+        # was clipped away. Fall back to the deepest incident vertex.
+        points = [min(incident.points,
+                      key=lambda p: normal.dot(p) - offset)]
+    # Reference normal points out of the reference polygon
+    if flip:
+        normal = normal * -1
+    return Manifold(points=points, depth=depth, normal=normal)
+
+
+def _aabb_polygon(aabb):
+    """ AABB as a counter-clockwise polygon for manifold clipping """
+    lo, hi = aabb._min, aabb._max
+    return Polygon([lo, Vector(hi.x, lo.y), hi, Vector(lo.x, hi.y)])
+
+
+def intersect_aabb_aabb(a: AABB, b: AABB) -> Manifold:
+    """ Penetration along each of 4 directions is the distance, that `a`
+        needs to move to stop overlapping. Negative value means they don't
+        overlap at all, the smallest positive is the manifold depth.
+    """
+    a_min, a_max, b_min, b_max = a._min, a._max, b._min, b._max
+    right = b_max.x - a_min.x
+    left = a_max.x - b_min.x
+    up = b_max.y - a_min.y
+    down = a_max.y - b_min.y
+    if right < 0 or left < 0 or up < 0 or down < 0:
         return None
-    return Manifold()
+    depth = min(right, left, up, down)
+    if depth == right or depth == left:
+        # Contact points lie on the reference face of `b`
+        lo, hi = max(a_min.y, b_min.y), min(a_max.y, b_max.y)
+        if depth == right:
+            x, normal = b_max.x, Vector(1, 0)
+        else:
+            x, normal = b_min.x, Vector(-1, 0)
+        points = [Vector(x, lo), Vector(x, hi)]
+    else:
+        lo, hi = max(a_min.x, b_min.x), min(a_max.x, b_max.x)
+        if depth == up:
+            y, normal = b_max.y, Vector(0, 1)
+        else:
+            y, normal = b_min.y, Vector(0, -1)
+        points = [Vector(lo, y), Vector(hi, y)]
+    if points[0] == points[1]:
+        del points[1]
+    return Manifold(points=points, depth=depth, normal=normal)
 
 
 def intersect_aabb_circle(aabb: AABB, circle: Circle) -> Manifold:
@@ -97,89 +295,46 @@ def intersect_aabb_circle(aabb: AABB, circle: Circle) -> Manifold:
     if math.fabs(d) < EPSILON:
         # Place some constant values just to not break, but this manifold's
         # not so useful =(
-        return CircleManifold(depth=r, normal=Vector(1, 0))
-    return CircleManifold(depth=r - d, normal=(closest - c).unit())
+        return CircleManifold(depth=r, normal=Vector(1, 0), points=[c])
+    return CircleManifold(depth=r - d, normal=(closest - c).unit(),
+                          points=[closest])
 
 
-def intersect_aabb_triangle(aabb: AABB, triangle: Triangle) -> Manifold:
+def intersect_aabb_triangle(aabb: AABB, triangle: Triangle,
+                            cache=None) -> Manifold:
     """ Will use the Separating Axes Test for this. The axes can be one of:
         * 2 normals for aabb edges
         * 3 normals for triangle edges
     """
-    a, b, c = triangle._a, triangle._b, triangle._c
-    aabb_min, aabb_max = aabb._min, aabb._max
-    # Test X axis separation
-    t_min = min(a.x, b.x, c.x)
-    t_max = max(a.x, b.x, c.x)
-    if t_max < aabb_min.x or t_min > aabb_max.x:
-        return None
-    # Test Y axis separation
-    t_min = min(a.y, b.y, c.y)
-    t_max = max(a.y, b.y, c.y)
-    if t_max < aabb_min.y or t_min > aabb_max.y:
-        return None
-
-    # Next test 3 triangle normals
-    aabb_a, aabb_b = Vector(aabb_min.x, aabb_max.y), \
-        Vector(aabb_max.x, aabb_min.y)
-    points = [aabb_min, aabb_a, aabb_max, aabb_b]
-    # Test AB's normal
-    ab_normal = (b - a).rotate_deg(90)
-    proj = [ab_normal.dot(p) for p in points]
-    if max(proj) < ab_normal.dot(a):
-        return None
-    # C will always be positive, as triangle is ordered clockwise
-    if min(proj) > ab_normal.dot(c):
-        return None
-
-    # Test BC's normal
-    bc_normal = (c - b).rotate_deg(90)
-    proj = [bc_normal.dot(p) for p in points]
-    if max(proj) < bc_normal.dot(b):
-        return None
-    if min(proj) > bc_normal.dot(a):
-        return None
-
-    # Test CA's normal
-    ca_normal = (a - c).rotate_deg(90)
-    proj = [ca_normal.dot(p) for p in points]
-    if max(proj) < ca_normal.dot(c):
-        return None
-    if min(proj) > ca_normal.dot(b):
-        return None
+    return intersect_aabb_polygon(aabb, triangle, cache=cache)
 
-    return Manifold()
 
-
-def intersect_aabb_polygon(aabb: AABB, polygon: Polygon) -> Manifold:
+def intersect_aabb_polygon(aabb: AABB, polygon: Polygon,
+                           cache=None) -> Manifold:
     """ Will use the Separating Axes Test for this. The axes can be one of:
         * 2 normals for aabb edges
         * n normals for polygon edges
+        AABB is projected by center and extents in O(1), so the whole test
+        is O(n).
     """
     aabb_min, aabb_max = aabb._min, aabb._max
-    points = polygon.points
-    # Test X axis separation
-    p_x = [p.x for p in points]
-    if max(p_x) < aabb_min.x or min(p_x) > aabb_max.x:
+    # Test X and Y axes separation
+    min_x, min_y, max_x, max_y = polygon._bounds
+    if max_x < aabb_min.x or min_x > aabb_max.x:
         return None
-    # Test Y axis separation
-    p_y = [p.y for p in points]
-    if max(p_y) < aabb_min.y or min(p_y) > aabb_max.y:
+    if max_y < aabb_min.y or min_y > aabb_max.y:
         return None
 
-    # Next test all polygon's normals
-    aabb_a, aabb_b = Vector(aabb_min.x, aabb_max.y), \
-        Vector(aabb_max.x, aabb_min.y)
-    aabb_points = [aabb_min, aabb_a, aabb_max, aabb_b]
-
-    prev_point = points[-1]
-    for point in points:
-        normal = (point - prev_point).rotate_deg(90)
-        if not _sat_test(points, aabb_points, normal):
+    # Next test all polygon's normals, last separating one first
+    if cache is not None and cache.axis is not None:
+        if _axis_separates(polygon._sat_axes[cache.axis[1]], aabb):
             return None
-        prev_point = point
+    if _sat_separated(polygon._sat_axes, aabb, cache, owner=1):
+        return None
+    if cache is not None:
+        cache.axis = None
 
-    return Manifold()
+    return _clip_polygons(_aabb_polygon(aabb), polygon)
 
 
 def intersect_circle_circle(a: Circle, b: Circle) -> Manifold:
@@ -190,8 +345,10 @@ def intersect_circle_circle(a: Circle, b: Circle) -> Manifold:
     if math.fabs(d) < EPSILON:
         # Place some constant values just to not break, but this manifold's
         # not so useful =(
-        return CircleManifold(depth=r, normal=Vector(1, 0))
-    return CircleManifold(depth=r - d, normal=(a._c - b._c).unit())
+        return CircleManifold(depth=r, normal=Vector(1, 0), points=[a._c])
+    normal = (a._c - b._c).unit()
+    return CircleManifold(depth=r - d, normal=normal,
+                          points=[b._c + normal * b._r])
 
 
 def intersect_circle_triangle(circle: Circle, triangle: Triangle) -> Manifold:
@@ -204,8 +361,9 @@ def intersect_circle_triangle(circle: Circle, triangle: Triangle) -> Manifold:
     if math.fabs(d) < EPSILON:
         # Place some constant values just to not break, but this manifold's
         # not so useful =(
-        return CircleManifold(depth=r, normal=Vector(1, 0))
-    return CircleManifold(depth=r - d, normal=(c - closest).unit())
+        return CircleManifold(depth=r, normal=Vector(1, 0), points=[c])
+    return CircleManifold(depth=r - d, normal=(c - closest).unit(),
+                          points=[closest])
 
 
 def intersect_circle_polygon(circle: Circle, polygon: Polygon) -> Manifold:
@@ -218,36 +376,55 @@ def intersect_circle_polygon(circle: Circle, polygon: Polygon) -> Manifold:
     if math.fabs(d) < EPSILON:
         # Place some constant values just to not break, but this manifold's
         # not so useful =(
-        return CircleManifold(depth=r, normal=Vector(1, 0))
-    return CircleManifold(depth=r - d, normal=(c - closest).unit())
+        return CircleManifold(depth=r, normal=Vector(1, 0), points=[c])
+    return CircleManifold(depth=r - d, normal=(c - closest).unit(),
+                          points=[closest])
 
 
-def intersect_triangle_triangle(a: Triangle, b: Triangle) -> Manifold:
-    raise NotImplementedError()
+def intersect_triangle_triangle(a: Triangle, b: Triangle,
+                                cache=None) -> Manifold:
+    """ Same Separating Axes Test and clipping as for polygons. Pass a
+        `SeparatingAxisCache` to try the last separating axis first.
+    """
+    return intersect_polygon_polygon(a, b, cache=cache)
 
 
-def intersect_triangle_polygon(triangle: Triangle, polygon: Polygon) \
-        -> Manifold:
-    return intersect_polygon_polygon(triangle, polygon)
+def intersect_triangle_polygon(triangle: Triangle, polygon: Polygon,
+                               cache=None) -> Manifold:
+    return intersect_polygon_polygon(triangle, polygon, cache=cache)
 
 
-def intersect_polygon_polygon(a: Polygon, b: Polygon) -> Manifold:
+def intersect_polygon_polygon(a: Polygon, b: Polygon,
+                              cache=None) -> Manifold:
+    """ Separating Axes Test over edge normals of both polygons. Projection
+        extents of own vertices are cached on each polygon, the other
+        polygon's extent is found with a support point lookup, so the test is
+        O(n log m + m log n) for big polygons. Pass a `SeparatingAxisCache`
+        to try the last separating axis of this pair first.
+    """
+    if _bounding_circles_separated(a, b):
+        return None
+    if _cached_axis_separates(cache, a, b):
+        return None
     # Check our polygon normal's
-    points = a.points
-    prev_point = points[-1]
-    for point in points:
-        normal = (point - prev_point).rotate_deg(90)
-        if not _sat_test(points, b.points, normal):
-            return None
-        prev_point = point
-
+    if _sat_separated(a._sat_axes, b, cache, owner=0):
+        return None
     # Check other polygon's normals
-    points = b.points
-    prev_point = points[-1]
-    for point in points:
-        normal = (point - prev_point).rotate_deg(90)
-        if not _sat_test(a.points, points, normal):
-            return None
-        prev_point = point
-
-    return Manifold()
+    if _sat_separated(b._sat_axes, a, cache, owner=1):
+        return None
+    if cache is not None:
+        cache.axis = None
+
+    return _clip_polygons(a, b)
+
+
+register_intersection(AABB, AABB, intersect_aabb_aabb)
+register_intersection(AABB, Circle, intersect_aabb_circle)
+register_intersection(AABB, Triangle, intersect_aabb_triangle)
+register_intersection(AABB, Polygon, intersect_aabb_polygon)
+register_intersection(Circle, Circle, intersect_circle_circle)
+register_intersection(Circle, Triangle, intersect_circle_triangle)
+register_intersection(Circle, Polygon, intersect_circle_polygon)
+register_intersection(Triangle, Triangle, intersect_triangle_triangle)
+register_intersection(Triangle, Polygon, intersect_triangle_polygon)
+register_intersection(Polygon, Polygon, intersect_polygon_polygon)
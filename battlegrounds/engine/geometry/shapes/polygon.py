@@ -1,12 +1,15 @@
+import bisect
 import math
 
+import numpy as np
+
 from engine.utils import lazy_property
 
 from .aabb import AABB
-from .circle import Circle
-from .shape import BaseIntersection, BaseShape
+from .shape import BaseIntersection, BaseShape, as_rays
 from ..utils import orient, seg_closest, seg_distance
 from ..vector import Vector
+from ..vector_array import VectorArray, as_points
 
 
 def _check_convex(points):
@@ -92,6 +95,245 @@ def _raycast(point, direction, vertices, normals):
     return None
 
 
+def _raycast_many(origins, directions, max_distance, vertices, normals):
+    """ Vectorized `_raycast`. `vertices` and `normals` are (M, 2) arrays,
+        each ray is clipped against all M half-spaces at once.
+    """
+    p, d, max_distance = as_rays(origins, directions, max_distance)
+    # (N, M) matrices of the same numerator and denominator as in `_raycast`
+    numerator = (normals[:, 0] * vertices[:, 0] +
+                 normals[:, 1] * vertices[:, 1]) - \
+        (p[:, 0, None] * normals[:, 0] + p[:, 1, None] * normals[:, 1])
+    denominator = d[:, 0, None] * normals[:, 0] + \
+        d[:, 1, None] * normals[:, 1]
+
+    # Ray is parallel to edge and is outside of polygon's halfplane
+    miss = np.any((denominator == 0.0) & (numerator < 0.0), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = numerator / denominator
+    entering = np.where(denominator < 0.0, t, -np.inf).max(axis=1)
+    exiting = np.where(denominator > 0.0, t, np.inf).min(axis=1)
+    # Rays, that start inside the polygon do not enter any half-space and
+    # are treated as miss, same as in `_raycast`
+    miss |= entering <= 0.0
+    miss |= exiting < entering
+    miss |= entering > max_distance
+    entering[miss] = np.nan
+    return entering
+
+
+def _orient_many(vertices, points):
+    """ `orient(prev_vertex, vertex, point)` for every edge and point.
+        Returns an (N, M) matrix for N points and M edges.
+    """
+    a = np.roll(vertices, 1, axis=0)
+    b = vertices
+    px, py = points[:, 0, None], points[:, 1, None]
+    # Same formula as `orient` to give the same results on edges
+    return a[:, 0] * (b[:, 1] - py) - a[:, 1] * (b[:, 0] - px) + \
+        b[:, 0] * py - b[:, 1] * px
+
+
+def _edge_closest_many(vertices, points):
+    """ Closest point on polygon's boundary for each point. Checks every
+        edge, so it is O(N * M), but in a single batch.
+        Returns (N, 2) closest points and (N, ) squared distances.
+    """
+    a = np.roll(vertices, 1, axis=0)
+    ab = vertices - a
+    ap = points[:, None, :] - a[None, :, :]
+    len2_ab = (ab * ab).sum(axis=1)
+    t = np.clip((ap * ab).sum(axis=2) / len2_ab, 0, 1)
+    closest = a + t[:, :, None] * ab
+    d2 = ((points[:, None, :] - closest) ** 2).sum(axis=2)
+    edge = np.argmin(d2, axis=1)
+    rows = np.arange(len(points))
+    return closest[rows, edge], d2[rows, edge]
+
+
+def _contains_many(vertices, points):
+    points = as_points(points)
+    return np.all(_orient_many(vertices, points) >= 0, axis=1)
+
+
+def _closest_point_many(vertices, points):
+    points = as_points(points)
+    closest, _ = _edge_closest_many(vertices, points)
+    inside = np.all(_orient_many(vertices, points) >= 0, axis=1)
+    # Points on or in polygon are closest to themselves
+    closest[inside] = points[inside]
+    return VectorArray(closest)
+
+
+def _distance_many(vertices, points):
+    """ Same values as `Polygon.distance`: -1 for points inside, 0 for points
+        on the border
+    """
+    points = as_points(points)
+    _, d2 = _edge_closest_many(vertices, points)
+    dist = np.sqrt(d2)
+    min_orient = _orient_many(vertices, points).min(axis=1)
+    dist[min_orient == 0] = 0
+    dist[min_orient > 0] = -1
+    return dist
+
+
+class ConvexShape(BaseShape):
+    """ Common base of Triangle and Polygon. Subclasses provide `points`
+        in counter-clockwise order.
+        As those shapes are immutable, everything derived from vertices (edge
+        normals, projection extents, centroid, etc.) is computed once and
+        cached on the instance. Static props are tested thousands of times
+        per second, so this `prepared` data pays off fast.
+    """
+
+    @lazy_property
+    def normals(self):
+        """ Outward (not normalized) normals. normals[i] is the normal of
+            the edge, that ends in points[i]
+        """
+        points = self.points
+        normals = []
+        prev_point = points[-1]
+        for point in points:
+            normal = (point - prev_point).rotate_deg(-90)
+            normals.append(normal)
+            prev_point = point
+        return normals
+
+    @lazy_property
+    def unit_normals(self):
+        return [normal.unit() for normal in self.normals]
+
+    @lazy_property
+    def _coords(self):
+        """ Vertices as plain (x, y) float tuples for tight loops """
+        return tuple((p.x, p.y) for p in self.points)
+
+    @lazy_property
+    def _sat_axes(self):
+        """ Separating axes candidates as (nx, ny, min, max) tuples, where
+            min and max are projection extents of own vertices onto the unit
+            edge normal (nx, ny).
+        """
+        coords = self._coords
+        axes = []
+        for normal in self.unit_normals:
+            nx, ny = normal.x, normal.y
+            proj = [nx * x + ny * y for x, y in coords]
+            axes.append((nx, ny, min(proj), max(proj)))
+        return tuple(axes)
+
+    @lazy_property
+    def _bounds(self):
+        """ min_x, min_y, max_x, max_y of vertices """
+        xs = [x for x, _ in self._coords]
+        ys = [y for _, y in self._coords]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @lazy_property
+    def centroid(self):
+        """ Center of mass of the polygon's area """
+        coords = self._coords
+        area = cx = cy = 0.0
+        x0, y0 = coords[-1]
+        for x1, y1 in coords:
+            cross = x0 * y1 - x1 * y0
+            area += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+            x0, y0 = x1, y1
+        area *= 0.5
+        return Vector(cx / (6 * area), cy / (6 * area))
+
+    @lazy_property
+    def _bounding_radius(self):
+        """ Radius of a circle around centroid, enclosing all vertices """
+        c = self.centroid
+        return max(c.distance(p) for p in self.points)
+
+    @lazy_property
+    def _normal_angles(self):
+        """ Angles of outward normals, rotated to start from the smallest
+            one. As vertices are counter-clockwise, the list is sorted, which
+            allows a binary search for the extreme vertex in any direction.
+            Returns (angles, offset of the smallest angle).
+        """
+        angles = [math.atan2(n.y, n.x) for n in self.normals]
+        k = angles.index(min(angles))
+        return angles[k:] + angles[:k], k
+
+    def _support_index(self, dx, dy):
+        """ Index of the vertex, furthest along direction (dx, dy).
+            Vertex points[i] lies between normals[i] and normals[i + 1], so
+            it is extreme for all directions with angles between those
+            normals' angles. Finding this span is a bisect over sorted normal
+            angles, which is O(log n).
+        """
+        angles, k = self._normal_angles
+        j = bisect.bisect_right(angles, math.atan2(dy, dx))
+        return (k + j - 1) % len(angles)
+
+    def support(self, direction):
+        """ Vertex furthest along `direction` """
+        return self.points[self._support_index(direction.x, direction.y)]
+
+    def _extent(self, nx, ny):
+        """ (min, max) projection of the vertices on axis (nx, ny). Even for
+            triangles 2 support lookups are cheaper than projecting all
+            vertices in Python.
+        """
+        coords = self._coords
+        x1, y1 = coords[self._support_index(-nx, -ny)]
+        x2, y2 = coords[self._support_index(nx, ny)]
+        return nx * x1 + ny * y1, nx * x2 + ny * y2
+
+    def _inherit_prepared(self, source, dv):
+        """ Copy prepared data from `source`, which is this same shape
+            translated by -dv. Normals and radius do not change on
+            translation, extents and centroid just shift.
+        """
+        cache = source.__dict__
+        for name in ("normals", "unit_normals", "_normal_array",
+                     "_bounding_radius", "_normal_angles"):
+            if name in cache:
+                self.__dict__[name] = cache[name]
+        if "_sat_axes" in cache:
+            dx, dy = dv.x, dv.y
+            self.__dict__["_sat_axes"] = tuple(
+                (nx, ny, lo + nx * dx + ny * dy, hi + nx * dx + ny * dy)
+                for nx, ny, lo, hi in cache["_sat_axes"])
+        if "centroid" in cache:
+            self.__dict__["centroid"] = cache["centroid"] + dv
+        return self
+
+    def raycast(self, point, direction):
+        vertices = self.points
+        normals = self.normals
+        return _raycast(point, direction, vertices, normals)
+
+    @lazy_property
+    def _vertex_array(self):
+        return as_points(self.points)
+
+    @lazy_property
+    def _normal_array(self):
+        return as_points(self.normals)
+
+    def raycast_many(self, origins, directions, max_distance=None):
+        return _raycast_many(origins, directions, max_distance,
+                             self._vertex_array, self._normal_array)
+
+    def contains_many(self, points):
+        return _contains_many(self._vertex_array, points)
+
+    def closest_point_many(self, points):
+        return _closest_point_many(self._vertex_array, points)
+
+    def distance_many(self, points):
+        return _distance_many(self._vertex_array, points)
+
+
 class TriangleIntersection(BaseIntersection):
 
     def __init__(self, shape, other, closest):
@@ -107,7 +349,7 @@ class TriangleIntersection(BaseIntersection):
         return movement - correction
 
 
-class Triangle(BaseShape):
+class Triangle(ConvexShape):
     """ Same as polygon we assume points are counter-clockwise """
 
     def __init__(self, points):
@@ -137,17 +379,6 @@ class Triangle(BaseShape):
     def points(self):
         return (self._a, self._b, self._c)
 
-    @lazy_property
-    def normals(self):
-        points = (self._a, self._b, self._c)
-        normals = []
-        prev_point = points[-1]
-        for point in points:
-            normal = (point - prev_point).rotate_deg(-90)
-            normals.append(normal)
-            prev_point = point
-        return normals
-
     def contains(self, other):
         assert isinstance(other, Vector)
         a, b, c = self._a, self._b, self._c
@@ -219,28 +450,16 @@ class Triangle(BaseShape):
             return -1
         return x.distance(other)
 
-    def intersects(self, other):
-        if isinstance(other, Circle):
-            return intersect_circle_triangle(other, self)
-        if isinstance(other, Polygon):
-            return intersect_triangle_polygon(self, other)
-        elif isinstance(other, Triangle):
-            return intersect_triangle_triangle(self, other)
-        elif isinstance(other, AABB):
-            return intersect_aabb_triangle(other, self)
-        raise ValueError(other)
-
-    def raycast(self, point, direction):
-        vertices = self.points
-        normals = self.normals
-        return _raycast(point, direction, vertices, normals)
+    def translate(self, dv):
+        return Triangle(
+            [p + dv for p in self.points])._inherit_prepared(self, dv)
 
 
 class PolygonIntersection(BaseIntersection):
     pass
 
 
-class Polygon(BaseShape):
+class Polygon(ConvexShape):
     """ We assume that the polygon is convex and ordered counter-clockwise """
 
     def __init__(self, points):
@@ -295,17 +514,6 @@ class Polygon(BaseShape):
     def points(self):
         return self._points
 
-    @lazy_property
-    def normals(self):
-        points = self._points
-        normals = []
-        prev_point = points[-1]
-        for point in points:
-            normal = (point - prev_point).rotate_deg(-90)
-            normals.append(normal)
-            prev_point = point
-        return normals
-
     def _contains(self, other):
         """ Subroutine for containment checks. Returns:
             * -1 if point outside of polygon
@@ -356,17 +564,6 @@ class Polygon(BaseShape):
         else:
             return True
 
-    def intersects(self, other):
-        if isinstance(other, Polygon):
-            return intersect_polygon_polygon(self, other)
-        elif isinstance(other, Triangle):
-            return intersect_triangle_polygon(other, self)
-        elif isinstance(other, Circle):
-            return intersect_circle_polygon(other, self)
-        elif isinstance(other, AABB):
-            return intersect_aabb_polygon(other, self)
-        raise ValueError(other)
-
     def _closest_point(self, other):
         # import pdb
         # pdb.set_trace()
@@ -517,21 +714,9 @@ class Polygon(BaseShape):
                 return None
         return pivot
 
-    def raycast(self, point, direction):
-        vertices = self.points
-        normals = self.normals
-        return _raycast(point, direction, vertices, normals)
-
     def translate(self, dv):
-        return Polygon([p + dv for p in self.points])
-
-
-from .intersection import (  # noqa
-    intersect_triangle_triangle,
-    intersect_circle_triangle,
-    intersect_aabb_triangle,
-    intersect_triangle_polygon,
-    intersect_polygon_polygon,
-    intersect_circle_polygon,
-    intersect_aabb_polygon
-)
+        return Polygon(
+            [p + dv for p in self.points])._inherit_prepared(self, dv)
+
+
+from . import intersection  # noqa  Registers intersection functions
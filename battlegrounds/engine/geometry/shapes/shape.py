@@ -1,5 +1,29 @@
 from abc import ABCMeta, abstractmethod
 
+import numpy as np
+
+from .dispatch import intersect
+from ..vector import Vector
+from ..vector_array import as_points
+
+
+def as_rays(origins, directions, max_distance=None):
+    """ Normalize arguments of `raycast_many` to 3 ndarrays of equal length:
+        (N, 2) origins, (N, 2) directions and (N, ) max distances. A single
+        `Vector` origin is shared by all directions.
+    """
+    origins = as_points(origins)
+    directions = as_points(directions)
+    n = max(len(origins), len(directions))
+    origins = np.broadcast_to(origins, (n, 2))
+    directions = np.broadcast_to(directions, (n, 2))
+    if max_distance is None:
+        max_distance = np.full(n, np.inf)
+    else:
+        max_distance = np.broadcast_to(
+            np.asarray(max_distance, dtype=np.float64), (n, ))
+    return origins, directions, max_distance
+
 
 class BaseShape(object):
     __metaclass__ = ABCMeta
@@ -29,12 +53,30 @@ class BaseShape(object):
         """
         raise NotImplementedError()
 
-    @abstractmethod
     def intersects(self, shape):
         """ Check if 2 shapes intersect. Return None or manifold object.
-            More info in `intersects.py`.
+            More info in `intersection.py`, the function for the pair of
+            types is looked up in `dispatch.py`.
         """
-        raise NotImplementedError()
+        return intersect(self, shape)
+
+    def raycast_many(self, origins, directions, max_distance=None):
+        """ Batched version of `raycast`. Takes (N, 2) arrays (or
+            `VectorArray`) of origins and directions and returns an array of
+            N hit distances with NaN for a miss or for hits further than
+            `max_distance`.
+            This fallback casts rays one by one, shapes override it with a
+            vectorized version.
+        """
+        origins, directions, max_distance = as_rays(
+            origins, directions, max_distance)
+        result = np.full(len(origins), np.nan)
+        for i, ((px, py), (dx, dy)) in enumerate(zip(
+                origins.tolist(), directions.tolist())):
+            t = self.raycast(Vector(px, py), Vector(dx, dy))
+            if t is not None and t <= max_distance[i]:
+                result[i] = t
+        return result
 
 
 class BaseIntersection(object):
@@ -1,4 +1,248 @@
 """ All sweep functions
     Sweep is an operation, that allows to define TOI (time of impact) and POI
     (point of impact) for 2 moving shapes.
+
+    Swept shapes cover the whole area a shape passes while moving by a
+    translation. A circle sweeps into a capsule (`SweptCircle`), a polygon or
+    an AABB sweeps into the convex hull of its start and end positions
+    (`SweptPolygon`). Both are convex, so they can be tested for overlap with
+    any other shape to check if something stands in the way of a movement.
+
+    `time_of_impact` finds the first moment 2 moving shapes touch. Pairs with
+    a closed form solution are reduced to a ray cast:
+      * Circle vs Circle - ray against a circle with summed radius
+      * AABB vs AABB - ray against the Minkowski sum of boxes
+      * Circle vs AABB - ray against the box enlarged by radius and, if the
+        hit is in a vertex region, against a circle around the vertex
+    All other pairs use conservative advancement (see Brian Mirtich's thesis
+    or Erin Catto's "Continuous Collision" GDC 2013 talk): GJK gives the
+    distance and the normal between shapes, and shapes can not touch before
+    they cover that distance with their closing speed along the normal. So we
+    can safely advance the time by `distance / closing speed` and repeat,
+    until shapes are close enough.
+
+    Example:
+
+        # Will the bullet hit the crate during this tick?
+        t = time_of_impact(bullet, velocity * dt, crate)
+        if t is not None:
+            hit_position = bullet.center + velocity * dt * t
 """
+from .aabb import AABB
+from .circle import Circle
+from .dispatch import register_intersection
+from .gjk import SimplexCache, DistanceProxy, gjk_distance, gjk_penetration
+from .intersection import Manifold
+from .polygon import Polygon
+from .shape import BaseShape
+from ..utils import orient, seg_closest, min_vector, max_vector
+from ..vector import EPSILON, Vector
+
+# Distance, at which conservative advancement considers shapes touching
+TOI_TOLERANCE = 1e-4
+TOI_MAX_ITERATIONS = 30
+
+
+def _convex_hull(points):
+    """ Andrew's monotone chain. Returns hull vertices in counter-clockwise
+        order without collinear points.
+    """
+    points = sorted(set(points), key=lambda p: (p.x, p.y))
+    if len(points) < 3:
+        return points
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and orient(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and orient(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+class SweptCircle(BaseShape):
+    """ Area covered by a circle moving by `translation`. It's a capsule:
+        all points within `radius` of the segment between start and end
+        centers.
+    """
+
+    def __init__(self, circle, translation):
+        assert isinstance(circle, Circle)
+        self._circle = circle
+        self._translation = translation
+        self._start = circle.center
+        self._end = circle.center + translation
+        self._r = circle.radius
+
+    @property
+    def circle(self):
+        return self._circle
+
+    @property
+    def translation(self):
+        return self._translation
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        return self._end
+
+    @property
+    def radius(self):
+        return self._r
+
+    def __repr__(self):
+        return "SweptCircle({}, {})".format(self._circle, self._translation)
+
+    def bbox(self):
+        r = Vector(self._r, self._r)
+        return AABB(min_vector(self._start, self._end) - r,
+                    max_vector(self._start, self._end) + r)
+
+    def contains(self, point):
+        assert isinstance(point, Vector)
+        closest = seg_closest(self._start, self._end, point)
+        return closest.distance2(point) <= self._r ** 2
+
+    def distance(self, point):
+        assert isinstance(point, Vector)
+        dist = seg_closest(self._start, self._end, point).distance(point)
+        if dist >= self._r:
+            return dist - self._r
+        return -1
+
+    def closest_point(self, point):
+        assert isinstance(point, Vector)
+        closest = seg_closest(self._start, self._end, point)
+        d = point - closest
+        dist = d.length()
+        if dist <= self._r:
+            return point
+        return closest + d * (self._r / dist)
+
+    def translate(self, dv):
+        return SweptCircle(self._circle.translate(dv), self._translation)
+
+    def _distance_proxy(self):
+        s, e = self._start, self._end
+        return DistanceProxy(((s.x, s.y), (e.x, e.y)), self._r)
+
+
+class SweptPolygon(Polygon):
+    """ Area covered by a polygon, triangle or AABB moving by
+        `translation`. It's a regular convex polygon, so all polygon
+        operations work on it.
+    """
+
+    def __init__(self, shape, translation):
+        if isinstance(shape, AABB):
+            lo, hi = shape.min, shape.max
+            points = [lo, Vector(hi.x, lo.y), hi, Vector(lo.x, hi.y)]
+        else:
+            points = list(shape.points)
+        self._shape = shape
+        self._translation = translation
+        super().__init__(
+            _convex_hull(points + [p + translation for p in points]))
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def translation(self):
+        return self._translation
+
+    def __repr__(self):
+        return "SweptPolygon({}, {})".format(self._shape, self._translation)
+
+
+def intersect_swept_circle(capsule: SweptCircle, other) -> Manifold:
+    """ Penetration based manifold without contact points. Works with any
+        convex shape through GJK/EPA.
+    """
+    penetration = gjk_penetration(capsule, other)
+    if penetration is None:
+        return None
+    return Manifold(depth=penetration.depth, normal=penetration.normal)
+
+
+register_intersection(SweptCircle, BaseShape, intersect_swept_circle)
+
+
+def sweep(shape, translation):
+    """ Swept shape for any of the basic shapes """
+    if isinstance(shape, Circle):
+        return SweptCircle(shape, translation)
+    return SweptPolygon(shape, translation)
+
+
+def _toi_circle_aabb(circle, aabb, movement):
+    c, r = circle.center, circle.radius
+    big = AABB(aabb.min - Vector(r, r), aabb.max + Vector(r, r))
+    t = big.time_of_impact(c, movement)
+    if t is None:
+        return None
+    p = c + movement * t
+    if aabb.min.x <= p.x <= aabb.max.x or aabb.min.y <= p.y <= aabb.max.y:
+        # Hit an edge of the box
+        return t
+    # Hit the rounded corner. Center can still miss the vertex circle here
+    vertex = aabb.closest_point(p)
+    return Circle(vertex, r).time_of_impact(c, movement)
+
+
+def _toi_conservative(a, b, movement, simplex_cache=None):
+    if simplex_cache is None:
+        simplex_cache = SimplexCache()
+    proxy_b = DistanceProxy.from_shape(b)
+    t = 0.0
+    for _ in range(TOI_MAX_ITERATIONS):
+        out = gjk_distance(
+            a.translate(movement * t), proxy_b, simplex_cache=simplex_cache)
+        if out.distance <= TOI_TOLERANCE:
+            return t
+        normal = (out.point_b - out.point_a) * (1 / out.distance)
+        closing = movement.dot(normal)
+        if closing <= EPSILON:
+            # Shapes move apart or in parallel
+            return None
+        t += (out.distance - TOI_TOLERANCE * 0.5) / closing
+        if t > 1:
+            return None
+    return t
+
+
+def time_of_impact(a, translation_a, b, translation_b=None,
+                   simplex_cache=None):
+    """ Fraction of the tick (in [0, 1]), at which `a` moving by
+        `translation_a` first touches `b` moving by `translation_b`.
+        Returns None if they don't touch during the tick and 0 if they
+        overlap at the start. Pass a `SimplexCache` to warm-start GJK for
+        pairs without a closed form solution.
+    """
+    movement = translation_a
+    if translation_b is not None:
+        movement = translation_a - translation_b
+
+    if isinstance(a, Circle) and isinstance(b, Circle):
+        t = Circle(b.center, a.radius + b.radius).time_of_impact(
+            a.center, movement)
+    elif isinstance(a, AABB) and isinstance(b, AABB):
+        ext = a.extents
+        t = AABB(b.min - ext, b.max + ext).time_of_impact(a.center, movement)
+    elif isinstance(a, Circle) and isinstance(b, AABB):
+        t = _toi_circle_aabb(a, b, movement)
+    elif isinstance(a, AABB) and isinstance(b, Circle):
+        t = _toi_circle_aabb(b, a, movement * -1)
+    else:
+        t = _toi_conservative(a, b, movement, simplex_cache)
+    if t is None or t > 1:
+        return None
+    return t
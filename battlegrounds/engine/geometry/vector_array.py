@@ -0,0 +1,234 @@
+""" Batched counterpart of `Vector`.
+    `VectorArray` holds N 2D vectors in a single (N, 2) float64 array, so
+    operations on thousands of points cost a couple of NumPy calls instead of
+    thousands of `Vector` allocations. Values are NOT rounded the way `Vector`
+    does it, so converting a list of vectors to an array and back is lossless.
+
+    Example:
+
+        positions = VectorArray.from_vectors([a.position for a in actors])
+        positions = positions + velocities * dt
+        for actor, pos in zip(actors, positions):
+            actor.position = pos  # Yields plain `Vector` objects
+"""
+import numbers
+
+import numpy as np
+
+from .vector import EPSILON2, Vector
+
+
+def as_points(value):
+    """ Coerce `VectorArray`, a sequence of `Vector`'s or any (N, 2)
+        array-like object to an (N, 2) float64 ndarray. A single `Vector` is
+        treated as an array of 1 point.
+    """
+    if isinstance(value, VectorArray):
+        return value._data
+    if isinstance(value, Vector):
+        return np.array([[value.x, value.y]], dtype=np.float64)
+    if isinstance(value, np.ndarray):
+        data = value.astype(np.float64, copy=False)
+    else:
+        value = list(value)
+        if value and isinstance(value[0], Vector):
+            return np.array([(v.x, v.y) for v in value], dtype=np.float64)
+        data = np.array(value, dtype=np.float64)
+    if data.size == 0:
+        return data.reshape(0, 2)
+    if data.ndim != 2 or data.shape[1] != 2:
+        raise ValueError("Expected an (N, 2) array, got shape {}".format(
+            data.shape))
+    return data
+
+
+def cos_sin_deg_many(deg):
+    """ Vectorized `cos_sin_deg`. Keeps perfect values for multiples of 90
+    """
+    deg = np.mod(deg, 360.0)
+    rad = np.radians(deg)
+    c, s = np.cos(rad), np.sin(rad)
+    right = np.mod(deg, 90.0) == 0
+    if np.any(right):
+        quarter = (deg // 90).astype(np.int64) % 4
+        c = np.where(right, np.array([1.0, 0.0, -1.0, 0.0])[quarter], c)
+        s = np.where(right, np.array([0.0, 1.0, 0.0, -1.0])[quarter], s)
+    return c, s
+
+
+class VectorArray(object):
+    """ N vectors stored as a contiguous (N, 2) float64 array
+    """
+
+    __slots__ = ("_data", )
+
+    # Make NumPy defer to our reflected operators, so `ndarray * VectorArray`
+    # scales vectors instead of producing an object array
+    __array_ufunc__ = None
+
+    def __init__(self, data):
+        self._data = np.ascontiguousarray(as_points(data))
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        return cls(as_points(vectors))
+
+    @classmethod
+    def from_xy(cls, xs, ys):
+        return cls(np.column_stack((
+            np.asarray(xs, dtype=np.float64),
+            np.asarray(ys, dtype=np.float64))))
+
+    @classmethod
+    def zeros(cls, n):
+        return cls(np.zeros((n, 2), dtype=np.float64))
+
+    @classmethod
+    def polar(cls, angles, lengths=1.0):
+        """ Create vectors from polar coordinates. Angles should be in radians.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        return cls.from_xy(np.cos(angles) * lengths, np.sin(angles) * lengths)
+
+    @classmethod
+    def polar_deg(cls, angles, lengths=1.0):
+        """ Create vectors from polar coordinates. Angles should be in degrees.
+        """
+        c, s = cos_sin_deg_many(np.asarray(angles, dtype=np.float64))
+        lengths = np.asarray(lengths, dtype=np.float64)
+        return cls.from_xy(c * lengths, s * lengths)
+
+    def to_vectors(self):
+        return [Vector(x, y) for x, y in self._data.tolist()]
+
+    @property
+    def data(self):
+        """ Underlying (N, 2) ndarray. Mutating it mutates this array """
+        return self._data
+
+    @property
+    def x(self):
+        return self._data[:, 0]
+
+    @property
+    def y(self):
+        return self._data[:, 1]
+
+    @property
+    def angle(self):
+        """ Angles the vectors make to the positive x axis in radians
+        """
+        return np.arctan2(self._data[:, 1], self._data[:, 0])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        for x, y in self._data.tolist():
+            yield Vector(x, y)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            x, y = self._data[index].tolist()
+            return Vector(x, y)
+        return VectorArray(self._data[index])
+
+    def __repr__(self):
+        return "VectorArray({})".format(self._data.tolist())
+
+    def copy(self):
+        return VectorArray(self._data.copy())
+
+    def _operand(self, other):
+        if isinstance(other, VectorArray):
+            return other._data
+        if isinstance(other, Vector):
+            return np.array((other.x, other.y), dtype=np.float64)
+        return None
+
+    def __add__(self, other):
+        other = self._operand(other)
+        if other is None:
+            return NotImplemented
+        return VectorArray(self._data + other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other = self._operand(other)
+        if other is None:
+            return NotImplemented
+        return VectorArray(self._data - other)
+
+    def __rsub__(self, other):
+        other = self._operand(other)
+        if other is None:
+            return NotImplemented
+        return VectorArray(other - self._data)
+
+    def __mul__(self, scalar):
+        """ Scale by a number or by an array of N numbers (one per vector)
+        """
+        # NumPy scalars, like elements of int arrays, are Real too
+        if isinstance(scalar, numbers.Real):
+            return VectorArray(self._data * scalar)
+        if isinstance(scalar, np.ndarray) and scalar.ndim <= 1:
+            return VectorArray(self._data * scalar.reshape(-1, 1))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return VectorArray(-self._data)
+
+    def length2(self):
+        """ Squared lengths are cheaper to compute """
+        d = self._data
+        return d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+
+    def length(self):
+        return np.hypot(self._data[:, 0], self._data[:, 1])
+
+    def unit(self):
+        """ Return unit vectors. Zero vectors stay zero """
+        lengths = self.length()
+        lengths[np.fabs(lengths - 1) < EPSILON2] = 1.0
+        lengths[lengths == 0] = 1.0
+        return VectorArray(self._data / lengths.reshape(-1, 1))
+
+    def rotate_deg(self, angle):
+        """ Rotate all vectors by `angle` degrees. `angle` can also be an array
+            of N angles, one per vector.
+        """
+        ca, sa = cos_sin_deg_many(np.asarray(angle, dtype=np.float64))
+        x, y = self._data[:, 0], self._data[:, 1]
+        return VectorArray.from_xy(x * ca - y * sa, x * sa + y * ca)
+
+    def dot(self, other):
+        """ Row-wise dot product with a `Vector` or another `VectorArray` """
+        other = self._operand(other)
+        assert other is not None
+        d = self._data * other
+        return d[:, 0] + d[:, 1]
+
+    def cross(self, other):
+        """ Row-wise 2D cross product (z of the 3D cross product) """
+        other = self._operand(other)
+        assert other is not None
+        if other.ndim == 1:
+            other = other.reshape(1, 2)
+        d = self._data
+        return d[:, 0] * other[:, 1] - d[:, 1] * other[:, 0]
+
+    def distance2(self, other):
+        other = self._operand(other)
+        assert other is not None
+        d = self._data - other
+        return d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+
+    def distance(self, other):
+        other = self._operand(other)
+        assert other is not None
+        d = self._data - other
+        return np.hypot(d[:, 0], d[:, 1])
@@ -1,10 +1,21 @@
+class lazy_property(object):
+    """ Compute the value on first access and cache it in the instance.
+        This is a non-data descriptor (it has no `__set__`), so once the value
+        is stored in object's __dict__ under the same name, attribute lookup
+        finds it there and this descriptor is not called anymore. A plain
+        `property` would not work here, as data descriptors take precedence
+        over instance __dict__.
+    """
 
-def lazy_property(fn):
-    def getter(self):
-        value = fn(self)
-        # Cache it for further access. By using the same name as our property
-        # we avoid further call of this function, as __getattr__ will just
-        # use the value in object's __dict__
-        self.__dict__[fn.__name__] = value
+    def __init__(self, fn):
+        self.fn = fn
+        self.__name__ = fn.__name__
+        self.__doc__ = fn.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        value = self.fn(obj)
+        # Cache it for further access
+        obj.__dict__[self.__name__] = value
         return value
-    return property(getter)
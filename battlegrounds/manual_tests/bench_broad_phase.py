@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+
+from engine.broad import DynamicAABB, SweepAndPrune
+from engine.broad.abc import PAIR_BEGIN, PAIR_PERSIST, PAIR_END
+from engine.geometry import AABB, Vector
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Broad phase pair update benchmark: actors walking '
+                    'around an arena')
+    parser.add_argument(
+        '--actors', help='Number of actors', type=int, default=2000)
+    parser.add_argument(
+        '--ticks', help='Number of simulated ticks', type=int, default=100)
+    parser.add_argument(
+        '--arena', help='Arena side length', type=float, default=300)
+    parser.add_argument(
+        '--radius', help='Actor radius', type=float, default=0.5)
+    parser.add_argument(
+        '--speed', help='Actor movement per tick', type=float, default=0.15)
+    parser.add_argument(
+        '--margin', help='Fat AABB margin', type=float, default=0.2)
+    parser.add_argument(
+        '--seed', type=int, default=0)
+    return parser
+
+
+def actor_aabb(position, radius):
+    r = Vector(radius, radius)
+    return AABB(position - r, position + r)
+
+
+def simulate(broad_phase, args):
+    rnd = random.Random(args.seed)
+    half = args.arena / 2
+    actors = []
+    start = time.perf_counter()
+    for i in range(args.actors):
+        position = Vector(rnd.uniform(-half, half), rnd.uniform(-half, half))
+        velocity = Vector(
+            rnd.uniform(-1, 1), rnd.uniform(-1, 1)).unit() * args.speed
+        node_id = broad_phase.add(i, actor_aabb(position, args.radius))
+        actors.append([node_id, position, velocity])
+    build_time = time.perf_counter() - start
+
+    events = {}
+
+    def callback(event, obj_a, obj_b):
+        events[event] = events.get(event, 0) + 1
+
+    broad_phase.update_pairs(callback)
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        for actor in actors:
+            node_id, position, velocity = actor
+            position = position + velocity
+            # Bounce off the arena walls
+            if abs(position.x) > half:
+                velocity = Vector(-velocity.x, velocity.y)
+            if abs(position.y) > half:
+                velocity = Vector(velocity.x, -velocity.y)
+            actor[1], actor[2] = position, velocity
+            broad_phase.move(
+                node_id, actor_aabb(position, args.radius), velocity)
+        broad_phase.update_pairs(callback)
+    tick_time = (time.perf_counter() - start) / args.ticks
+    return build_time, tick_time, events
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    print("{:>16} {:>10} {:>12} {:>8} {:>8} {:>10}".format(
+        "broad phase", "build, s", "tick, ms", "begin", "end", "persist"))
+    cases = [
+        ("DynamicAABB", lambda: DynamicAABB(margin=args.margin)),
+        ("SweepAndPrune", lambda: SweepAndPrune(margin=args.margin)),
+    ]
+    for name, factory in cases:
+        build_time, tick_time, events = simulate(factory(), args)
+        print("{:>16} {:>10.3f} {:>12.3f} {:>8} {:>8} {:>10}".format(
+            name, build_time, tick_time * 1000,
+            events.get(PAIR_BEGIN, 0), events.get(PAIR_END, 0),
+            events.get(PAIR_PERSIST, 0)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import random
+import time
+
+from engine.geometry import Vector, VectorArray
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Vector vs VectorArray benchmark')
+    parser.add_argument(
+        '--sizes', help='Comma separated point counts',
+        default="10000,100000,1000000")
+    parser.add_argument(
+        '--repeat', help='Best of N runs', type=int, default=3)
+    return parser
+
+
+def timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    print("{:>10} {:>12} {:>12} {:>12} {:>8}".format(
+        "points", "operation", "Vector, s", "Array, s", "speedup"))
+    for size in sizes:
+        vectors = [Vector(random.uniform(-100, 100), random.uniform(-100, 100))
+                   for _ in range(size)]
+        others = [Vector(random.uniform(-100, 100), random.uniform(-100, 100))
+                  for _ in range(size)]
+        array = VectorArray.from_vectors(vectors)
+        other_array = VectorArray.from_vectors(others)
+        target = Vector(3, 4)
+
+        cases = [
+            ("add",
+             lambda: [a + b for a, b in zip(vectors, others)],
+             lambda: array + other_array),
+            ("scale",
+             lambda: [a * 0.5 for a in vectors],
+             lambda: array * 0.5),
+            ("dot",
+             lambda: [a.dot(target) for a in vectors],
+             lambda: array.dot(target)),
+            ("length",
+             lambda: [a.length() for a in vectors],
+             lambda: array.length()),
+            ("unit",
+             lambda: [a.unit() for a in vectors],
+             lambda: array.unit()),
+            ("rotate_deg",
+             lambda: [a.rotate_deg(30) for a in vectors],
+             lambda: array.rotate_deg(30)),
+            ("distance",
+             lambda: [a.distance(b) for a, b in zip(vectors, others)],
+             lambda: array.distance(other_array)),
+        ]
+        for name, scalar, batched in cases:
+            t_scalar = timeit(scalar, args.repeat)
+            t_batched = timeit(batched, args.repeat)
+            print("{:>10} {:>12} {:>12.5f} {:>12.5f} {:>7.1f}x".format(
+                size, name, t_scalar, t_batched, t_scalar / t_batched))
+
+
+if __name__ == "__main__":
+    main()
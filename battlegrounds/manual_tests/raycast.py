@@ -1,6 +1,10 @@
 import argparse
+import math
 
-from engine.geometry import AABB, Circle, Polygon, Triangle, Vector
+import numpy as np
+
+from engine.geometry import (
+    AABB, Circle, Polygon, Triangle, Vector, VectorArray)
 from engine.geometry.line import Segment
 
 from engine._testutil import debug_draw
@@ -28,13 +32,14 @@ def main():
         "aabb": AABB(Vector(-3.5, -2.5), Vector(1, 4))
     }
     shape = shapes[args.shape]
+    directions = VectorArray.polar_deg(np.arange(360))
+    origins = directions * -10
+    hits = shape.raycast_many(origins, directions)
     segments = []
-    for angle in range(360, step=1):
-        d = Vector.polar_deg(angle)
-        p = d * -10
-        t = shape.raycast(p, d)
-        p2 = p + d * t
-        segments.append(Segment(p, p2))
+    for p, d, t in zip(origins, directions, hits.tolist()):
+        if math.isnan(t):
+            continue
+        segments.append(Segment(p, p + d * t))
 
     debug_draw(shape, *segments)
 
@@ -13,10 +13,9 @@ with codecs.open(os.path.join(os.path.abspath(os.path.dirname(
     except IndexError:
         raise RuntimeError('Unable to determine version.')
 
-if sys.version_info >= (3, 4):
-    install_requires = []
-else:
-    install_requires = ['asyncio']
+install_requires = ['numpy']
+if sys.version_info < (3, 4):
+    install_requires.append('asyncio')
 
 
 def read(f):
@@ -0,0 +1,114 @@
+from engine.broad import (
+    DynamicAABB, LooseQuadtree, SpatialHashGrid, SweepAndPrune)
+from engine.broad.composite import CompositeBroadPhase
+from engine.geometry import AABB, Circle, Vector
+
+from .._testutil import ShapeTestCase, StabObj, toi_callback
+
+
+class TestCompositeBroadPhase(ShapeTestCase):
+
+    def _create(self, static_cls=DynamicAABB):
+        self.props = [StabObj(Circle(Vector(x, 0), 1)) for x in (0, 10, 20)]
+        static = static_cls.from_items(
+            (prop, prop.shape.bbox()) for prop in self.props)
+        broad = CompositeBroadPhase(static=static)
+        self.actor = StabObj(Circle(Vector(5, 0), 1))
+        self.actor_node = broad.add(self.actor, self.actor.shape.bbox())
+        return broad
+
+    def _raycast_cb(self, obj, point, direction, max_distance):
+        hit_dist = obj.shape.raycast(point, direction)
+        if hit_dist is not None and hit_dist < max_distance:
+            return hit_dist
+        return None
+
+    def test_queries(self):
+        broad = self._create()
+        self.assertEqual(len(broad), 4)
+        query = AABB(Vector(-1, -1), Vector(11, 1))
+        self.assertEqual(
+            set(map(id, broad.query(query))),
+            set(map(id, [self.props[0], self.props[1], self.actor])))
+        self.assertEqual(broad.query(query, static=False), [self.actor])
+        self.assertNotIn(self.actor, broad.query(query, dynamic=False))
+        self.assertEqual(broad.query_point(Vector(5, 0)), [self.actor])
+
+        # Ray clipped by the actor does not return props behind it
+        res = broad.raycast(Vector(-5, 0.5), Vector(1, 0),
+                            callback=self._raycast_cb)
+        self.assertIs(res, self.props[0])
+        res = broad.raycast(Vector(7, 0.5), Vector(-1, 0),
+                            callback=self._raycast_cb)
+        self.assertIs(res, self.actor)
+        res = broad.raycast(Vector(7, 0.5), Vector(-1, 0), dynamic=False,
+                            callback=self._raycast_cb)
+        self.assertIs(res, self.props[0])
+
+        # Sweep clipped by the actor, same as the ray
+        shape = Circle(Vector(-5, 0), 0.5)
+        res = broad.shape_cast(shape, Vector(20, 0),
+                               callback=toi_callback)
+        self.assertIs(res, self.props[0])
+        res = broad.shape_cast(shape.translate(Vector(12, 0)),
+                               Vector(-20, 0), callback=toi_callback)
+        self.assertIs(res, self.actor)
+        res = broad.shape_cast(shape.translate(Vector(12, 0)),
+                               Vector(-20, 0), callback=toi_callback,
+                               dynamic=False)
+        self.assertIs(res, self.props[0])
+
+        r = list(broad.closest(Vector(8.5, 0)))
+        self.assertEqual(r, [self.props[1], self.actor, self.props[0],
+                             self.props[2]])
+        r = list(broad.closest(Vector(8.5, 0), k=2, static=False))
+        self.assertEqual(r, [self.actor])
+
+    def test_closest_static_parts(self):
+        # Every broad phase can be the static part
+        for static_cls in (DynamicAABB, SpatialHashGrid, SweepAndPrune,
+                           LooseQuadtree):
+            broad = self._create(static_cls=static_cls)
+            r = list(broad.closest(Vector(8.5, 0)))
+            self.assertEqual(r, [self.props[1], self.actor, self.props[0],
+                                 self.props[2]])
+            items = list(broad.static.closest_items(Vector(8.5, 0), k=2))
+            self.assertEqual(items, [(0.5, self.props[1]),
+                                     (7.5, self.props[0])])
+
+    def test_stats(self):
+        broad = self._create(static_cls=SpatialHashGrid)
+        self.assertIsNone(broad.stats)
+        self.assertIsNone(broad.stats_snapshot())
+        stats = broad.enable_stats()
+        self.assertEqual(set(stats), {"static", "dynamic"})
+        # Small moves stay in the fat AABB
+        for x in (5.1, 5.2, 9):
+            broad.move(self.actor_node, Circle(Vector(x, 0), 1).bbox())
+        broad.query(AABB(Vector(-1, -1), Vector(1, 1)), dynamic=False)
+        snapshot = broad.stats_snapshot()
+        static, dynamic = snapshot["static"], snapshot["dynamic"]
+        self.assertEqual(static["queries"]["query"]["calls"], 1)
+        self.assertEqual(static["queries"]["query"]["results"], 1)
+        self.assertEqual(dynamic["queries"]["query"]["calls"], 0)
+        self.assertEqual((dynamic["moves"], dynamic["reinserts"]), (3, 1))
+        self.assertEqual(static["quality"]["objects"], 3)
+        self.assertEqual(dynamic["quality"]["leaves"], 1)
+        broad.remove(self.actor_node)
+        self.assertEqual(broad.stats["dynamic"].removes, 1)
+        self.assertEqual(len(broad), 3)
+
+    def test_snapshot(self):
+        broad = self._create()
+        snapshot = broad.snapshot()
+        query = AABB(Vector(-1, -1), Vector(11, 1))
+        broad.move(self.actor_node, Circle(Vector(30, 0), 1).bbox())
+        self.assertEqual(snapshot.query(query, static=False), [self.actor])
+        self.assertEqual(broad.query(query, static=False), [])
+        self.assertEqual(len(snapshot), 4)
+        self.assertIsNone(snapshot.stats)
+
+        # Parts without snapshots can't be shared with readers
+        broad = self._create(static_cls=SpatialHashGrid)
+        with self.assertRaises(NotImplementedError):
+            broad.snapshot()
@@ -1,19 +1,15 @@
+import math
+import random
+import threading
+
 from engine.broad import DynamicAABB
+from engine.broad.abc import PAIR_BEGIN, PAIR_PERSIST, PAIR_END
 from engine.geometry import AABB, Circle, Polygon, Triangle, Vector
 
 import pytest
 
-from .._testutil import ShapeTestCase
-
-
-class StabObj:
-
-    def __init__(self, shape, position=Vector(0, 0)):
-        self.shape = shape
-        self.position = position
-
-    def __str__(self):
-        return "StabObj({!r})".format(self.shape)
+from .._testutil import (
+    ShapeTestCase, StabObj, check_shape_cast, toi_callback)
 
 
 class TestDynamicAABB(ShapeTestCase):
@@ -36,16 +32,15 @@ class TestDynamicAABB(ShapeTestCase):
     def _get_shapes(self, objects):
         return [x.shape for x in objects]
 
-    def _dump_tree(self, node):
-        if hasattr(node, '_root'):
-            # Actually passed tree object directly
-            node = node._root
+    def _dump_tree(self, tree, node=None):
+        if node is None:
+            node = tree._root
         result = []
-        if node.leaf:
-            result.append(node.obj.shape)
+        if tree._left[node] == -1:
+            result.append(tree.get_object(node).shape)
         else:
-            result.append(self._dump_tree(node.left))
-            result.append(self._dump_tree(node.right))
+            result.append(self._dump_tree(tree, tree._left[node]))
+            result.append(self._dump_tree(tree, tree._right[node]))
         return result
 
     def _raycast_cb(self, obj, point, direction, max_distance):
@@ -73,6 +68,95 @@ class TestDynamicAABB(ShapeTestCase):
             self._shapes['aabb'], self._shapes['circle'],
             self._shapes['triangle']]))
 
+    def test_query_callback_and_out(self):
+        tree = self._create_tree()
+        query = AABB(Vector(-2, -2), Vector(2, 2))
+        expected = tree.query(query)
+        self.assertEqual(len(expected), 3)
+
+        # Results are appended to the passed list
+        out = ["marker"]
+        self.assertIs(tree.query(query, out=out), out)
+        self.assertEqual(out, ["marker"] + expected)
+
+        # Callback sees the same objects and can stop the query
+        seen = []
+        self.assertTrue(tree.query(query, callback=seen.append))
+        self.assertEqual(seen, expected)
+        seen = []
+
+        def first_only(obj):
+            seen.append(obj)
+            return False
+        self.assertFalse(tree.query(query, callback=first_only))
+        self.assertEqual(seen, expected[:1])
+
+        # Nested queries from a callback
+        nested = []
+
+        def requery(obj):
+            nested.append(tree.query(obj.shape))
+        tree.query(query, callback=requery)
+        for obj, found in zip(expected, nested):
+            self.assertIn(obj, found)
+
+        self.assertEqual(DynamicAABB().query(query), [])
+        self.assertTrue(DynamicAABB().query(query, callback=first_only))
+
+    def test_query_point(self):
+        tree = self._create_tree()
+        r = self._get_shapes(tree.query_point(Vector(0.5, 0.2)))
+        self.assertEqual(set(r), set([
+            self._shapes['circle'], self._shapes['triangle']]))
+        r = self._get_shapes(tree.query_point(Vector(-1.5, -1.5)))
+        self.assertEqual(r, [self._shapes['aabb']])
+        self.assertEqual(tree.query_point(Vector(10, 10)), [])
+        self.assertEqual(DynamicAABB().query_point(Vector(0, 0)), [])
+
+    def test_closest(self):
+        tree = DynamicAABB()
+        circles = []
+        for i in range(100):
+            c = Circle(Vector((i * 37) % 101, (i * 53) % 97), 0.5 + i % 3)
+            circles.append(c)
+            tree.add(StabObj(c), c.bbox())
+        point = Vector(40, 40)
+
+        # Ordered by distance to AABB's
+        by_aabb = sorted(circles, key=lambda c: c.bbox().distance(point))
+        r = self._get_shapes(tree.closest(point))
+        self.assertEqual(len(r), 100)
+        self.assertEqual(
+            [c.bbox().distance(point) for c in r],
+            [c.bbox().distance(point) for c in by_aabb])
+
+        # Ordered by exact distance
+        r = self._get_shapes(tree.closest(
+            point, k=5,
+            distance=lambda obj, p: obj.shape.distance(p)))
+        self.assertEqual(r, sorted(
+            circles, key=lambda c: c.distance(point))[:5])
+
+        # Limits
+        r = self._get_shapes(tree.closest(point, max_distance=10))
+        self.assertEqual(
+            set(r), set(c for c in circles
+                        if c.bbox().distance(point) <= 10))
+        self.assertEqual(list(tree.closest(point, k=0)), [])
+        self.assertEqual(list(DynamicAABB().closest(point)), [])
+
+        # Lazy: the first result does not need the whole tree
+        iterator = tree.closest(point)
+        self.assertEqual(next(iterator).shape, by_aabb[0])
+
+        # Root is a leaf
+        tree = DynamicAABB()
+        tree.add(StabObj(circles[0]), circles[0].bbox())
+        self.assertEqual(list(tree.closest(point, max_distance=1)), [])
+        self.assertEqual(
+            list(tree.closest_items(point)),
+            [(circles[0].bbox().distance(point), tree.get_object(0))])
+
     def test_raycast(self):
         tree = self._create_tree()
         # Void raycast (not in tree at all)
@@ -109,6 +193,96 @@ class TestDynamicAABB(ShapeTestCase):
         res = tree.raycast(p, d, callback=self._raycast_cb)
         self.assertEqual(res.shape, self._shapes['poly'])
 
+    def test_raycast_many(self):
+        tree = DynamicAABB()
+        circles = []
+        for i in range(60):
+            c = Circle(Vector((i * 37) % 41 - 20, (i * 53) % 43 - 20),
+                       0.5 + i % 3)
+            circles.append(c)
+            tree.add(StabObj(c), c.bbox())
+
+        def many_cb(ray, obj, point, direction, max_distance):
+            return self._raycast_cb(obj, point, direction, max_distance)
+
+        # A fan from one origin, including axis aligned rays
+        origin = Vector(1, 2)
+        directions = [Vector(1, 0), Vector(0, -1), Vector(-1, 0)] + [
+            Vector(math.cos(a * 0.1), math.sin(a * 0.1)) for a in range(63)]
+        for max_distance in [None, 10]:
+            res = tree.raycast_many(
+                origin, directions, max_distance, callback=many_cb)
+            self.assertEqual(len(res), len(directions))
+            for d, obj in zip(directions, res):
+                self.assertIs(obj, tree.raycast(
+                    origin, d, callback=self._raycast_cb,
+                    max_distance=max_distance))
+
+        # Different origins, terminated rays are not reported again
+        origins = [Vector(-30, y) for y in range(-20, 20)]
+        terminated = set()
+
+        def any_cb(ray, obj, point, direction, max_distance):
+            self.assertNotIn(ray, terminated)
+            if obj.shape.raycast(point, direction) is not None:
+                terminated.add(ray)
+                return 0
+            return None
+        res = tree.raycast_many(origins, Vector(1, 0), callback=any_cb)
+        for p, obj in zip(origins, res):
+            hit = any(c.raycast(p, Vector(1, 0)) is not None
+                      for c in circles)
+            self.assertEqual(obj is not None, hit)
+
+        self.assertEqual(
+            DynamicAABB().raycast_many(origin, directions, callback=many_cb),
+            [None] * len(directions))
+
+    def test_shape_cast(self):
+        tree = DynamicAABB()
+        objects = []
+        for i in range(80):
+            c = Circle(Vector((i * 37) % 101 - 50, (i * 53) % 97 - 50),
+                       0.5 + i % 3)
+            objects.append(StabObj(c))
+            tree.add(objects[-1], c.bbox())
+        check_shape_cast(self, tree, objects)
+
+        # Corridor between 2 walls, cast shape only fits if it's thin
+        tree = DynamicAABB()
+        walls = [StabObj(AABB(Vector(0, 2), Vector(10, 3))),
+                 StabObj(AABB(Vector(0, -3), Vector(10, -2)))]
+        end = StabObj(Circle(Vector(20, 0), 1))
+        for obj in walls + [end]:
+            tree.add(obj, obj.shape.bbox())
+        thin = Circle(Vector(-5, 0), 1)
+        self.assertIs(tree.shape_cast(
+            thin, Vector(30, 0), callback=toi_callback), end)
+        wide = AABB(Vector(-6, -2.5), Vector(-4, 2.5))
+        self.assertIn(tree.shape_cast(
+            wide, Vector(30, 0), callback=toi_callback), walls)
+        # Sweep limited by `max_fraction` and by the translation
+        self.assertIsNone(tree.shape_cast(
+            thin, Vector(30, 0), callback=toi_callback, max_fraction=0.5))
+        self.assertIsNone(tree.shape_cast(
+            thin, Vector(10, 0), callback=toi_callback))
+        # No translation reports overlapping objects
+        self.assertIs(tree.shape_cast(
+            Circle(Vector(21, 1), 1), Vector(0, 0), callback=toi_callback),
+            end)
+
+        # Terminated cast
+        visited = []
+
+        def any_cb(obj, shape, translation, max_fraction):
+            visited.append(obj)
+            return 0
+        self.assertIs(tree.shape_cast(wide, Vector(30, 0), callback=any_cb),
+                      visited[0])
+        self.assertEqual(len(visited), 1)
+        self.assertIsNone(DynamicAABB().shape_cast(
+            thin, Vector(1, 0), callback=any_cb))
+
     def test_insert_big_and_small(self):
         # This test assures the surface is used in inserts
 
@@ -130,9 +304,317 @@ class TestDynamicAABB(ShapeTestCase):
         tree = DynamicAABB()
         c1 = StabObj(Circle(Vector(0, 0), 1))
         node_id = tree.add(c1, c1.shape.bbox())
-        self.assertTrue(tree._root)
+        self.assertEqual(len(tree), 1)
+        self.assertEqual(tree.get_height(), 1)
         tree.remove(node_id)
-        self.assertFalse(tree._root)
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(tree.get_height(), 0)
+        with self.assertRaises(KeyError):
+            tree.remove(node_id)
+
+    def _check_tree(self, tree):
+        # Every node's AABB must enclose both children and links must be
+        # consistent
+        node = tree._root
+        if node == -1:
+            return
+        self.assertEqual(tree._parent[node], -1)
+        stack = [node]
+        leaves = 0
+        while stack:
+            node = stack.pop()
+            left, right = tree._left[node], tree._right[node]
+            if left == -1:
+                self.assertEqual(tree._height[node], 0)
+                leaves += 1
+                continue
+            aabb = tree._get_aabb(node)
+            for child in (left, right):
+                self.assertEqual(tree._parent[child], node)
+                self.assertTrue(aabb.contains_aabb(tree._get_aabb(child)))
+                stack.append(child)
+            self.assertEqual(
+                tree._height[node],
+                1 + max(tree._height[left], tree._height[right]))
+        self.assertEqual(leaves, len(tree))
+        # Each node is either in the tree or in the free list
+        self.assertEqual(
+            2 * leaves - 1 + len(tree._free), len(tree._height))
+
+    def test_move(self):
+        tree = DynamicAABB(margin=1)
+        objects = []
+        for i in range(20):
+            c = Circle(Vector(i * 3, 0), 1)
+            obj = StabObj(c)
+            objects.append((obj, tree.add(obj, c.bbox())))
+        obj, node_id = objects[5]
+        self.assertEqual(
+            tree.get_fat_aabb(node_id),
+            AABB(Vector(13, -2), Vector(17, 2)))
+        self.assertIs(tree.get_object(node_id), obj)
+
+        # Small movement fits the fat AABB - no changes in tree
+        c = Circle(Vector(15.5, 0.5), 1)
+        self.assertFalse(tree.move(node_id, c.bbox(), Vector(0.5, 0.5)))
+        self.assertEqual(
+            tree.get_fat_aabb(node_id),
+            AABB(Vector(13, -2), Vector(17, 2)))
+
+        # Big movement reinserts the leaf with a box extended along the
+        # displacement
+        c = Circle(Vector(15, 10), 1)
+        self.assertTrue(tree.move(node_id, c.bbox(), Vector(0, 2)))
+        self.assertEqual(
+            tree.get_fat_aabb(node_id),
+            AABB(Vector(13, 8), Vector(17, 16)))
+        self._check_tree(tree)
+        self.assertEqual(
+            tree.query_shape(Circle(Vector(15, 14), 0.5)), [obj])
+        self.assertNotIn(obj, tree.query_shape(Circle(Vector(15, 0), 0.5)))
+
+        # Move all of them, including multiple reinsertions
+        for step in range(1, 5):
+            for i, (obj, node_id) in enumerate(objects):
+                c = Circle(Vector(i * 3, step * 1.5 * (i % 3)), 1)
+                tree.move(node_id, c.bbox(), Vector(0, 1.5 * (i % 3)))
+                self._check_tree(tree)
+        for obj, node_id in objects:
+            tree.remove(node_id)
+            self._check_tree(tree)
+        self.assertEqual(tree.get_height(), 0)
+        with self.assertRaises(KeyError):
+            tree.move(node_id, c.bbox())
+
+    def test_sorted_insert_balanced(self):
+        # Props in map files come in sorted order, which without rotations
+        # degrades the tree into a list
+        tree = DynamicAABB()
+        nodes = []
+        for i in range(256):
+            c = Circle(Vector(i * 3, i % 2), 1)
+            nodes.append(tree.add(StabObj(c), c.bbox()))
+        self._check_tree(tree)
+        self.assertLessEqual(tree.get_height(), 2 * 8 + 1)
+        self.assertEqual(len(tree.query_shape(Circle(Vector(30, 0), 2))), 3)
+
+        # Removal keeps it balanced too
+        for node_id in nodes[:200]:
+            tree.remove(node_id)
+        self._check_tree(tree)
+        self.assertLessEqual(tree.get_height(), 2 * 6 + 1)
+        left = tree._left[tree._root]
+        self.assertEqual(tree.get_height(left), tree._height[left] + 1)
+
+        self.assertEqual(DynamicAABB().get_height(), 0)
+
+    def test_node_reuse(self):
+        tree = DynamicAABB()
+        shapes = [Circle(Vector(i * 3, 0), 1) for i in range(32)]
+        nodes = [tree.add(StabObj(c), c.bbox()) for c in shapes]
+        capacity = len(tree._height)
+        self.assertEqual(capacity, 2 * 32 - 1)
+
+        # Churn does not grow the pool
+        for _ in range(3):
+            for node_id in nodes[:16]:
+                tree.remove(node_id)
+            self._check_tree(tree)
+            nodes[:16] = [
+                tree.add(StabObj(c), c.bbox()) for c in shapes[:16]]
+            self._check_tree(tree)
+            self.assertEqual(len(tree._height), capacity)
+        self.assertEqual(len(tree.query_shape(shapes[3])), 1)
+
+    def test_copy(self):
+        tree = self._create_tree()
+        copy = tree.copy()
+        self.assertEqual(self._dump_tree(copy), self._dump_tree(tree))
+
+        # Trees are independent after copying
+        c = Circle(Vector(10, 10), 1)
+        node_id = copy.add(StabObj(c), c.bbox())
+        self._check_tree(copy)
+        self._check_tree(tree)
+        self.assertEqual(len(copy), len(tree) + 1)
+        self.assertEqual(tree.query_shape(c), [])
+        copy.remove(node_id)
+        self.assertEqual(self._dump_tree(copy), self._dump_tree(tree))
+
+    def test_snapshot(self):
+        tree = self._create_tree()
+        snapshot = tree.snapshot()
+        # Arrays are shared till the tree changes
+        self.assertIs(snapshot._min_x, tree._min_x)
+        dump = self._dump_tree(tree)
+        query = AABB(Vector(-3, -3), Vector(5, 5))
+        found = set(map(id, snapshot.query(query)))
+        self.assertEqual(len(found), 4)
+
+        # Nothing done to the tree is seen by the snapshot
+        c = Circle(Vector(10, 10), 1)
+        node_id = tree.add(StabObj(c), c.bbox())
+        self.assertIsNot(snapshot._min_x, tree._min_x)
+        tree.move(0, AABB(Vector(20, 20), Vector(21, 21)))
+        tree.remove(1)
+        self._check_tree(tree)
+        self.assertEqual(self._dump_tree(snapshot), dump)
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(set(map(id, snapshot.query(query))), found)
+        self.assertEqual(snapshot.query(c), [])
+        self.assertEqual(len(list(snapshot.closest(Vector(0, 0)))), 4)
+        res = snapshot.raycast(Vector(-5, 0.5), Vector(1, 0),
+                               callback=self._raycast_cb)
+        self.assertIs(res.shape, self._shapes['circle'])
+        with self.assertRaises(KeyError):
+            snapshot.get_object(node_id)
+        self.assertFalse(hasattr(snapshot, "add"))
+        # Queries don't write traversal counters to the shared snapshot
+        snapshot.raycast_many([(-5, 0.5)] * 10, [(1, 0)] * 10,
+                              callback=lambda ray, *args: None)
+        self.assertNotIn("_nodes_visited", vars(snapshot))
+        self.assertNotIn("_leaves_tested", vars(snapshot))
+
+        # Next snapshot sees the changes
+        snapshot = tree.snapshot()
+        self.assertEqual(self._dump_tree(snapshot), self._dump_tree(tree))
+        self.assertEqual(snapshot.get_object(node_id).shape, c)
+
+    def test_snapshot_concurrent_readers(self):
+        rnd = random.Random(4)
+        tree = DynamicAABB(margin=0.5)
+        nodes = []
+        for _ in range(200):
+            c = Circle(Vector(rnd.uniform(-50, 50), rnd.uniform(-50, 50)), 1)
+            nodes.append(tree.add(StabObj(c), c.bbox()))
+        snapshot = tree.snapshot()
+        query = AABB(Vector(-20, -20), Vector(20, 20))
+        expected = set(map(id, snapshot.query(query)))
+        errors = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                found = set(map(id, snapshot.query(query)))
+                if found != expected:
+                    errors.append(found)
+                    return
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(20):
+                for node_id in nodes:
+                    c = Circle(Vector(rnd.uniform(-50, 50),
+                                      rnd.uniform(-50, 50)), 1)
+                    tree.move(node_id, c.bbox())
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self._check_tree(tree)
+
+    def test_from_items(self):
+        items = []
+        for i in range(300):
+            c = Circle(Vector((i * 7) % 50, i // 10 + (i % 3) * 0.3), 0.5)
+            items.append((StabObj(c), c.bbox()))
+        tree = DynamicAABB.from_items(items)
+        self._check_tree(tree)
+        self.assertEqual(len(tree), 300)
+        for i, (obj, aabb) in enumerate(items):
+            self.assertIs(tree.get_object(i), obj)
+            self.assertEqual(tree.get_fat_aabb(i), aabb)
+        self.assertLessEqual(tree.get_height(), 20)
+
+        # Same results as a tree built incrementally, with less total area
+        incremental = DynamicAABB()
+        for obj, aabb in items:
+            incremental.add(obj, aabb)
+        for query in [Circle(Vector(10, 10), 3), AABB(
+                Vector(-1, -1), Vector(60, 5)), Circle(Vector(100, 0), 1)]:
+            self.assertEqual(
+                set(map(id, tree.query_shape(query))),
+                set(map(id, incremental.query_shape(query))))
+
+        def total_area(tree):
+            return sum(
+                tree._area(i) for i in range(len(tree._height))
+                if tree._height[i] > 0)
+        self.assertLess(total_area(tree), total_area(incremental))
+
+        # Still a dynamic tree
+        for i in range(0, 300, 2):
+            tree.remove(i)
+        c = Circle(Vector(100, 100), 1)
+        tree.add(StabObj(c), c.bbox())
+        self._check_tree(tree)
+        self.assertEqual(len(tree.query_shape(c)), 1)
+
+        # Degenerate inputs
+        self.assertEqual(DynamicAABB.from_items([]).get_height(), 0)
+        shape = AABB(Vector(0, 0), Vector(1, 1))
+        tree = DynamicAABB.from_items(
+            [(StabObj(shape), shape) for _ in range(64)], margin=1)
+        self._check_tree(tree)
+        self.assertEqual(tree.get_height(), 7)
+        self.assertEqual(tree.get_fat_aabb(0), shape.inflate(1))
+
+    def _update_pairs(self, tree):
+        events = {PAIR_BEGIN: set(), PAIR_PERSIST: set(), PAIR_END: set()}
+
+        def callback(event, obj_a, obj_b):
+            pair = frozenset([obj_a.name, obj_b.name])
+            self.assertNotIn(pair, events[event])
+            events[event].add(pair)
+        tree.update_pairs(callback)
+        return {event: set(tuple(sorted(pair)) for pair in pairs)
+                for event, pairs in events.items()}
+
+    def test_update_pairs(self):
+        tree = DynamicAABB()
+        nodes = {}
+        for name, x in [("a", 0), ("b", 1.5), ("c", 10), ("d", 20)]:
+            obj = StabObj(Circle(Vector(x, 0), 1))
+            obj.name = name
+            nodes[name] = tree.add(obj, obj.shape.bbox())
+
+        events = self._update_pairs(tree)
+        self.assertEqual(events[PAIR_BEGIN], {("a", "b")})
+        self.assertEqual(events[PAIR_PERSIST] | events[PAIR_END], set())
+        self.assertEqual(tree.pair_count, 1)
+
+        # Nothing moved
+        events = self._update_pairs(tree)
+        self.assertEqual(events[PAIR_PERSIST], {("a", "b")})
+        self.assertEqual(events[PAIR_BEGIN] | events[PAIR_END], set())
+
+        # `c` moves to `d` and away from nothing, `b` moves away from `a`
+        tree.move(nodes["c"], Circle(Vector(19, 0), 1).bbox())
+        tree.move(nodes["b"], Circle(Vector(5, 0), 1).bbox())
+        events = self._update_pairs(tree)
+        self.assertEqual(events[PAIR_BEGIN], {("c", "d")})
+        self.assertEqual(events[PAIR_END], {("a", "b")})
+        self.assertEqual(events[PAIR_PERSIST], set())
+
+        # Both members of a pair move, but still overlap
+        tree.move(nodes["c"], Circle(Vector(30, 0), 1).bbox())
+        tree.move(nodes["d"], Circle(Vector(31, 0), 1).bbox())
+        events = self._update_pairs(tree)
+        self.assertEqual(events[PAIR_PERSIST], {("c", "d")})
+        self.assertEqual(events[PAIR_BEGIN] | events[PAIR_END], set())
+
+        # Removal ends pairs even if the node is reused right away
+        tree.remove(nodes["d"])
+        obj = StabObj(Circle(Vector(5, 1), 1))
+        obj.name = "e"
+        self.assertEqual(tree.add(obj, obj.shape.bbox()), nodes["d"])
+        events = self._update_pairs(tree)
+        self.assertEqual(events[PAIR_END], {("c", "d")})
+        self.assertEqual(events[PAIR_BEGIN], {("b", "e")})
+        self.assertEqual(tree.pair_count, 1)
 
     @pytest.mark.xfail
     def test_insert_balanced(self):
@@ -0,0 +1,131 @@
+import random
+
+from engine.broad import LooseQuadtree
+from engine.geometry import AABB, Circle, Vector
+
+from .._testutil import ShapeTestCase, StabObj, check_shape_cast
+
+
+class TestLooseQuadtree(ShapeTestCase):
+
+    def _create(self, count=200):
+        rnd = random.Random(13)
+        tree = LooseQuadtree(half_size=64, max_depth=5)
+        objects = []
+        for _ in range(count):
+            c = Circle(Vector(rnd.uniform(-50, 50), rnd.uniform(-50, 50)),
+                       rnd.uniform(0.2, 6))
+            obj = StabObj(c)
+            objects.append((obj, tree.add(obj, c.bbox())))
+        # Some outside of the tree bounds
+        for x in (-100, 200):
+            c = Circle(Vector(x, 0), 1)
+            obj = StabObj(c)
+            objects.append((obj, tree.add(obj, c.bbox())))
+        return tree, objects
+
+    def test_placement(self):
+        tree = LooseQuadtree(half_size=64, max_depth=5, looseness=2)
+        # Node half sizes are 64, 32, 16, 8, 4 and 2. Object fits in a node
+        # if its half size is not bigger than the node's
+        cases = [
+            (Circle(Vector(1, 1), 0.5), (5, 16, 16)),
+            (Circle(Vector(1, 1), 5), (3, 4, 4)),
+            (Circle(Vector(-60, 60), 64), (0, 0, 0)),
+            (Circle(Vector(0, 0), 100), (0, 0, 0)),
+            (Circle(Vector(70, 0), 1), (0, 0, 0)),
+        ]
+        for shape, key in cases:
+            node_id = tree.add(StabObj(shape), shape.bbox())
+            self.assertEqual(tree._keys[node_id], key)
+            aabb = shape.bbox()
+            x1, y1, x2, y2 = tree._loose_bounds(key)
+            if key != (0, 0, 0):
+                self.assertTrue(AABB(Vector(x1, y1), Vector(x2, y2))
+                                .contains_aabb(aabb))
+
+        stats = tree.occupancy()
+        self.assertEqual(stats["objects"], 5)
+        self.assertEqual(stats["root"], 3)
+        self.assertEqual(stats["objects_per_depth"], [3, 0, 0, 1, 0, 1])
+        self.assertEqual(tree.get_height(), 6)
+
+    def test_move_remove(self):
+        tree = LooseQuadtree(half_size=64, max_depth=5)
+        c = Circle(Vector(1, 1), 0.5)
+        node_id = tree.add("a", c.bbox())
+        # Same cell
+        self.assertFalse(tree.move(node_id, c.translate(
+            Vector(0.5, 0.5)).bbox()))
+        # Next cell
+        self.assertTrue(tree.move(node_id, c.translate(
+            Vector(4, 0)).bbox()))
+        self.assertEqual(tree._keys[node_id], (5, 17, 16))
+        self.assertEqual(tree.query_point(Vector(5, 1)), ["a"])
+        self.assertEqual(tree.query_point(Vector(1, 1)), [])
+        tree.remove(node_id)
+        self.assertEqual(tree._buckets, {})
+        self.assertEqual(tree._counts, {})
+        self.assertEqual(tree.get_height(), 0)
+        with self.assertRaises(KeyError):
+            tree.remove(node_id)
+
+    def _raycast_cb(self, obj, point, direction, max_distance):
+        hit_dist = obj.shape.raycast(point, direction)
+        if hit_dist is not None and hit_dist < max_distance:
+            return hit_dist
+        return None
+
+    def test_queries(self):
+        tree, objects = self._create()
+        for query in [Circle(Vector(0, 0), 10), Circle(Vector(33, -12), 1),
+                      AABB(Vector(-150, -5), Vector(250, 5))]:
+            self.assertEqual(
+                set(map(id, tree.query(query))),
+                set(id(obj) for obj, _ in objects
+                    if obj.shape.bbox().overlaps(query.bbox())))
+
+        rnd = random.Random(3)
+        for _ in range(30):
+            point = Vector(rnd.uniform(-70, 70), rnd.uniform(-70, 70))
+            direction = Vector(
+                rnd.uniform(-1, 1), rnd.uniform(-1, 1)).unit()
+            hits = [obj.shape.raycast(point, direction)
+                    for obj, _ in objects]
+            hits = [d for d in hits if d is not None]
+            res = tree.raycast(point, direction, callback=self._raycast_cb)
+            if not hits:
+                self.assertIsNone(res)
+            else:
+                self.assertEqual(
+                    res.shape.raycast(point, direction), min(hits))
+
+        point = Vector(20, -30)
+
+        def aabb_distance(obj):
+            return obj.shape.bbox().distance(point)
+        r = list(tree.closest(point))
+        self.assertEqual(
+            [aabb_distance(obj) for obj in r],
+            sorted(aabb_distance(obj) for obj, _ in objects))
+        r = list(tree.closest(
+            point, k=5, distance=lambda obj, p: obj.shape.distance(p)))
+        self.assertEqual(
+            [max(obj.shape.distance(point), 0) for obj in r],
+            sorted(max(obj.shape.distance(point), 0)
+                   for obj, _ in objects)[:5])
+
+    def test_from_items(self):
+        items = [(i, Circle(Vector(i * 3, i % 7), 1).bbox())
+                 for i in range(50)]
+        tree = LooseQuadtree.from_items(items, max_depth=4)
+        self.assertEqual(tree.occupancy()["root"], 0)
+        for i, (obj, aabb) in enumerate(items):
+            self.assertEqual(tree.get_object(i), obj)
+        self.assertEqual(
+            sorted(tree.query(AABB(Vector(0, 0), Vector(10, 10)))),
+            [0, 1, 2, 3])
+
+    def test_shape_cast(self):
+        tree, objects = self._create()
+        check_shape_cast(self, tree, [obj for obj, _ in objects])
@@ -0,0 +1,150 @@
+import random
+
+from engine.broad import SpatialHashGrid
+from engine.geometry import AABB, Circle, Vector
+
+from .._testutil import ShapeTestCase, StabObj, check_shape_cast
+
+
+class TestSpatialHashGrid(ShapeTestCase):
+
+    def _create_grid(self, count=200, cell_size=4):
+        rnd = random.Random(7)
+        grid = SpatialHashGrid(cell_size=cell_size)
+        objects = []
+        for _ in range(count):
+            c = Circle(Vector(rnd.uniform(-50, 50), rnd.uniform(-50, 50)),
+                       rnd.uniform(0.5, 5))
+            obj = StabObj(c)
+            objects.append((obj, grid.add(obj, c.bbox())))
+        return grid, objects
+
+    def _brute_query(self, objects, aabb):
+        return set(id(obj) for obj, _ in objects
+                   if obj.shape.bbox().overlaps(aabb))
+
+    def test_query(self):
+        grid, objects = self._create_grid()
+        self.assertEqual(len(grid), 200)
+        for query in [Circle(Vector(0, 0), 10), Circle(Vector(33, -12), 1),
+                      AABB(Vector(-60, 40), Vector(60, 60)),
+                      Circle(Vector(100, 100), 1)]:
+            r = grid.query(query)
+            self.assertEqual(len(r), len(set(map(id, r))))
+            self.assertEqual(set(map(id, r)),
+                             self._brute_query(objects, query.bbox()))
+
+        point = Vector(10, 10)
+        self.assertEqual(
+            set(map(id, grid.query_point(point))),
+            self._brute_query(objects, AABB(point, point)))
+
+        # Callback stops the query
+        seen = []
+
+        def first_only(obj):
+            seen.append(obj)
+            return False
+        self.assertFalse(grid.query(
+            Circle(Vector(0, 0), 50), callback=first_only))
+        self.assertEqual(len(seen), 1)
+
+    def test_add_remove_move(self):
+        grid = SpatialHashGrid(cell_size=4)
+        c = Circle(Vector(1, 1), 0.5)
+        obj = StabObj(c)
+        node_id = grid.add(obj, c.bbox())
+        self.assertIs(grid.get_object(node_id), obj)
+        self.assertEqual(grid.get_height(), 1)
+
+        # Same cell
+        self.assertFalse(grid.move(node_id, Circle(Vector(2, 2), 0.5).bbox()))
+        self.assertEqual(grid.get_fat_aabb(node_id),
+                         AABB(Vector(1.5, 1.5), Vector(2.5, 2.5)))
+        # Across 4 cells
+        self.assertTrue(grid.move(node_id, Circle(Vector(4, 4), 1).bbox()))
+        self.assertEqual(len(grid._cells), 4)
+        for point in [Vector(3.5, 3.5), Vector(4.5, 3.5), Vector(4.5, 4.5)]:
+            self.assertEqual(grid.query_point(point), [obj])
+        self.assertEqual(grid.query_point(Vector(2, 2)), [])
+
+        grid.remove(node_id)
+        self.assertEqual(len(grid), 0)
+        self.assertEqual(grid._cells, {})
+        self.assertEqual(grid.get_height(), 0)
+        with self.assertRaises(KeyError):
+            grid.remove(node_id)
+        self.assertEqual(grid.add(obj, c.bbox()), node_id)
+
+    def _raycast_cb(self, obj, point, direction, max_distance):
+        hit_dist = obj.shape.raycast(point, direction)
+        if hit_dist is not None and hit_dist < max_distance:
+            return hit_dist
+        return None
+
+    def test_raycast(self):
+        grid, objects = self._create_grid()
+        rnd = random.Random(3)
+        for _ in range(50):
+            point = Vector(rnd.uniform(-70, 70), rnd.uniform(-70, 70))
+            direction = Vector(
+                rnd.uniform(-1, 1), rnd.uniform(-1, 1)).unit()
+            hits = [obj.shape.raycast(point, direction)
+                    for obj, _ in objects]
+            hits = [d for d in hits if d is not None]
+            res = grid.raycast(point, direction, callback=self._raycast_cb)
+            if not hits:
+                self.assertIsNone(res)
+            else:
+                self.assertEqual(
+                    res.shape.raycast(point, direction), min(hits))
+
+        # Axis aligned ray with a limit
+        grid = SpatialHashGrid(cell_size=1)
+        near = StabObj(Circle(Vector(5, 0.5), 1))
+        far = StabObj(Circle(Vector(20, 0.5), 1))
+        for obj in (far, near):
+            grid.add(obj, obj.shape.bbox())
+        res = grid.raycast(Vector(0, 0.5), Vector(1, 0),
+                           callback=self._raycast_cb)
+        self.assertIs(res, near)
+        res = grid.raycast(Vector(30, 0.5), Vector(-1, 0),
+                           callback=self._raycast_cb)
+        self.assertIs(res, far)
+        res = grid.raycast(Vector(0, 0.5), Vector(1, 0), max_distance=3,
+                           callback=self._raycast_cb)
+        self.assertIsNone(res)
+        self.assertIsNone(SpatialHashGrid().raycast(
+            Vector(0, 0), Vector(1, 0), callback=self._raycast_cb))
+
+    def test_closest(self):
+        grid, objects = self._create_grid()
+        point = Vector(7, -3)
+
+        def aabb_distance(obj):
+            return obj.shape.bbox().distance(point)
+        r = list(grid.closest(point))
+        self.assertEqual(len(r), 200)
+        self.assertEqual(
+            [aabb_distance(obj) for obj in r],
+            sorted(aabb_distance(obj) for obj, _ in objects))
+
+        r = list(grid.closest(
+            point, k=10, distance=lambda obj, p: obj.shape.distance(p)))
+        expected = sorted(
+            (obj for obj, _ in objects),
+            key=lambda obj: max(obj.shape.distance(point), 0))[:10]
+        self.assertEqual(
+            [max(obj.shape.distance(point), 0) for obj in r],
+            [max(obj.shape.distance(point), 0) for obj in expected])
+
+        r = list(grid.closest(point, max_distance=8))
+        self.assertEqual(
+            set(map(id, r)),
+            set(id(obj) for obj, _ in objects if aabb_distance(obj) <= 8))
+        self.assertEqual(list(grid.closest(point, k=0)), [])
+        self.assertEqual(list(SpatialHashGrid().closest(point)), [])
+
+    def test_shape_cast(self):
+        grid, objects = self._create_grid()
+        check_shape_cast(self, grid, [obj for obj, _ in objects])
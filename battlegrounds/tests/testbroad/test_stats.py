@@ -0,0 +1,133 @@
+from engine.broad import (
+    DynamicAABB, LooseQuadtree, SpatialHashGrid, SweepAndPrune)
+from engine.broad.stats import LatencyHistogram, LATENCY_BUCKETS
+from engine.geometry import AABB, Circle, Vector
+
+from .._testutil import ShapeTestCase, StabObj, toi_callback
+
+
+class TestBroadPhaseStats(ShapeTestCase):
+
+    def _raycast_cb(self, obj, point, direction, max_distance):
+        hit_dist = obj.shape.raycast(point, direction)
+        if hit_dist is not None and hit_dist < max_distance:
+            return hit_dist
+        return None
+
+    def test_counters(self):
+        circles = [Circle(Vector((i * 7) % 31, (i * 11) % 29), 1 + i % 2)
+                   for i in range(40)]
+        query = AABB(Vector(5, 5), Vector(15, 15))
+        # First is moved away and second removed below
+        expected = [c for c in circles[2:] if c.bbox().overlaps(query)]
+        for cls in (DynamicAABB, SpatialHashGrid, SweepAndPrune,
+                    LooseQuadtree):
+            broad = cls()
+            self.assertIsNone(broad.stats)
+            stats = broad.enable_stats()
+            self.assertIs(broad.stats, stats)
+            nodes = [broad.add(StabObj(c), c.bbox()) for c in circles]
+            broad.move(nodes[0], circles[0].bbox())
+            broad.move(nodes[0], circles[0].translate(Vector(50, 0)).bbox())
+            broad.remove(nodes[1])
+
+            self.assertEqual(len(broad.query(query)), len(expected))
+            out = [None]
+            broad.query(query, out=out)
+            broad.query(query, callback=lambda obj: False)
+            broad.query_point(Vector(10, 10))
+            broad.raycast(Vector(-5, 10), Vector(1, 0),
+                          callback=self._raycast_cb)
+            broad.shape_cast(Circle(Vector(-5, 10), 1), Vector(30, 0),
+                             callback=toi_callback)
+            self.assertEqual(len(list(broad.closest(Vector(10, 10), k=3))),
+                             3)
+
+            snapshot = stats.snapshot()
+            self.assertEqual(snapshot["inserts"], 40, cls)
+            self.assertEqual(snapshot["removes"], 1)
+            self.assertEqual(snapshot["moves"], 2)
+            self.assertEqual(snapshot["reinserts"], 1)
+            queries = snapshot["queries"]
+            self.assertEqual(queries["query"]["calls"], 3)
+            self.assertEqual(queries["query"]["results"],
+                             2 * len(expected) + 1)
+            self.assertEqual(queries["raycast"]["results"], 1)
+            self.assertEqual(queries["shape_cast"]["results"], 1)
+            self.assertEqual(queries["closest"]["results"], 3)
+            self.assertEqual(queries["raycast_many"]["calls"], 0)
+            for name in ("query", "query_point", "raycast", "shape_cast",
+                         "closest"):
+                query_stats = queries[name]
+                self.assertEqual(
+                    sum(query_stats["latency"]["counts"]),
+                    query_stats["calls"])
+                self.assertGreaterEqual(
+                    query_stats["nodes"], query_stats["leaves"], (cls, name))
+                self.assertGreaterEqual(
+                    query_stats["leaves"], query_stats["results"],
+                    (cls, name))
+            self.assertIn("quality", snapshot)
+
+            broad.reset_stats()
+            self.assertEqual(stats.queries["query"].calls, 0)
+            # Plain class methods are used again
+            broad.disable_stats()
+            self.assertIsNone(broad.stats)
+            self.assertNotIn("query", vars(broad))
+            broad.query(query)
+            self.assertEqual(stats.queries["query"].calls, 0)
+
+    def test_raycast_many(self):
+        tree = DynamicAABB()
+        for x in range(5):
+            c = Circle(Vector(x * 5, 0), 1)
+            tree.add(StabObj(c), c.bbox())
+        stats = tree.enable_stats()
+
+        def callback(ray, obj, point, direction, max_distance):
+            return self._raycast_cb(obj, point, direction, max_distance)
+        origins = [Vector(-5, y * 0.1) for y in range(-12, 12)]
+        res = tree.raycast_many(origins, Vector(1, 0), callback=callback)
+        query_stats = stats.queries["raycast_many"]
+        self.assertEqual(query_stats.calls, 1)
+        self.assertEqual(
+            query_stats.results, sum(obj is not None for obj in res))
+        self.assertGreater(query_stats.results, 0)
+        # Rays finished one by one still count as `raycast_many`
+        self.assertEqual(stats.queries["raycast"].calls, 0)
+        self.assertGreaterEqual(query_stats.leaves, query_stats.results)
+
+    def test_dynamic_aabb_quality(self):
+        tree = DynamicAABB()
+        self.assertEqual(tree.quality()["sah_cost"], 0)
+        tree.add("a", AABB(Vector(0, 0), Vector(1, 1)))
+        node_id = tree.add("b", AABB(Vector(3, 0), Vector(4, 1)))
+        self.assertEqual(tree.quality(), {
+            "leaves": 2, "nodes": 3, "height": 2,
+            # Root is 4x1, leaves 1x1
+            "sah_cost": 1.5, "area_ratio": 1.0})
+        # Freed nodes are not counted
+        tree.remove(node_id)
+        self.assertEqual(tree.quality(), {
+            "leaves": 1, "nodes": 1, "height": 1,
+            "sah_cost": 1.0, "area_ratio": 0.0})
+        tree.add("b", AABB(Vector(3, 0), Vector(4, 1)))
+
+        # Copies don't share stats
+        stats = tree.enable_stats()
+        copy = tree.copy()
+        self.assertIsNone(copy.stats)
+        copy.query(AABB(Vector(0, 0), Vector(1, 1)))
+        self.assertEqual(stats.queries["query"].calls, 0)
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for seconds in (0.5e-6, 3e-6, 10):
+            histogram.add(seconds)
+        self.assertEqual(histogram.counts[:3], [1, 0, 1])
+        self.assertEqual(histogram.counts[LATENCY_BUCKETS - 1], 1)
+        self.assertEqual(histogram.percentile(50), 4)
+        self.assertEqual(histogram.percentile(100), float("inf"))
+        self.assertEqual(histogram.max, 10)
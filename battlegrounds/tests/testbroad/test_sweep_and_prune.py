@@ -0,0 +1,172 @@
+import random
+
+from engine.broad import SweepAndPrune
+from engine.broad.abc import PAIR_BEGIN, PAIR_PERSIST, PAIR_END
+from engine.geometry import AABB, Circle, Vector
+
+from .._testutil import ShapeTestCase, StabObj, check_shape_cast
+
+
+class TestSweepAndPrune(ShapeTestCase):
+
+    def _create(self, count=150):
+        rnd = random.Random(11)
+        sap = SweepAndPrune()
+        objects = []
+        for _ in range(count):
+            c = Circle(Vector(rnd.uniform(-40, 40), rnd.uniform(-40, 40)),
+                       rnd.uniform(0.5, 3))
+            obj = StabObj(c)
+            objects.append([obj, sap.add(obj, c.bbox())])
+        return sap, objects
+
+    def _check(self, sap, objects):
+        # Endpoint lists are sorted and pairs match a brute force check
+        for axis in (0, 1):
+            values = list(sap._values[axis])
+            self.assertEqual(values, sorted(values))
+            self.assertEqual(len(values), 2 * len(objects))
+        boxes = [(obj.shape.bbox(), node_id) for obj, node_id in objects]
+        expected = set()
+        for i, (box_a, node_a) in enumerate(boxes):
+            for box_b, node_b in boxes[i + 1:]:
+                if box_a.overlaps(box_b):
+                    expected.add(frozenset([node_a, node_b]))
+        self.assertEqual(set(map(frozenset, sap._pairs)), expected)
+
+    def test_add_move_remove(self):
+        sap, objects = self._create()
+        self._check(sap, objects)
+
+        rnd = random.Random(5)
+        for _ in range(5):
+            for item in objects:
+                obj, node_id = item
+                c = obj.shape.translate(
+                    Vector(rnd.uniform(-1.5, 1.5), rnd.uniform(-1.5, 1.5)))
+                item[0] = obj = StabObj(c)
+                sap.move(node_id, c.bbox())
+            self._check(sap, objects)
+
+        for obj, node_id in objects[::2]:
+            sap.remove(node_id)
+        objects = objects[1::2]
+        self._check(sap, objects)
+        with self.assertRaises(KeyError):
+            sap.move(-1, AABB(Vector(0, 0), Vector(1, 1)))
+
+    def test_move_result(self):
+        sap = SweepAndPrune()
+        a = sap.add("a", AABB(Vector(0, 0), Vector(1, 1)))
+        sap.add("b", AABB(Vector(5, 0), Vector(6, 1)))
+        # No endpoints passed
+        self.assertFalse(sap.move(a, AABB(Vector(1, 0), Vector(2, 1))))
+        self.assertEqual(sap.pair_count, 0)
+        # Touching boxes overlap
+        self.assertTrue(sap.move(a, AABB(Vector(4, 0), Vector(5, 1))))
+        self.assertEqual(sap.pair_count, 1)
+        self.assertTrue(sap.move(a, AABB(Vector(7, 0), Vector(8, 1))))
+        self.assertEqual(sap.pair_count, 0)
+
+    def test_update_pairs(self):
+        sap = SweepAndPrune()
+        nodes = {}
+        for name, x in [("a", 0), ("b", 1.5), ("c", 10)]:
+            nodes[name] = sap.add(name, Circle(Vector(x, 0), 1).bbox())
+
+        def update():
+            events = {PAIR_BEGIN: set(), PAIR_PERSIST: set(), PAIR_END: set()}
+
+            def callback(event, obj_a, obj_b):
+                events[event].add(tuple(sorted([obj_a, obj_b])))
+            sap.update_pairs(callback)
+            return events
+
+        events = update()
+        self.assertEqual(events[PAIR_BEGIN], {("a", "b")})
+        events = update()
+        self.assertEqual(events[PAIR_PERSIST], {("a", "b")})
+
+        sap.move(nodes["c"], Circle(Vector(2, 1), 1).bbox())
+        sap.move(nodes["a"], Circle(Vector(-5, 0), 1).bbox())
+        events = update()
+        self.assertEqual(events[PAIR_BEGIN], {("b", "c")})
+        self.assertEqual(events[PAIR_END], {("a", "b")})
+        self.assertEqual(events[PAIR_PERSIST], set())
+
+        # Removed and reused node id
+        sap.remove(nodes["c"])
+        self.assertEqual(sap.add("d", Circle(Vector(-5, 1), 1).bbox()),
+                         nodes["c"])
+        events = update()
+        self.assertEqual(events[PAIR_END], {("b", "c")})
+        self.assertEqual(events[PAIR_BEGIN], {("a", "d")})
+
+        # Reported pair separates by a move before its node is removed and
+        # the id is reused
+        sap = SweepAndPrune()
+        sap.add("a", Circle(Vector(0, 0), 1).bbox())
+        b = sap.add("b", Circle(Vector(0.5, 0), 1).bbox())
+        events = update()
+        self.assertEqual(events[PAIR_BEGIN], {("a", "b")})
+        sap.move(b, Circle(Vector(10, 0), 1).bbox())
+        sap.remove(b)
+        self.assertEqual(sap.add("c", Circle(Vector(0.5, 0), 1).bbox()), b)
+        events = update()
+        self.assertEqual(events[PAIR_END], {("a", "b")})
+        self.assertEqual(events[PAIR_BEGIN], {("a", "c")})
+        self.assertEqual(events[PAIR_PERSIST], set())
+
+    def _raycast_cb(self, obj, point, direction, max_distance):
+        hit_dist = obj.shape.raycast(point, direction)
+        if hit_dist is not None and hit_dist < max_distance:
+            return hit_dist
+        return None
+
+    def test_queries(self):
+        sap, objects = self._create()
+        for query in [Circle(Vector(0, 0), 10), Circle(Vector(33, -12), 1),
+                      AABB(Vector(-60, 30), Vector(60, 60))]:
+            self.assertEqual(
+                set(map(id, sap.query(query))),
+                set(id(obj) for obj, _ in objects
+                    if obj.shape.bbox().overlaps(query.bbox())))
+        point = Vector(3, 3)
+        self.assertEqual(
+            set(map(id, sap.query_point(point))),
+            set(id(obj) for obj, _ in objects
+                if obj.shape.bbox().contains(point)))
+
+        rnd = random.Random(3)
+        for _ in range(30):
+            point = Vector(rnd.uniform(-60, 60), rnd.uniform(-60, 60))
+            direction = Vector(
+                rnd.uniform(-1, 1), rnd.uniform(-1, 1)).unit()
+            hits = [obj.shape.raycast(point, direction)
+                    for obj, _ in objects]
+            hits = [d for d in hits if d is not None]
+            res = sap.raycast(point, direction, callback=self._raycast_cb)
+            if not hits:
+                self.assertIsNone(res)
+            else:
+                self.assertEqual(
+                    res.shape.raycast(point, direction), min(hits))
+
+        point = Vector(-7, 12)
+
+        def aabb_distance(obj):
+            return obj.shape.bbox().distance(point)
+        r = list(sap.closest(point))
+        self.assertEqual(
+            [aabb_distance(obj) for obj in r],
+            sorted(aabb_distance(obj) for obj, _ in objects))
+        r = list(sap.closest(point, k=3, max_distance=5))
+        self.assertEqual(
+            [aabb_distance(obj) for obj in r],
+            [d for d in sorted(aabb_distance(obj) for obj, _ in objects)
+             if d <= 5][:3])
+        self.assertEqual(list(SweepAndPrune().closest(point)), [])
+
+    def test_shape_cast(self):
+        sap, objects = self._create()
+        check_shape_cast(self, sap, [obj for obj, _ in objects])
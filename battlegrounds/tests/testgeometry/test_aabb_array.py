@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+
+from engine.geometry import AABB, AABBArray, Vector, VectorArray
+
+
+class TestAABBArray(unittest.TestCase):
+
+    def _boxes(self):
+        return [
+            AABB(Vector(0, 0), Vector(2, 2)),
+            AABB(Vector(-3, -1), Vector(-1, 4)),
+            AABB(Vector(1.5, 1), Vector(6, 2.5)),
+        ]
+
+    def test_roundtrip(self):
+        boxes = self._boxes()
+        array = AABBArray.from_aabbs(boxes)
+        self.assertEqual(len(array), 3)
+        self.assertEqual(array.to_aabbs(), boxes)
+        self.assertEqual(list(array), boxes)
+        self.assertEqual(array[2], boxes[2])
+        self.assertEqual(array[1:].to_aabbs(), boxes[1:])
+        self.assertEqual(AABBArray.from_aabbs([]).to_aabbs(), [])
+        self.assertEqual(array.min.to_vectors(), [b.min for b in boxes])
+        self.assertEqual(array.max.to_vectors(), [b.max for b in boxes])
+        self.assertEqual(array.center.to_vectors(), [b.center for b in boxes])
+        self.assertEqual(
+            array.extents.to_vectors(), [b.extents for b in boxes])
+
+        array = AABBArray.from_min_max(
+            VectorArray([[0, 0], [1, 1]]), [[1, 2], [3, 3]])
+        self.assertEqual(array.to_aabbs(), [
+            AABB(Vector(0, 0), Vector(1, 2)),
+            AABB(Vector(1, 1), Vector(3, 3))])
+
+    def test_area(self):
+        boxes = self._boxes()
+        array = AABBArray.from_aabbs(boxes)
+        np.testing.assert_array_equal(array.area(), [b.area() for b in boxes])
+
+    def test_intersects(self):
+        boxes = self._boxes()
+        array = AABBArray.from_aabbs(boxes)
+        queries = [
+            AABB(Vector(2, 2), Vector(3, 3)),  # Touches 1st box
+            AABB(Vector(-10, -10), Vector(-5, -5)),
+            AABB(Vector(-2, 0), Vector(1.5, 1)),
+        ]
+        for query in queries:
+            expected = [b.intersects(query) is not None for b in boxes]
+            self.assertEqual(array.intersects(query).tolist(), expected)
+
+        matrix = array.intersects_many(AABBArray.from_aabbs(queries))
+        self.assertEqual(matrix.shape, (3, 3))
+        for i, box in enumerate(boxes):
+            for j, query in enumerate(queries):
+                self.assertEqual(
+                    matrix[i, j], box.intersects(query) is not None)
+
+        # Pairwise
+        mask = array.intersects(AABBArray.from_aabbs(queries))
+        self.assertEqual(mask.tolist(), [True, False, True])
+
+    def test_union(self):
+        boxes = self._boxes()
+        array = AABBArray.from_aabbs(boxes)
+        other = AABB(Vector(1, -2), Vector(3, 0))
+        self.assertEqual(
+            array.union(other).to_aabbs(), [b.union(other) for b in boxes])
+        np.testing.assert_array_equal(
+            array.union_area(other), [b.union(other).area() for b in boxes])
+        reversed_array = AABBArray.from_aabbs(boxes[::-1])
+        self.assertEqual(
+            array.union(reversed_array).to_aabbs(),
+            [a.union(b) for a, b in zip(boxes, boxes[::-1])])
+        self.assertEqual(
+            array.bounds(), AABB(Vector(-3, -1), Vector(6, 4)))
+        self.assertIsNone(AABBArray.from_aabbs([]).bounds())
+
+    def test_contains(self):
+        array = AABBArray.from_aabbs(self._boxes())
+        self.assertEqual(
+            array.contains(Vector(2, 2)).tolist(), [True, False, True])
+        self.assertEqual(
+            array.contains(Vector(-1, 4)).tolist(), [False, True, False])
+        self.assertEqual(
+            array.contains_aabb(AABB(Vector(1.5, 1.5), Vector(2, 2))).tolist(),
+            [True, False, True])
+
+    def test_translate_inflate(self):
+        boxes = self._boxes()
+        array = AABBArray.from_aabbs(boxes)
+        dv = Vector(1, -2)
+        self.assertEqual(
+            array.translate(dv).to_aabbs(), [b.translate(dv) for b in boxes])
+        offsets = VectorArray([[1, 0], [0, 1], [-1, -1]])
+        self.assertEqual(
+            array.translate(offsets).to_aabbs(),
+            [b.translate(o) for b, o in zip(boxes, offsets)])
+        self.assertEqual(
+            array.inflate(0.5).to_aabbs(), [b.inflate(0.5) for b in boxes])
+        self.assertEqual(
+            array.inflate(1, 2).to_aabbs(), [b.inflate(1, 2) for b in boxes])
@@ -0,0 +1,48 @@
+import unittest
+
+from engine.contact import ContactCache
+from engine.geometry import AABB, Circle, Vector
+
+
+class TestContactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.circle = Circle(Vector(0, 0), 1)
+        self.wall = AABB(Vector(0, -5), Vector(2, 5))
+
+    def test_reuse_below_threshold(self):
+        cache = ContactCache(threshold=0.1)
+        key = ("prop", "actor")
+        first = cache.collide(key, self.circle, Vector(-0.5, 0), self.wall)
+        self.assertAlmostEqual(first.depth, 0.5)
+        self.assertEqual(first.normal, Vector(-1, 0))
+        # Moved only a bit - same manifold
+        again = cache.collide(key, self.circle, Vector(-0.45, 0.05), self.wall)
+        self.assertIs(again, first)
+        # Moved further - recomputed
+        moved = cache.collide(key, self.circle, Vector(-0.3, 0), self.wall)
+        self.assertIsNot(moved, first)
+        self.assertAlmostEqual(moved.depth, 0.7)
+        self.assertIs(cache.get(key).manifold, moved)
+
+    def test_no_contact_is_cached(self):
+        cache = ContactCache()
+        key = ("prop", "actor")
+        self.assertIsNone(
+            cache.collide(key, self.circle, Vector(-3, 0), self.wall))
+        self.assertIn(key, cache)
+        self.assertIsNone(cache.get(key).manifold)
+
+    def test_step_drops_stale(self):
+        cache = ContactCache(max_age=1)
+        cache.collide(1, self.circle, Vector(-0.5, 0), self.wall)
+        cache.collide(2, self.circle, Vector(-0.5, 0), self.wall)
+        cache.step()
+        self.assertEqual(len(cache), 2)
+        cache.collide(1, self.circle, Vector(-0.5, 0), self.wall)
+        cache.step()
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        cache.step()
+        cache.step()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,94 @@
+import unittest
+
+from engine.geometry import (
+    AABB, Circle, Polygon, SweptCircle, SweptPolygon, Triangle, Vector)
+from engine.geometry.shapes.dispatch import (
+    IntersectionDispatcher, dispatcher)
+from engine.geometry.shapes.intersection import CircleManifold
+
+
+class Point(object):
+
+    def __init__(self, p):
+        self.p = p
+
+
+def intersect_point_circle(point, circle):
+    if not circle.contains(point.p):
+        return None
+    return CircleManifold(depth=0, normal=Vector(1, 0), points=[point.p])
+
+
+class TestDispatch(unittest.TestCase):
+
+    shapes = [
+        AABB(Vector(0, 0), Vector(2, 2)),
+        Circle(Vector(1, 1), 1),
+        Triangle([Vector(0, 0), Vector(2, 0), Vector(1, 2)]),
+        Polygon([Vector(0, 0), Vector(2, 0), Vector(3, 1), Vector(1, 2)]),
+        SweptCircle(Circle(Vector(0, 0), 1), Vector(2, 0)),
+        SweptPolygon(Triangle([Vector(0, 0), Vector(2, 0), Vector(1, 2)]),
+                     Vector(1, 1)),
+    ]
+
+    def test_all_pairs(self):
+        for a in self.shapes:
+            for b in self.shapes:
+                self.assertIsNotNone(dispatcher(a, b), (a, b))
+                self.assertIsNotNone(a.intersects(b), (a, b))
+        far = Circle(Vector(10, 10), 1)
+        for a in self.shapes:
+            self.assertIsNone(a.intersects(far))
+            self.assertIsNone(far.intersects(a))
+        with self.assertRaises(ValueError):
+            self.shapes[0].intersects(Vector(0, 0))
+
+    def test_register(self):
+        d = IntersectionDispatcher()
+        d.register(Point, Circle, intersect_point_circle)
+        circle = Circle(Vector(0, 0), 1)
+        m = d(Point(Vector(0.5, 0)), circle)
+        self.assertEqual(m.normal, Vector(1, 0))
+        # Reversed pair is added automatically with inverted normal
+        m = d(circle, Point(Vector(0.5, 0)))
+        self.assertEqual(m.normal, Vector(-1, 0))
+        self.assertIsNone(d(circle, Point(Vector(2, 0))))
+
+        # Subclasses use functions of the base class
+        class BigPoint(Point):
+            pass
+        self.assertIsNotNone(d(BigPoint(Vector(0, 0)), circle))
+        self.assertIs(d.lookup(BigPoint, Circle), d.lookup(Point, Circle))
+
+        # Explicit function for the reversed pair is not overridden
+        def intersect_circle_point(circle, point):
+            return "own"
+        d.register(Circle, Point, intersect_circle_point)
+        d.register(Point, Circle, intersect_point_circle)
+        self.assertEqual(d(circle, Point(Vector(0, 0))), "own")
+
+        with self.assertRaises(ValueError):
+            d(circle, circle)
+
+    def test_stats(self):
+        d = IntersectionDispatcher()
+        d.register(Point, Circle, intersect_point_circle)
+        self.assertIsNone(d.stats)
+        circle = Circle(Vector(0, 0), 1)
+        d.enable_stats()
+        for x in (0, 0.5, 2):
+            d(Point(Vector(x, 0)), circle)
+        d(circle, Point(Vector(0, 0)))
+        stats = d.stats[Point, Circle]
+        self.assertEqual((stats.calls, stats.hits), (3, 2))
+        self.assertGreater(stats.time, 0)
+        self.assertEqual(d.stats[Circle, Point].calls, 1)
+
+        d.reset_stats()
+        self.assertEqual(d.stats[Point, Circle].calls, 0)
+        d(circle, Point(Vector(0, 0)))
+        self.assertEqual(d.stats[Circle, Point].calls, 1)
+
+        d.disable_stats()
+        self.assertIsNone(d.stats)
+        self.assertIs(d.lookup(Point, Circle), intersect_point_circle)
@@ -0,0 +1,131 @@
+import math
+import random
+import unittest
+
+from engine.geometry import AABB, Circle, Polygon, Triangle, Vector
+from engine.geometry.shapes.gjk import (
+    SimplexCache, gjk_distance, gjk_overlap, gjk_penetration)
+from engine.geometry.utils import seg_distance
+
+from .test_sat import brute_force_sat, random_convex
+
+
+def polygon_distance(a_points, b_points):
+    """ Brute force distance between 2 separated convex polygons """
+    best = float("inf")
+    for points, others in ((a_points, b_points), (b_points, a_points)):
+        prev = points[-1]
+        for point in points:
+            for other in others:
+                best = min(best, seg_distance(prev, point, other))
+            prev = point
+    return best
+
+
+def polygon_penetration(a_points, b_points):
+    """ Brute force SAT minimum overlap over all edge normals """
+    best = float("inf")
+    for points in (a_points, b_points):
+        prev = points[-1]
+        for point in points:
+            n = (point - prev).rotate_deg(-90).unit()
+            pa = [n.dot(p) for p in a_points]
+            pb = [n.dot(p) for p in b_points]
+            overlap = min(max(pa) - min(pb), max(pb) - min(pa))
+            best = min(best, overlap)
+            prev = point
+    return best
+
+
+class TestGJK(unittest.TestCase):
+
+    def _random_pairs(self, seed, count=60):
+        rnd = random.Random(seed)
+        for _ in range(count):
+            a = random_convex(rnd, rnd.randint(3, 20), 3, Vector(0, 0))
+            b = random_convex(
+                rnd, rnd.randint(3, 20), rnd.uniform(0.5, 4),
+                Vector(rnd.uniform(-8, 8), rnd.uniform(-8, 8)))
+            yield a, b
+
+    def test_overlap_matches_sat(self):
+        for a, b in self._random_pairs(1, 150):
+            self.assertEqual(
+                gjk_overlap(a, b), brute_force_sat(a.points, b.points))
+
+    def test_distance(self):
+        for a, b in self._random_pairs(2):
+            out = gjk_distance(a, b)
+            if brute_force_sat(a.points, b.points):
+                self.assertEqual(out.distance, 0)
+                continue
+            expected = polygon_distance(a.points, b.points)
+            self.assertAlmostEqual(out.distance, expected, places=6)
+            self.assertAlmostEqual(
+                out.point_a.distance(out.point_b), expected, places=6)
+            self.assertLess(a.distance(out.point_a), 1e-6)
+            self.assertLess(b.distance(out.point_b), 1e-6)
+
+    def test_penetration(self):
+        for a, b in self._random_pairs(3):
+            pen = gjk_penetration(a, b)
+            if not brute_force_sat(a.points, b.points):
+                self.assertIsNone(pen)
+                continue
+            expected = polygon_penetration(a.points, b.points)
+            self.assertAlmostEqual(pen.depth, expected, places=6)
+            self.assertAlmostEqual(pen.normal.length(), 1)
+            # Moving `a` along normal by depth separates the shapes
+            moved = a.translate(pen.normal * (pen.depth + 1e-4))
+            self.assertFalse(gjk_overlap(moved, b))
+
+    def test_circles(self):
+        c = Circle(Vector(0, 0), 1)
+        out = gjk_distance(c, Circle(Vector(3, 4), 2))
+        self.assertAlmostEqual(out.distance, 2)
+        self.assertEqual(out.point_a, Vector(0.6, 0.8))
+        self.assertEqual(out.point_b, Vector(1.8, 2.4))
+
+        pen = gjk_penetration(c, Circle(Vector(0, 1.5), 1))
+        self.assertAlmostEqual(pen.depth, 0.5)
+        self.assertEqual(pen.normal, Vector(0, -1))
+
+        poly = Polygon([Vector(8, 5), Vector(5, 7), Vector(2, 6),
+                        Vector(2, 5), Vector(3, 2), Vector(5, 1),
+                        Vector(7, 1), Vector(9, 3)])
+        for p in [Vector(12, 3), Vector(-1, 5), Vector(11, 9)]:
+            out = gjk_distance(Circle(p, 1), poly)
+            self.assertAlmostEqual(out.distance, poly.distance(p) - 1)
+        # Circle center inside polygon, closest to (3, 2)-(5, 1) edge
+        pen = gjk_penetration(Circle(Vector(5, 1.5), 1), poly)
+        self.assertAlmostEqual(pen.depth, 1 + 1 / math.sqrt(5))
+        self.assertAlmostEqual(pen.normal.x, Vector(-1, -2).unit().x)
+        self.assertAlmostEqual(pen.normal.y, Vector(-1, -2).unit().y)
+
+    def test_aabb_and_triangles(self):
+        box = AABB(Vector(-2, -2), Vector(2, 2))
+        t = Triangle([Vector(2, 3), Vector(3, 2), Vector(3, 3)])
+        self.assertFalse(gjk_overlap(box, t))
+        self.assertAlmostEqual(gjk_distance(box, t).distance, math.sqrt(0.5))
+        t2 = Triangle([Vector(3, 0), Vector(3, 3), Vector(0, 3)])
+        self.assertTrue(gjk_overlap(box, t2))
+        pen = gjk_penetration(box, t2)
+        self.assertAlmostEqual(pen.depth, math.sqrt(0.5))
+        # Triangle vs triangle is now supported by `intersects`
+        self.assertFalse(t.intersects(t2.translate(Vector(5, 5))))
+        self.assertTrue(t.intersects(t2))
+
+    def test_warm_start(self):
+        rnd = random.Random(5)
+        a = random_convex(rnd, 30, 3, Vector(0, 0))
+        b = random_convex(rnd, 30, 3, Vector(0, 0))
+        cache = SimplexCache()
+        cold = warm = 0
+        for i in range(50):
+            moved = b.translate(Vector.polar_deg(i * 2, 10 - i * 0.1))
+            out = gjk_distance(a, moved, simplex_cache=cache)
+            expected = gjk_distance(a, moved)
+            self.assertAlmostEqual(out.distance, expected.distance)
+            warm += out.iterations
+            cold += expected.iterations
+        self.assertLess(warm, cold)
@@ -0,0 +1,152 @@
+import random
+import unittest
+
+from engine.geometry import AABB, Circle, Polygon, Triangle, Vector
+from engine.geometry.shapes.intersection import (
+    intersect_aabb_aabb,
+    intersect_aabb_polygon,
+    intersect_polygon_polygon,
+)
+
+from .test_sat import brute_force_sat, random_convex
+
+
+def box(x1, y1, x2, y2):
+    return Polygon([
+        Vector(x1, y1), Vector(x2, y1), Vector(x2, y2), Vector(x1, y2)])
+
+
+class TestManifold(unittest.TestCase):
+
+    def assertPoints(self, points, expected):
+        self.assertEqual(sorted(points, key=lambda p: (p.x, p.y)),
+                         sorted(expected, key=lambda p: (p.x, p.y)))
+
+    def test_aabb_aabb(self):
+        b = AABB(Vector(-1, 0), Vector(3, 2))
+        # Resting on top, sunk a bit
+        m = intersect_aabb_aabb(AABB(Vector(0, 1.75), Vector(2, 3.75)), b)
+        self.assertEqual(m.depth, 0.25)
+        self.assertEqual(m.normal, Vector(0, 1))
+        self.assertPoints(m.points, [Vector(0, 2), Vector(2, 2)])
+        # Deep inside on the left side - pushed out left, not by the width
+        m = intersect_aabb_aabb(AABB(Vector(-0.5, 0.5), Vector(0, 1)), b)
+        self.assertEqual(m.depth, 1)
+        self.assertEqual(m.normal, Vector(-1, 0))
+        self.assertPoints(m.points, [Vector(-1, 0.5), Vector(-1, 1)])
+        # Corner touch gives a single point
+        m = intersect_aabb_aabb(AABB(Vector(3, 2), Vector(4, 4)), b)
+        self.assertEqual(m.depth, 0)
+        self.assertEqual(len(m.points), 1)
+        self.assertIsNone(
+            intersect_aabb_aabb(AABB(Vector(3.5, 0), Vector(4, 1)), b))
+
+    def test_polygon_polygon_face(self):
+        ground = box(-5, -1, 5, 0)
+        # Box, that sunk into the ground by 0.25. Both faces separate equally,
+        # so the first shape's face is the reference one and contact points
+        # lie on the ground's surface.
+        m = intersect_polygon_polygon(box(0, -0.25, 1, 0.75), ground)
+        self.assertAlmostEqual(m.depth, 0.25)
+        self.assertEqual(m.normal, Vector(0, 1))
+        self.assertPoints(m.points, [Vector(0, 0), Vector(1, 0)])
+        # Reversed pair gives the reversed normal
+        m = intersect_polygon_polygon(ground, box(0, -0.25, 1, 0.75))
+        self.assertAlmostEqual(m.depth, 0.25)
+        self.assertEqual(m.normal, Vector(0, -1))
+        self.assertEqual(len(m.points), 2)
+
+        # Box hanging over the edge gets clipped by the side plane
+        m = intersect_polygon_polygon(box(4, -0.25, 6, 0.75), ground)
+        self.assertEqual(m.normal, Vector(0, 1))
+        self.assertPoints(m.points, [Vector(4, 0), Vector(5, 0)])
+
+    def test_aabb_triangle(self):
+        aabb = AABB(Vector(0, 0), Vector(4, 2))
+        # Triangle's tip pokes the top face
+        t = Triangle([Vector(1, 3), Vector(2, 1.5), Vector(3, 3)])
+        m = aabb.intersects(t)
+        self.assertAlmostEqual(m.depth, 0.5)
+        self.assertEqual(m.normal, Vector(0, -1))
+        self.assertPoints(m.points, [Vector(2, 1.5)])
+        m = t.intersects(aabb)
+        self.assertEqual(m.normal, Vector(0, 1))
+        self.assertAlmostEqual(m.depth, 0.5)
+
+    def test_symmetric_normals(self):
+        shapes = [
+            AABB(Vector(0, 0), Vector(2, 2)),
+            Circle(Vector(2.5, 1), 1),
+            Triangle([Vector(1, 1), Vector(3, 0), Vector(3, 3)]),
+            box(1.5, -1, 4, 1.5),
+        ]
+        for a in shapes:
+            for b in shapes:
+                if a is b:
+                    continue
+                m1, m2 = a.intersects(b), b.intersects(a)
+                self.assertIsNotNone(m1, (a, b))
+                self.assertAlmostEqual(m1.depth, m2.depth)
+                self.assertAlmostEqual(
+                    m1.normal.dot(m2.normal), -1, msg=(a, b))
+
+    def test_random_resolution(self):
+        rnd = random.Random(8)
+        for _ in range(300):
+            a = random_convex(rnd, rnd.randint(3, 12), 3, Vector(0, 0))
+            b = random_convex(
+                rnd, rnd.randint(3, 12), rnd.uniform(1, 4),
+                Vector(rnd.uniform(-6, 6), rnd.uniform(-6, 6)))
+            m = intersect_polygon_polygon(a, b)
+            self.assertEqual(
+                m is not None, brute_force_sat(a.points, b.points))
+            if m is None:
+                continue
+            self.assertTrue(1 <= len(m.points) <= 2)
+            # Moving `a` along the normal by depth resolves the collision
+            moved = a.translate(m.normal * (m.depth + 1e-6))
+            self.assertFalse(brute_force_sat(moved.points, b.points))
+            # But any less does not
+            if m.depth > 1e-3:
+                moved = a.translate(m.normal * (m.depth - 1e-4))
+                self.assertTrue(brute_force_sat(moved.points, b.points))
+            # Contact points lie on one shape and within depth of the other
+            for p in m.points:
+                da, db = a.distance(p), b.distance(p)
+                self.assertLessEqual(min(da, db), 1e-6)
+                self.assertLessEqual(max(da, db), m.depth + 1e-6)
+
+        aabb = AABB(Vector(-1, -1), Vector(1, 1))
+        for _ in range(100):
+            b = random_convex(
+                rnd, rnd.randint(3, 8), rnd.uniform(0.5, 2),
+                Vector(rnd.uniform(-3, 3), rnd.uniform(-3, 3)))
+            m = intersect_aabb_polygon(aabb, b)
+            if m is None:
+                continue
+            moved = box(-1, -1, 1, 1).translate(m.normal * (m.depth + 1e-6))
+            self.assertFalse(brute_force_sat(moved.points, b.points))
+
+    def test_incident_edge_clipped_away(self):
+        # Incident edge ends up outside of the reference face's side planes,
+        # the deepest incident vertex is the contact
+        a = Polygon([Vector(*p) for p in [
+            (0.07, 1.73), (-1.71, 0.28), (-1.28, -1.16), (0.42, -1.68),
+            (0.44, -1.67), (0.68, -1.59)]])
+        b = Polygon([Vector(*p) for p in [
+            (1.14, -0.84), (0.42, -1.5), (0.26, -2.02), (0.39, -2.78),
+            (2.04, -3.58), (2.63, -3.29)]])
+        self.assertTrue(brute_force_sat(a.points, b.points))
+        for first, second in ((a, b), (b, a)):
+            m = intersect_polygon_polygon(first, second)
+            self.assertIsNotNone(m)
+            self.assertPoints(m.points, [Vector(0.68, -1.59)])
+            moved = first.translate(m.normal * (m.depth + 1e-6))
+            self.assertFalse(brute_force_sat(moved.points, second.points))
+
+    def test_translate(self):
+        m = intersect_polygon_polygon(box(0, -0.25, 1, 1), box(-5, -1, 5, 0))
+        moved = m.translate(Vector(10, 1))
+        self.assertPoints(moved.points, [Vector(10, 1), Vector(11, 1)])
+        self.assertEqual(moved.normal, m.normal)
+        self.assertEqual(moved.depth, m.depth)
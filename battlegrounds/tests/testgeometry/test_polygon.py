@@ -1,6 +1,8 @@
 import unittest
+from unittest import mock
 
-from engine.geometry import AABB, Triangle, Vector, classify_polygon
+from engine.geometry import (
+    AABB, Polygon, Triangle, Vector, classify_polygon)
 
 
 class TestPolygon(unittest.TestCase):
@@ -31,3 +33,50 @@ class TestPolygon(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             classify_polygon([
                 Vector(1, 1), Vector(0, 0), Vector(0, 1), Vector(1, 0)])
+
+    def test_prepared_data(self):
+        points = [[0, 5], [-1, 4], [-2, 1], [-2, 0], [-1, -3], [0, -5]]
+        poly = Polygon([Vector(*p) for p in points])
+        for normal, unit in zip(poly.normals, poly.unit_normals):
+            self.assertAlmostEqual(unit.length(), 1)
+            self.assertAlmostEqual(normal.unit().dot(unit), 1)
+        for nx, ny, lo, hi in poly._sat_axes:
+            proj = [nx * p.x + ny * p.y for p in poly.points]
+            self.assertEqual((lo, hi), (min(proj), max(proj)))
+        square = Polygon([Vector(0, 0), Vector(2, 0), Vector(3, 1),
+                          Vector(2, 2), Vector(0, 2)])
+        self.assertAlmostEqual(square.centroid.x, 19 / 15)
+        self.assertAlmostEqual(square.centroid.y, 1)
+        t = Triangle([Vector(0, 0), Vector(3, 0), Vector(0, 3)])
+        self.assertEqual(t.centroid, Vector(1, 1))
+
+    def test_translate_keeps_prepared(self):
+        t = Triangle([Vector(0, 0), Vector(3, 0), Vector(0, 3)])
+        poly = Polygon([Vector(0, 0), Vector(2, 0), Vector(3, 1),
+                        Vector(2, 2), Vector(0, 2)])
+        dv = Vector(1.5, -4)
+        for shape in (t, poly):
+            # Populate caches
+            shape._sat_axes, shape.centroid, shape._bounding_radius
+            moved = shape.translate(dv)
+            fresh = shape.__class__([p + dv for p in shape.points])
+            self.assertEqual(moved.points, fresh.points)
+            self.assertEqual(moved.centroid, fresh.centroid)
+            self.assertEqual(moved._bounding_radius, fresh._bounding_radius)
+            for axis, expected in zip(moved._sat_axes, fresh._sat_axes):
+                for value, expected_value in zip(axis, expected):
+                    self.assertAlmostEqual(value, expected_value)
+
+    def test_prepared_data_is_cached(self):
+        descriptor = Polygon._sat_axes
+        with mock.patch.object(
+                descriptor, "fn", mock.Mock(wraps=descriptor.fn)) as fn:
+            poly = Polygon([Vector(0, 0), Vector(2, 0), Vector(3, 1),
+                            Vector(2, 2), Vector(0, 2)])
+            axes = poly._sat_axes
+            self.assertIs(poly._sat_axes, axes)
+            self.assertEqual(fn.call_count, 1)
+            # Translated copy inherits the axes instead of computing them
+            moved = poly.translate(Vector(1, 1))
+            moved._sat_axes
+            self.assertEqual(fn.call_count, 1)
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from engine.geometry import (
+    AABB, Circle, Polygon, Triangle, Vector, VectorArray)
+
+
+class TestQueriesMany(unittest.TestCase):
+
+    _shapes = [
+        Circle(Vector(5, 3), 2),
+        AABB(Vector(2, 2), Vector(6, 4)),
+        Triangle([Vector(2, 2), Vector(4, 2), Vector(4, 4)]),
+        Polygon([Vector(8, 5), Vector(5, 7), Vector(2, 6), Vector(2, 5),
+                 Vector(3, 2), Vector(5, 1), Vector(7, 1), Vector(9, 3)]),
+    ]
+
+    def _grid(self):
+        # Includes vertices, points on edges, inside and outside
+        xs, ys = np.meshgrid(np.arange(-1, 11, 0.5), np.arange(-1, 9, 0.5))
+        return VectorArray.from_xy(xs.ravel(), ys.ravel())
+
+    def test_contains_many(self):
+        points = self._grid()
+        for shape in self._shapes:
+            mask = shape.contains_many(points)
+            expected = [shape.contains(p) for p in points]
+            self.assertEqual(mask.tolist(), expected, shape)
+
+    def test_distance_many(self):
+        points = self._grid()
+        for shape in self._shapes:
+            dist = shape.distance_many(points)
+            for d, p in zip(dist.tolist(), points):
+                self.assertAlmostEqual(d, shape.distance(p), msg=(shape, p))
+
+    def test_closest_point_many(self):
+        points = self._grid()
+        for shape in self._shapes:
+            closest = shape.closest_point_many(points)
+            self.assertEqual(len(closest), len(points))
+            for c, p in zip(closest, points):
+                expected = shape.closest_point(p)
+                self.assertAlmostEqual(c.x, expected.x, msg=(shape, p))
+                self.assertAlmostEqual(c.y, expected.y, msg=(shape, p))
+
+    def test_ndarray_input(self):
+        triangle = self._shapes[2]
+        mask = triangle.contains_many(np.array([[3.5, 3], [2, 1]]))
+        self.assertEqual(mask.tolist(), [True, False])
+        dist = triangle.distance_many([[3.5, 3], [-2, -1], [3, 0]])
+        self.assertEqual(dist.tolist(), [-1, 5, 2])
+
+    def test_circle_contains(self):
+        c = Circle(Vector(0, 0), 3)
+        self.assertTrue(c.contains(Vector(0, 2.9)))
+        self.assertFalse(c.contains(Vector(0, 3.1)))
+        self.assertEqual(c.closest_point(Vector(0, 6)), Vector(0, 3))
+        self.assertEqual(c.closest_point(Vector(1, 1)), Vector(1, 1))
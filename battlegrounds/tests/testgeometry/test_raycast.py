@@ -0,0 +1,80 @@
+import math
+import unittest
+
+import numpy as np
+
+from engine.geometry import (
+    AABB, Circle, Polygon, Triangle, Vector, VectorArray)
+
+
+class TestRaycastMany(unittest.TestCase):
+
+    _points = [[0, 5], [-1, 4], [-2, 1], [-2, 0], [-1, -3], [0, -5]]
+    _shapes = {
+        "circle": Circle(Vector(0, 0), radius=2),
+        "polygon": Polygon([Vector(*p) for p in _points]).translate(
+            Vector(0.5, 0)),
+        "triangle": Triangle([Vector(-2, 2), Vector(0, -2), Vector(4, 4)]),
+        "aabb": AABB(Vector(-3.5, -2.5), Vector(1, 4)),
+    }
+
+    def _assert_same_as_scalar(self, shape, origins, directions,
+                               max_distance=None):
+        result = shape.raycast_many(origins, directions, max_distance)
+        directions = list(directions)
+        if isinstance(origins, Vector):
+            origins = [origins] * len(directions)
+        self.assertEqual(len(result), len(directions))
+        for i, (p, d) in enumerate(zip(origins, directions)):
+            t = shape.raycast(p, d)
+            if t is not None and max_distance is not None and \
+                    t > max_distance:
+                t = None
+            if t is None:
+                self.assertTrue(math.isnan(result[i]), (shape, p, d))
+            else:
+                self.assertAlmostEqual(result[i], t, msg=(shape, p, d))
+        return result
+
+    def test_sweep_from_outside(self):
+        # Same sweep as `manual_tests/raycast.py`
+        directions = VectorArray.polar_deg(np.arange(0, 360, 5))
+        origins = directions * -10
+        for shape in self._shapes.values():
+            result = self._assert_same_as_scalar(shape, origins, directions)
+            # All those rays point at the origin, which is inside the shapes
+            self.assertFalse(np.any(np.isnan(result)), shape)
+
+    def test_misses(self):
+        directions = VectorArray.polar_deg(np.arange(0, 360, 15))
+        for shape in self._shapes.values():
+            # From far away, most rays miss
+            self._assert_same_as_scalar(shape, Vector(20, 30), directions)
+            # Limited max distance
+            self._assert_same_as_scalar(
+                shape, directions * -10, directions, max_distance=8.5)
+
+    def test_axis_parallel(self):
+        directions = VectorArray([[1, 0], [0, 1], [-1, 0], [0, -1]])
+        for shape in self._shapes.values():
+            for origin in [Vector(-10, 0.5), Vector(-10, 20),
+                           Vector(0.5, -10), Vector(20, 3)]:
+                self._assert_same_as_scalar(shape, origin, directions)
+
+    def test_inside(self):
+        d = VectorArray([[1, 0], [0, 1]])
+        # Circle and AABB report 0 for rays cast from inside
+        np.testing.assert_array_equal(
+            self._shapes['circle'].raycast_many(Vector(0, 0), d), [0, 0])
+        np.testing.assert_array_equal(
+            self._shapes['aabb'].raycast_many(Vector(0, 0), d), [0, 0])
+        # Polygons consider those rays a miss
+        self.assertTrue(np.all(np.isnan(
+            self._shapes['polygon'].raycast_many(Vector(0, 0), d))))
+
+    def test_aabb_parallel_outside(self):
+        aabb = self._shapes['aabb']
+        # Moving along X while above the box never hits it
+        self.assertIsNone(aabb.raycast(Vector(-10, 10), Vector(1, 0)))
+        self.assertIsNone(aabb.raycast(Vector(10, 0), Vector(0, 1)))
+        self.assertEqual(aabb.raycast(Vector(-10, 0), Vector(1, 0)), 6.5)
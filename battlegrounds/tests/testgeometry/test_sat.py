@@ -0,0 +1,98 @@
+import math
+import random
+import unittest
+
+from engine.geometry import AABB, Polygon, Vector
+from engine.geometry.shapes.intersection import (
+    SeparatingAxisCache,
+    intersect_aabb_polygon,
+    intersect_polygon_polygon,
+)
+
+
+def random_convex(rnd, n, radius, center):
+    angles = sorted(rnd.uniform(0, 2 * math.pi) for _ in range(n))
+    points = [center + Vector.polar(a, radius) for a in angles]
+    # Drop duplicates after rounding, which may happen for close angles
+    unique = []
+    for p in points:
+        if p not in unique:
+            unique.append(p)
+    return Polygon(unique)
+
+
+def brute_force_sat(a_points, b_points):
+    for points in (a_points, b_points):
+        prev = points[-1]
+        for point in points:
+            normal = (point - prev).rotate_deg(90)
+            pa = [normal.dot(p) for p in a_points]
+            pb = [normal.dot(p) for p in b_points]
+            if max(pa) < min(pb) or max(pb) < min(pa):
+                return False
+            prev = point
+    return True
+
+
+class TestSupportSAT(unittest.TestCase):
+
+    def test_support(self):
+        rnd = random.Random(1)
+        for _ in range(20):
+            poly = random_convex(rnd, 50, 10, Vector(3, -2))
+            for angle in range(0, 360, 7):
+                d = Vector.polar_deg(angle + 0.5)
+                best = max(p.dot(d) for p in poly.points)
+                self.assertAlmostEqual(poly.support(d).dot(d), best)
+
+        square = AABB(Vector(0, 0), Vector(2, 1))
+        self.assertEqual(square.support(Vector(1, 1)), Vector(2, 1))
+        self.assertEqual(square.support(Vector(-1, 0.5)), Vector(0, 1))
+
+    def test_polygon_polygon_big(self):
+        rnd = random.Random(2)
+        for _ in range(100):
+            a = random_convex(rnd, rnd.randint(3, 40), 5, Vector(0, 0))
+            b = random_convex(
+                rnd, rnd.randint(3, 40), rnd.uniform(1, 6),
+                Vector(rnd.uniform(-12, 12), rnd.uniform(-12, 12)))
+            expected = brute_force_sat(a.points, b.points)
+            self.assertEqual(
+                intersect_polygon_polygon(a, b) is not None, expected)
+            self.assertEqual(
+                intersect_polygon_polygon(b, a) is not None, expected)
+
+    def test_aabb_polygon_big(self):
+        rnd = random.Random(3)
+        for _ in range(100):
+            poly = random_convex(rnd, rnd.randint(3, 40), 5, Vector(0, 0))
+            x, y = rnd.uniform(-10, 10), rnd.uniform(-10, 10)
+            aabb = AABB(Vector(x, y), Vector(x + rnd.uniform(0.1, 4),
+                                             y + rnd.uniform(0.1, 4)))
+            corners = [aabb.min, Vector(aabb.max.x, aabb.min.y), aabb.max,
+                       Vector(aabb.min.x, aabb.max.y)]
+            expected = brute_force_sat(corners, poly.points)
+            self.assertEqual(
+                intersect_aabb_polygon(aabb, poly) is not None, expected)
+
+    def test_separating_axis_cache(self):
+        rnd = random.Random(4)
+        a = random_convex(rnd, 40, 5, Vector(0, 0))
+        b = random_convex(rnd, 40, 5, Vector(0, 0))
+        cache = SeparatingAxisCache()
+        # Move `b` closer each tick. The cached axis stays valid while
+        # shapes are separated, and is reset on overlap.
+        for x in range(20, 0, -1):
+            moved = b.translate(Vector(x, 0.5))
+            expected = brute_force_sat(a.points, moved.points)
+            result = intersect_polygon_polygon(a, moved, cache=cache)
+            self.assertEqual(result is not None, expected)
+            if expected:
+                self.assertIsNone(cache.axis)
+            elif cache.axis is not None:
+                owner, index = cache.axis
+                axis = (a, moved)[owner]._sat_axes[index]
+                nx, ny, lo, hi = axis
+                other = (moved, a)[owner]
+                o_min, o_max = other._extent(nx, ny)
+                self.assertTrue(o_max < lo or o_min > hi)
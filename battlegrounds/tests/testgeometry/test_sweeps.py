@@ -0,0 +1,147 @@
+import math
+import random
+import unittest
+
+from engine.geometry import (
+    AABB, Circle, Polygon, SweptCircle, SweptPolygon, Triangle, Vector)
+from engine.geometry.shapes.gjk import gjk_distance
+from engine.geometry.shapes.sweeps import TOI_TOLERANCE, time_of_impact
+
+from .test_sat import brute_force_sat, random_convex
+
+
+def brute_force_toi(a, movement, b, steps=200):
+    """ First fraction of `movement`, where polygons overlap. Sampled and
+        then refined by bisection.
+    """
+    def overlap(t):
+        return brute_force_sat(a.translate(movement * t).points, b.points)
+
+    for i in range(steps + 1):
+        if overlap(i / steps):
+            break
+    else:
+        return None
+    if i == 0:
+        return 0
+    lo, hi = (i - 1) / steps, i / steps
+    for _ in range(40):
+        mid = (lo + hi) / 2
+        if overlap(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+class TestSweptShapes(unittest.TestCase):
+
+    def test_swept_circle(self):
+        capsule = SweptCircle(Circle(Vector(0, 0), 1), Vector(10, 0))
+        self.assertEqual(capsule.end, Vector(10, 0))
+        self.assertEqual(capsule.bbox(), AABB(Vector(-1, -1), Vector(11, 1)))
+        self.assertTrue(capsule.contains(Vector(5, 0.9)))
+        self.assertFalse(capsule.contains(Vector(5, 1.1)))
+        self.assertFalse(capsule.contains(Vector(-0.9, 0.9)))
+        self.assertAlmostEqual(capsule.distance(Vector(5, 3)), 2)
+        self.assertEqual(capsule.distance(Vector(5, 0)), -1)
+        self.assertEqual(capsule.closest_point(Vector(12, 0)), Vector(11, 0))
+
+        # A thin wall between start and end is missed by both end positions,
+        # but not by the swept shape
+        wall = AABB(Vector(4, -5), Vector(4.5, 5))
+        self.assertIsNone(Circle(Vector(0, 0), 1).intersects(wall))
+        self.assertIsNone(Circle(Vector(10, 0), 1).intersects(wall))
+        manifold = capsule.intersects(wall)
+        self.assertIsNotNone(manifold)
+        self.assertIsNone(capsule.translate(Vector(0, 7)).intersects(wall))
+
+    def test_swept_polygon(self):
+        box = AABB(Vector(0, 0), Vector(1, 1))
+        swept = SweptPolygon(box, Vector(2, 2))
+        self.assertEqual(len(swept.points), 6)
+        self.assertEqual(swept.bbox(), AABB(Vector(0, 0), Vector(3, 3)))
+        self.assertTrue(swept.contains(Vector(1.5, 1.5)))
+        self.assertFalse(swept.contains(Vector(2.5, 0.5)))
+
+        t = Triangle([Vector(0, 0), Vector(2, 0), Vector(1, 1)])
+        swept = SweptPolygon(t, Vector(0, 3))
+        self.assertEqual(len(swept.points), 5)
+        self.assertIsNotNone(
+            swept.intersects(Circle(Vector(1, 2.5), 0.2)))
+        # No movement - same polygon
+        self.assertEqual(
+            set(SweptPolygon(t, Vector(0, 0)).points), set(t.points))
+
+
+class TestTimeOfImpact(unittest.TestCase):
+
+    def test_circle_time_of_impact(self):
+        circle = Circle(Vector(10, 0), 2)
+        # Movement is not a unit vector
+        self.assertAlmostEqual(
+            circle.time_of_impact(Vector(0, 0), Vector(16, 0)), 0.5)
+        self.assertIsNone(circle.time_of_impact(Vector(0, 0), Vector(0, 5)))
+        self.assertEqual(circle.time_of_impact(Vector(10, 1), Vector(0, 0)),
+                         0)
+
+    def test_closed_form_pairs(self):
+        a = Circle(Vector(0, 0), 1)
+        b = Circle(Vector(10, 0), 2)
+        self.assertAlmostEqual(time_of_impact(a, Vector(14, 0), b), 0.5)
+        # Both moving towards each other
+        self.assertAlmostEqual(
+            time_of_impact(a, Vector(7, 0), b, Vector(-7, 0)), 0.5)
+        self.assertIsNone(time_of_impact(a, Vector(5, 0), b))
+        self.assertIsNone(time_of_impact(a, Vector(0, 14), b))
+
+        box = AABB(Vector(-1, -1), Vector(1, 1))
+        wall = AABB(Vector(5, -10), Vector(6, 10))
+        self.assertAlmostEqual(time_of_impact(box, Vector(8, 0), wall), 0.5)
+        self.assertAlmostEqual(time_of_impact(wall, Vector(-8, 0), box), 0.5)
+        self.assertEqual(time_of_impact(box, Vector(8, 0), box), 0)
+
+        # Circle hitting the box face and the box corner
+        self.assertAlmostEqual(time_of_impact(a, Vector(8, 0), wall), 0.5)
+        t = time_of_impact(a, Vector(10, 0), AABB(
+            Vector(5, 0.5), Vector(6, 10)))
+        expected = (5 - math.sqrt(1 - 0.5 ** 2)) / 10
+        self.assertAlmostEqual(t, expected)
+        self.assertIsNone(time_of_impact(
+            a, Vector(10, 0), AABB(Vector(5, 1.1), Vector(6, 10))))
+        self.assertAlmostEqual(
+            time_of_impact(wall, Vector(-8, 0), a), 0.5)
+
+    def test_conservative_advancement(self):
+        rnd = random.Random(9)
+        hits = 0
+        for _ in range(40):
+            a = random_convex(rnd, rnd.randint(3, 8), 1, Vector(0, 0))
+            b = random_convex(
+                rnd, rnd.randint(3, 8), rnd.uniform(0.5, 2),
+                Vector(rnd.uniform(4, 8), rnd.uniform(-3, 3)))
+            movement = Vector(rnd.uniform(5, 10), rnd.uniform(-3, 3))
+            t = time_of_impact(a, movement, b)
+            expected = brute_force_toi(a, movement, b)
+            if expected is None:
+                self.assertIsNone(t)
+                continue
+            hits += 1
+            self.assertIsNotNone(t)
+            # Never past the contact, but not far before it
+            self.assertLessEqual(t, expected + 1e-9)
+            gap = gjk_distance(a.translate(movement * t), b).distance
+            self.assertLessEqual(gap, TOI_TOLERANCE)
+        self.assertGreater(hits, 10)
+
+    def test_conservative_mixed_shapes(self):
+        circle = Circle(Vector(0, 0), 1)
+        t = Triangle([Vector(5, -1), Vector(7, -1), Vector(6, 3)])
+        toi = time_of_impact(circle, Vector(10, 0), t)
+        # Circle touches the left edge of the triangle
+        moved = circle.translate(Vector(10 * toi, 0))
+        self.assertAlmostEqual(t.distance(moved.center), 1, places=3)
+        self.assertEqual(time_of_impact(
+            Polygon([Vector(5, 0), Vector(6, 0), Vector(6, 1)]),
+            Vector(1, 0), t), 0)
+        self.assertIsNone(time_of_impact(circle, Vector(-10, 0), t))
@@ -0,0 +1,96 @@
+import math
+import unittest
+
+import numpy as np
+
+from engine.geometry import Vector, VectorArray
+
+
+class TestVectorArray(unittest.TestCase):
+
+    def test_vectors_roundtrip(self):
+        vectors = [Vector(0.7071067811865475, -3), Vector(1e-9, 2.5),
+                   Vector(-123456.125, 0)]
+        array = VectorArray.from_vectors(vectors)
+        self.assertEqual(len(array), 3)
+        self.assertEqual(array.to_vectors(), vectors)
+        self.assertEqual(list(array), vectors)
+        self.assertEqual(array[1], vectors[1])
+        self.assertEqual(array[1:].to_vectors(), vectors[1:])
+
+        empty = VectorArray.from_vectors([])
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.to_vectors(), [])
+
+    def test_bad_shape(self):
+        with self.assertRaises(ValueError):
+            VectorArray([1, 2, 3])
+        with self.assertRaises(ValueError):
+            VectorArray([[1, 2, 3]])
+
+    def test_add_sub(self):
+        u = VectorArray([[2, 1], [0, 0]])
+        v = VectorArray([[0, 1], [1, 1]])
+        self.assertEqual((u + v).to_vectors(), [Vector(2, 2), Vector(1, 1)])
+        self.assertEqual((u - v).to_vectors(), [Vector(2, 0), Vector(-1, -1)])
+        # Broadcasting a single Vector
+        self.assertEqual((u + Vector(1, 2)).to_vectors(),
+                         [Vector(3, 3), Vector(1, 2)])
+        self.assertEqual((Vector(1, 2) - u).to_vectors(),
+                         [Vector(-1, 1), Vector(1, 2)])
+
+        with self.assertRaises(TypeError):
+            u + 1
+
+    def test_mul(self):
+        u = VectorArray([[2, 5], [1, 3]])
+        self.assertEqual((u * 2).to_vectors(), [Vector(4, 10), Vector(2, 6)])
+        self.assertEqual((3 * u).to_vectors(), [Vector(6, 15), Vector(3, 9)])
+        scale = np.array([2.0, -1.0])
+        self.assertEqual((u * scale).to_vectors(),
+                         [Vector(4, 10), Vector(-1, -3)])
+        self.assertEqual((scale * u).to_vectors(),
+                         [Vector(4, 10), Vector(-1, -3)])
+        for scalar in (np.int64(2), np.float32(2), np.arange(3)[2]):
+            self.assertEqual((u * scalar).to_vectors(),
+                             [Vector(4, 10), Vector(2, 6)])
+            self.assertEqual((scalar * u).to_vectors(),
+                             [Vector(4, 10), Vector(2, 6)])
+
+    def test_length_dot_distance(self):
+        u = VectorArray([[3, 4], [0, 2.5]])
+        np.testing.assert_array_equal(u.length(), [5, 2.5])
+        np.testing.assert_array_equal(u.length2(), [25, 6.25])
+        np.testing.assert_array_equal(u.dot(Vector(2, 1)), [10, 2.5])
+        np.testing.assert_array_equal(
+            u.dot(VectorArray([[1, 0], [0, 2]])), [3, 5])
+        np.testing.assert_array_equal(u.distance(Vector(0, 4)), [3, 1.5])
+        np.testing.assert_array_equal(u.distance2(Vector(0, 4)), [9, 2.25])
+        np.testing.assert_array_equal(u.cross(Vector(1, 0)), [-4, -2.5])
+
+    def test_unit(self):
+        u = VectorArray([[0, 2], [0, 1], [1, 1], [0, 0]])
+        self.assertEqual(u.unit().to_vectors(), [
+            Vector(0, 1), Vector(0, 1), Vector.polar_deg(45), Vector(0, 0)])
+
+    def test_rotate_deg(self):
+        vectors = [Vector(1, 0), Vector(2, 3), Vector(-1, 5)]
+        u = VectorArray.from_vectors(vectors)
+        for angle in (90, 180, 270, 30, -45):
+            self.assertEqual(
+                u.rotate_deg(angle).to_vectors(),
+                [v.rotate_deg(angle) for v in vectors])
+        # Per vector angles
+        self.assertEqual(
+            u.rotate_deg(np.array([90, 180, 0])).to_vectors(),
+            [Vector(0, 1), Vector(-2, -3), Vector(-1, 5)])
+
+    def test_polar(self):
+        angles = [0, 30, 90, 135, 270]
+        u = VectorArray.polar_deg(angles, 2)
+        self.assertEqual(
+            u.to_vectors(), [Vector.polar_deg(a, 2) for a in angles])
+        u = VectorArray.polar([0, math.pi / 3])
+        self.assertEqual(
+            u.to_vectors(), [Vector.polar(0), Vector.polar(math.pi / 3)])
+        np.testing.assert_allclose(u.angle, [0, math.pi / 3])